@@ -0,0 +1,200 @@
+"""
+Content-addressed attachment storage with duplicate detection.
+
+Attachments used to be saved as {save_path}/{filename}, so two messages with an
+'invoice.pdf' overwrote each other, and a document re-attached along a reply
+chain was written, rasterized and handed to the document tools again. Here
+every attachment is stored under its SHA-256 as {save_path}/{digest[:16]}/{filename},
+and an SQLite index in save_path maps each digest to the files it produced (the
+rendered pages for a PDF). A duplicate reuses those files without running
+pdftoppm, and since every copy resolves to the same paths, it collapses within
+an email and hits the OCR result cache (keyed by file digest) across emails.
+
+With ATTACHMENT_PHASH_DISTANCE set, images and rendered pages also get a
+1024-bit difference hash, and one within that many bits of an indexed image is
+replaced by it, which catches re-scanned or recompressed copies. It is off by
+default: a perceptual hash cannot tell apart two filled-in copies of the same
+form, so enable it only for mailboxes where that is acceptable.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+INDEX_FILE = "attachment_index.sqlite"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif", ".webp")
+
+# Hamming distance (out of PHASH_BITS) under which two images are the same document; unset disables.
+_distance = os.getenv("ATTACHMENT_PHASH_DISTANCE")
+PHASH_DISTANCE = int(_distance) if _distance else None
+PHASH_SIZE = 32
+PHASH_BITS = PHASH_SIZE * PHASH_SIZE
+# Near-duplicate candidates are found by exact match on any one band, which finds
+# every hash within PHASH_BANDS - 1 bits; larger distances may miss some.
+PHASH_BANDS = 16
+
+
+def safe_filename(filename):
+    """The attachment's file name without any directory part, so it cannot escape its folder."""
+    name = os.path.basename((filename or '').replace('\\', '/')).strip()
+    return name if name not in ('', '.', '..') else 'attachment'
+
+
+def perceptual_hash(path):
+    """
+    Difference hash of an image: PHASH_SIZE rows of PHASH_SIZE bits, each set when
+    a grayscale pixel is brighter than its right neighbour. Returns an int.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        gray = image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.BOX)
+    pixels = gray.tobytes()
+    width = PHASH_SIZE + 1
+    value = 0
+    for y in range(PHASH_SIZE):
+        row = pixels[y * width:(y + 1) * width]
+        for x in range(PHASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def _bands(value):
+    band_bits = PHASH_BITS // PHASH_BANDS
+    mask = (1 << band_bits) - 1
+    return [(band, format((value >> (band * band_bits)) & mask, 'x')) for band in range(PHASH_BANDS)]
+
+
+class AttachmentStore:
+    """
+    Content-addressed attachment files under root, with their index.
+    Safe to share between threads.
+    """
+
+    def __init__(self, root, phash_distance=PHASH_DISTANCE):
+        self.root = root
+        self.phash_distance = phash_distance
+        self.stored = 0
+        self.duplicates = 0
+        self.near_duplicates = 0
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, INDEX_FILE), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS attachments ("
+            " digest TEXT PRIMARY KEY, filename TEXT NOT NULL, outputs TEXT NOT NULL,"
+            " created REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, phash TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_bands ("
+            " band INTEGER NOT NULL, value TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (band, value, path))"
+        )
+
+    def path_for(self, digest, filename):
+        return os.path.join(self.root, digest[:16], safe_filename(filename))
+
+    def lookup(self, digest):
+        """The output files of a stored attachment, or None if unknown or no longer on disk."""
+        with self._lock:
+            row = self._conn.execute("SELECT outputs FROM attachments WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        outputs = row[0].split('\n')
+        return outputs if all(os.path.exists(path) for path in outputs) else None
+
+    def add(self, tmp_path, digest, filename, render):
+        """
+        Stores the decoded attachment at tmp_path (consumed either way).
+        render(path) returns the files the stored attachment contributes to
+        attachment_paths. Returns (outputs, duplicate): for a known digest the
+        outputs of the stored copy, with duplicate True.
+        """
+        outputs = self.lookup(digest)
+        if outputs is not None:
+            os.remove(tmp_path)
+            with self._lock:
+                self._conn.execute("UPDATE attachments SET hits = hits + 1 WHERE digest = ?", (digest,))
+                self.duplicates += 1
+            return outputs, True
+
+        target = self.path_for(digest, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        outputs = render(target)
+        if self.phash_distance is not None:
+            outputs = [self._near_duplicate(path) for path in outputs]
+        with self._lock:
+            self.stored += 1
+            # A failed render is not indexed, so the next copy tries again
+            if outputs:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO attachments (digest, filename, outputs, created) VALUES (?, ?, ?, ?)",
+                    (digest, safe_filename(filename), '\n'.join(outputs), time.time()),
+                )
+        return outputs, False
+
+    def _near_duplicate(self, path):
+        """The indexed image within phash_distance of path, or path itself (then indexed)."""
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            return path
+        try:
+            value = perceptual_hash(path)
+        except Exception as e:
+            print(f"Error hashing image '{path}': {e}")
+            return path
+        bands = _bands(value)
+        with self._lock:
+            candidates = set()
+            for band, band_value in bands:
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT path FROM image_bands WHERE band = ? AND value = ?", (band, band_value)
+                ))
+            best, best_distance = None, None
+            for candidate in candidates:
+                row = self._conn.execute("SELECT phash FROM images WHERE path = ?", (candidate,)).fetchone()
+                distance = bin(int(row[0], 16) ^ value).count('1')
+                if distance <= self.phash_distance and (best is None or distance < best_distance):
+                    best, best_distance = candidate, distance
+            if best is not None and best != path and os.path.exists(best):
+                self.near_duplicates += 1
+                return best
+            self._conn.execute("INSERT OR REPLACE INTO images (path, phash) VALUES (?, ?)", (path, format(value, 'x')))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO image_bands (band, value, path) VALUES (?, ?, ?)",
+                [(band, band_value, path) for band, band_value in bands],
+            )
+        return path
+
+    def stats(self):
+        with self._lock:
+            files, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM attachments"
+            ).fetchone()
+            return {
+                "attachments": files,
+                "duplicate_hits": hits,
+                "stored": self.stored,
+                "duplicates": self.duplicates,
+                "near_duplicates": self.near_duplicates,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_attachment_store(save_path):
+    """Returns the shared AttachmentStore for save_path."""
+    root = os.path.abspath(save_path)
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = AttachmentStore(root)
+        return store
@@ -0,0 +1,155 @@
+"""
+Memory-bounded attachment writing.
+
+Gmail returns attachment bodies as a base64url "data" field inside a JSON
+response. Instead of decoding the whole payload into a second full copy, the
+helpers here decode it in fixed-size chunks straight into a temporary file,
+hashing the bytes on the way, and can pull the "data" field out of a streamed
+HTTP response so the JSON body is never held in memory at all.
+"""
+import base64
+import hashlib
+import os
+import uuid
+
+DECODE_CHUNK_CHARS = 1024 * 1024  # multiple of 4, so chunks decode independently
+STREAM_CHUNK_BYTES = 256 * 1024
+
+_DATA_KEY = b'"data"'
+
+
+class Base64FileDecoder:
+    """Decodes base64url text fed in arbitrary pieces into a binary file object."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._pending = ''
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def _write(self, text):
+        data = base64.urlsafe_b64decode(text)
+        self.digest.update(data)
+        self.size += len(data)
+        self._fileobj.write(data)
+
+    def feed(self, text):
+        text = self._pending + text
+        cut = len(text) - len(text) % 4
+        if cut:
+            self._write(text[:cut])
+        self._pending = text[cut:]
+
+    def close(self):
+        """Flushes the tail, restoring padding Gmail sometimes omits. Returns the hex digest."""
+        if self._pending.rstrip('='):
+            self._write(self._pending + '=' * (-len(self._pending) % 4))
+        self._pending = ''
+        return self.digest.hexdigest()
+
+
+def iter_string_chunks(text, chunk_chars=DECODE_CHUNK_CHARS):
+    for start in range(0, len(text), chunk_chars):
+        yield text[start:start + chunk_chars]
+
+
+def iter_json_data_field(byte_chunks):
+    """
+    Yields the value of the top-level "data" string field of a JSON body given
+    as an iterable of byte chunks, without buffering the body. base64url values
+    contain no quotes or escapes, so the first quote after the opening one ends
+    the field, and the key itself cannot appear inside another value.
+    """
+    buffer = b''
+    phase = 'key'
+    for chunk in byte_chunks:
+        buffer += chunk
+        if phase == 'key':
+            index = buffer.find(_DATA_KEY)
+            if index == -1:
+                buffer = buffer[-(len(_DATA_KEY) - 1):]
+                continue
+            buffer = buffer[index + len(_DATA_KEY):]
+            phase = 'value'
+        if phase == 'value':
+            buffer = buffer.lstrip(b' \t\r\n:')
+            if not buffer:
+                continue
+            if buffer[:1] != b'"':
+                raise ValueError("Attachment 'data' field is not a string")
+            buffer = buffer[1:]
+            phase = 'string'
+        if phase == 'string':
+            end = buffer.find(b'"')
+            if end == -1:
+                yield buffer.decode('ascii')
+                buffer = b''
+                continue
+            yield buffer[:end].decode('ascii')
+            return
+    raise ValueError("Attachment response ended before the 'data' field was complete")
+
+
+def _file_matches(path, size, hexdigest):
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        return False
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest() == hexdigest
+
+
+def decode_base64_to_temp(chunks, directory):
+    """
+    Decodes base64url text chunks into a new hidden temporary file in directory.
+    Returns (tmp_path, hexdigest, size); the caller moves the file into place or
+    removes it.
+    """
+    tmp_path = os.path.join(directory, f".attachment.{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, 'wb') as f:
+            decoder = Base64FileDecoder(f)
+            for chunk in chunks:
+                decoder.feed(chunk)
+            hexdigest = decoder.close()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, hexdigest, decoder.size
+
+
+def write_base64_chunks(chunks, target_path):
+    """
+    Decodes base64url text chunks into target_path through a temporary file.
+    If target_path already holds the same bytes it is left untouched.
+    Returns (hexdigest, written) where written is False when the write was skipped.
+    """
+    tmp_path, hexdigest, size = decode_base64_to_temp(chunks, os.path.dirname(os.path.abspath(target_path)))
+    try:
+        if _file_matches(target_path, size, hexdigest):
+            return hexdigest, False
+        os.replace(tmp_path, target_path)
+        return hexdigest, True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def stream_data_field(session, uri, chunk_bytes=STREAM_CHUNK_BYTES, timeout=60):
+    """
+    GETs an attachments.get URI with a streaming authorized requests session.
+    Returns an iterator over the base64 "data" field, or None when the response
+    is not a 200 (the caller then falls back to the regular client with retries).
+    """
+    response = session.get(uri, stream=True, timeout=timeout)
+    if response.status_code != 200:
+        response.close()
+        return None
+
+    def chunks():
+        with response:
+            yield from iter_json_data_field(response.iter_content(chunk_bytes))
+
+    return chunks()
@@ -0,0 +1,96 @@
+"""
+Cold-start time of the processing modules.
+
+Each case runs in a fresh interpreter, as a short-lived worker or CLI
+invocation would: importing tools, importing definitions, and the first
+definitions.get_app() call, which builds the shared model client, the agents and
+the compiled graph. Also lists the slowest top-level imports of definitions
+(from python -X importtime) and whether the heavy optional modules were loaded.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("import tools", "import tools"),
+    ("import definitions", "import definitions"),
+    ("definitions.get_app()", "import definitions; definitions.get_app()"),
+]
+HEAVY_MODULES = ["langchain_openai", "openai", "langgraph_supervisor", "langgraph.prebuilt", "IPython"]
+
+
+def scratch_env(scratch):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    env["CHECKPOINT_DB"] = os.path.join(scratch, "checkpoints.sqlite")
+    env["TOOL_CACHE_PATH"] = os.path.join(scratch, "tool_cache.sqlite")
+    env["RESPONSE_CACHE_PATH"] = os.path.join(scratch, "response_cache.sqlite")
+    return env
+
+
+def time_statement(statement, env):
+    """Seconds spent running statement in a fresh interpreter."""
+    code = f"import time\nstart = time.perf_counter()\n{statement}\nprint(time.perf_counter() - start)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top=8):
+    """(cumulative microseconds, module) of the slowest direct imports of definitions."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import definitions"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # definitions' own imports are indented by exactly two spaces
+        if match and len(match.group(2)) == 3:
+            rows.append((int(match.group(1)), match.group(3)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def loaded_modules(env):
+    code = f"import sys, definitions\nprint(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_import_")
+    try:
+        env = scratch_env(scratch)
+        # Warm the bytecode cache so every run measures imports, not compilation
+        time_statement("import definitions", env)
+        print(f"cold start, {args.repeat} fresh interpreters per case")
+        for label, statement in CASES:
+            times = [time_statement(statement, env) for _ in range(args.repeat)]
+            print(f"  {label:<24} median {statistics.median(times) * 1000:8.1f} ms   min {min(times) * 1000:8.1f} ms")
+        print("slowest imports of definitions (cumulative)")
+        for micros, module in slowest_imports(env):
+            print(f"  {module:<32} {micros / 1000:8.1f} ms")
+        heavy = loaded_modules(env)
+        print(f"heavy modules loaded by 'import definitions': {', '.join(heavy) or 'none'}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
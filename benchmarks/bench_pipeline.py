@@ -0,0 +1,303 @@
+"""
+End-to-end throughput of the email pipeline, fully offline.
+
+A FakeGmailService serves synthetic messages (document requests with PNG and PDF
+attachments, text-extraction updates and acknowledgments). Each one is fetched,
+run through utils.parse_email_content and then through the compiled supervisor
+graph, built around a FakeChatModel with a fixed per-call latency. No OpenAI or
+Gmail credentials are needed and the synthetic mailbox is seeded, so runs
+before and after a change are comparable.
+
+With --cheap-latency, the router and acknowledgment nodes get a second,
+faster FakeChatModel as their first tier (see cascade.py); it reports low
+confidence on a --low-confidence fraction of emails, which escalate to the main
+fake model.
+
+Reports emails/sec, p50/p99 latency per email (overall and per stage), LLM calls
+per email, cascade escalation rates, attachments stored and deduplicated, the
+slowest graph nodes with their tokens and errors (instrumentation.py), and peak
+RSS. --metrics-jsonl and --metrics-prom export the per-email and per-node
+metrics as JSON lines and Prometheus text.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--emails N] [--concurrency N]
+        [--llm-latency S] [--ocr-latency S] [--checkpoint] [--text-extraction direct|agent]
+        [--state-mode compact|full_history] [--duplicates F] [--cheap-latency S]
+        [--low-confidence F] [--seed N] [--metrics-jsonl PATH] [--metrics-prom PATH] [--verbose]
+
+PDF pages are rasterized only where poppler is installed; otherwise the PDF
+conversion error is counted and the email continues without those pages.
+"""
+import argparse
+import atexit
+import contextlib
+import hashlib
+import io
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Everything the pipeline writes goes to a scratch directory, and no OpenAI
+# client is ever built, but keep a placeholder key in case one is.
+SCRATCH = tempfile.mkdtemp(prefix="bench_pipeline_")
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+os.environ["CHECKPOINT_DB"] = os.path.join(SCRATCH, "checkpoints.sqlite")
+os.environ["TOOL_CACHE_PATH"] = os.path.join(SCRATCH, "tool_cache.sqlite")
+os.environ["RESPONSE_CACHE_PATH"] = os.path.join(SCRATCH, "response_cache.sqlite")
+os.environ.pop("OCR_API_URL", None)
+
+from langgraph.store.memory import InMemoryStore
+from PIL import Image, ImageDraw
+
+import definitions
+from attachment_index import get_attachment_store
+from cascade import stats as cascade_stats
+from instrumentation import MetricsRegistry, instrumented
+from checkpointing import open_checkpointer
+from fakes import FakeChatModel, FakeGmailService, StubOCRServer, default_script, make_message
+from models import set_chat_model
+from utils import parse_email_content
+
+SENDER = "ops@carrier.example.com"
+
+DOCUMENT_EMAILS = [
+    ("bol", "Please process the attached BOL for our database"),
+    ("invoice", "Can you extract the vendor details from this invoice?"),
+    ("receipt", "Please enter the attached receipt into accounting"),
+    ("shipping_label", "Please parse the attached shipping label"),
+]
+TEXT_EMAILS = [
+    "Shipment {n} delayed - new ETA needed for planning. Carrier: UPS, 45 lbs, 12x8x6 in.",
+    "Urgent: delivery appointment for PO {n} rescheduled to 3 PM today, please confirm.",
+    "Rate quote: $1,500 for Chicago to LA, load {n} - please confirm.",
+]
+ACK_EMAILS = [
+    "Hi team, attached is a sample document for training purposes, ref {n}.",
+    "FYI - here's the invoice {n} for your records.",
+    "Team lunch is on Friday, see you there ({n}).",
+]
+QUOTED_REPLY = "\n\n".join(
+    f"On Mon, Jun {d} 2025, ops wrote:\n> Following up on the shipment below.\n> Regards,\n> Ops" for d in range(1, 6)
+)
+
+
+def page_image(label, rng):
+    """A small scanned-looking page with a few lines of text."""
+    image = Image.new("RGB", (850, 1100), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(12):
+        draw.text((60, 80 + row * 70), f"{label} line {row} {rng.randint(0, 10 ** 6)}", fill="black")
+    return image
+
+
+def png_bytes(label, rng):
+    buffer = io.BytesIO()
+    page_image(label, rng).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def pdf_bytes(label, pages, rng):
+    images = [page_image(f"{label} p{i + 1}", rng) for i in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def populate_mailbox(service, count, seed, duplicates=0.0):
+    """
+    Adds count messages in a fixed 40/30/30 document/text/acknowledgment mix. A
+    duplicates fraction of the document emails re-attach an earlier email's file,
+    as replies in a thread do.
+    """
+    rng = random.Random(seed)
+    duplicate_rng = random.Random(seed + 1)
+    sent = []
+    for n in range(count):
+        message_id = f"msg{n:06d}"
+        kind = n % 10
+        attachments = []
+        if kind < 4:
+            document_type, body = DOCUMENT_EMAILS[n % len(DOCUMENT_EMAILS)]
+            subject = f"{document_type.replace('_', ' ').title()} {n}"
+            if n % 2:
+                attachments.append((f"{document_type}_{n}.pdf", "application/pdf", pdf_bytes(message_id, 2, rng)))
+            else:
+                attachments.append((f"{document_type}_{n}.png", "image/png", png_bytes(message_id, rng)))
+            if sent and duplicate_rng.random() < duplicates:
+                attachments = [duplicate_rng.choice(sent)]
+            sent.append(attachments[0])
+        elif kind < 7:
+            subject = f"Shipment update {n}"
+            body = TEXT_EMAILS[n % len(TEXT_EMAILS)].format(n=n)
+        else:
+            subject = f"FYI {n}"
+            body = ACK_EMAILS[n % len(ACK_EMAILS)].format(n=n)
+        if n % 5 == 0:
+            body += QUOTED_REPLY
+        message, attachment_data = make_message(message_id, SENDER, subject, body, attachments)
+        service.add_message(message, attachment_data)
+
+
+def cheap_script(low_confidence):
+    """default_script that reports a confidence, low for a low_confidence fraction of emails."""
+    def script(messages, tool_names):
+        message = default_script(messages, tool_names)
+        if message.tool_calls and message.tool_calls[0]["name"] in ("RoutingDecision", "Acknowledgment"):
+            text = definitions._email_text(messages)
+            low = int(hashlib.sha256(text.encode()).hexdigest(), 16) % 1000 < low_confidence * 1000
+            message.tool_calls[0]["args"]["confidence"] = 0.4 if low else 0.95
+        return message
+    return script
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def process_one(service, app, message_id, save_path, checkpointed, compact, registry):
+    start = time.perf_counter()
+    message = service.users().messages().get(userId="me", id=message_id, format="full").execute()
+    email_data = parse_email_content(service, message, save_path=save_path)
+    parsed = time.perf_counter()
+    config = {"configurable": {"thread_id": message_id}} if checkpointed else None
+    workflow_input = {"messages": [{"role": "user", "content": definitions.format_email(email_data)}]}
+    if compact:
+        workflow_input["email"] = email_data
+    with instrumented(message_id, config, registry) as config:
+        app.invoke(workflow_input, config)
+    done = time.perf_counter()
+    return parsed - start, done - parsed, done - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--ocr-latency", type=float, default=None,
+                        help="serve OCR from a local stub with this per-page latency (default: mock results)")
+    parser.add_argument("--checkpoint", action="store_true", help="compile the graph with a SQLite checkpointer")
+    parser.add_argument("--text-extraction", choices=["direct", "agent"], default=definitions.TEXT_EXTRACTION_MODE)
+    parser.add_argument("--state-mode", choices=["compact", "full_history"], default=definitions.GRAPH_STATE_MODE)
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="fraction of document emails re-attaching an earlier email's file")
+    parser.add_argument("--cheap-latency", type=float, default=None,
+                        help="tier the router and acknowledgment nodes with a fake cheap model this fast")
+    parser.add_argument("--low-confidence", type=float, default=0.1,
+                        help="fraction of emails the cheap model is unsure about (escalated)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics-jsonl", help="append each email's node metrics to this JSON lines file")
+    parser.add_argument("--metrics-prom", help="write the node metrics totals to this Prometheus text file")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own prints")
+    args = parser.parse_args()
+
+    service = FakeGmailService()
+    populate_mailbox(service, args.emails, args.seed, args.duplicates)
+    message_ids = list(service.messages)
+    save_path = os.path.join(SCRATCH, "attachments")
+    os.makedirs(save_path, exist_ok=True)
+
+    model = FakeChatModel(latency=args.llm_latency)
+    # extract_structured_text_tool runs its own chain on the shared model
+    set_chat_model(model)
+    models = [model]
+    tiers = None
+    if args.cheap_latency is not None:
+        cheap = FakeChatModel(latency=args.cheap_latency, script=cheap_script(args.low_confidence),
+                              model_name="fake-cheap")
+        models.append(cheap)
+        tiers = {"router": [cheap, model], "acknowledgment": [cheap, model]}
+    checkpointer = open_checkpointer(os.environ["CHECKPOINT_DB"]) if args.checkpoint else None
+    compact = args.state_mode == "compact"
+    if compact:
+        agents = definitions.build_agents(model, args.text_extraction, by_reference=True, tiers=tiers)
+        workflow = definitions.build_compact_workflow(model, agents, tiers)
+    else:
+        agents = definitions.build_agents(model, args.text_extraction, tiers=tiers)
+        workflow = definitions.build_workflow(model, agents, tiers)
+    app = workflow.compile(checkpointer=checkpointer, store=InMemoryStore() if compact else None)
+
+    ocr_server = StubOCRServer(latency=args.ocr_latency).start() if args.ocr_latency is not None else None
+    if ocr_server is not None:
+        os.environ["OCR_API_URL"] = ocr_server.url
+
+    print(f"{args.emails} emails, concurrency {args.concurrency}, LLM latency {args.llm_latency * 1000:.0f} ms, "
+          f"OCR {'stub %.0f ms/page' % (args.ocr_latency * 1000) if ocr_server else 'mock'}, "
+          f"checkpointer {'sqlite' if args.checkpoint else 'none'}, text extraction {args.text_extraction}, "
+          f"state {args.state_mode}, "
+          f"{'cheap tier %.0f ms' % (args.cheap_latency * 1000) if tiers else 'single tier'}")
+    registry = MetricsRegistry(args.metrics_jsonl)
+    rss_before = peak_rss_mb()
+    output = sys.stdout if args.verbose else io.StringIO()
+    errors = []
+    timings = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(process_one, service, app, message_id, save_path, args.checkpoint, compact,
+                            registry)
+            for message_id in message_ids
+        ]
+        for future in futures:
+            try:
+                timings.append(future.result())
+            except Exception as e:
+                errors.append(e)
+    elapsed = time.perf_counter() - start
+    if ocr_server is not None:
+        ocr_server.stop()
+
+    parse_times, graph_times, totals = (list(column) for column in zip(*timings)) if timings else ([], [], [])
+    log = output.getvalue() if not args.verbose else ""
+    print(f"  throughput     {len(timings) / elapsed:8.1f} emails/s ({len(timings)} ok, {len(errors)} failed, "
+          f"{elapsed:.2f} s)")
+    for name, values in (("total", totals), ("parse", parse_times), ("graph", graph_times)):
+        print(f"  {name:<8} p50 {percentile(values, 50) * 1000:8.1f} ms   p99 {percentile(values, 99) * 1000:8.1f} ms")
+    calls = sum(m.call_count for m in models)
+    print(f"  LLM calls      {calls / max(len(timings), 1):8.2f} per email"
+          + (f" ({model.call_count} main, {calls - model.call_count} cheap)" if tiers else ""))
+    for node, report in sorted(cascade_stats.report().items()):
+        if report['calls']:
+            print(f"  cascade        {node}: {report['escalated']}/{report['calls']} escalated "
+                  f"({report['escalation_rate']:.0%}) {report['reasons']}")
+        if report['repairs']:
+            print(f"  repairs        {node}: {report['repairs']}")
+    for node, stats in sorted(registry.nodes.items(), key=lambda item: -item[1]["wall_seconds"])[:5]:
+        print(f"  node           {node}: {stats['wall_seconds'] / max(stats['runs'], 1) * 1000:.1f} ms/run, "
+              f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens, {stats['errors']} errors")
+    if args.metrics_prom:
+        registry.write_prometheus(args.metrics_prom)
+    attachments = get_attachment_store(save_path).stats()
+    print(f"  attachments    {attachments['stored']} stored, {attachments['duplicates']} duplicates, "
+          f"{attachments['near_duplicates']} near-duplicates")
+    print(f"  Gmail calls    {sum(service.calls.values())} ({', '.join(f'{k}={v}' for k, v in sorted(service.calls.items()))})")
+    if ocr_server is not None:
+        print(f"  OCR requests   {ocr_server.requests} (peak {ocr_server.max_in_flight} in flight, "
+              f"{ocr_server.bytes_received / max(ocr_server.requests, 1) / 1024:.0f} KB/page uploaded)")
+    if not args.verbose and "Error converting PDF" in log:
+        print(f"  PDF pages      not rasterized ({log.count('Error converting PDF')} PDFs; poppler missing?)")
+    print(f"  peak RSS       {peak_rss_mb():8.1f} MB (before run {rss_before:.1f} MB)")
+    if errors:
+        print(f"  first error    {errors[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures fast-path coverage and agreement of preclassifier.preclassify against a
+labeled sample set, plus per-rule hit rates and classification throughput.
+
+Usage:
+    python benchmarks/bench_preclassifier.py [labeled_emails.jsonl] [--repeat N]
+
+Each line of the labeled file is a parsed email dict (subject, body,
+has_attachments, attachment_paths) plus the expected 'agent' and, for
+document_processor_agent, 'document_type'.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preclassifier import PreclassifierStats, preclassify
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "labeled_emails.jsonl")
+
+
+def load_samples(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples):
+    stats = PreclassifierStats()
+    agreed = 0
+    disagreements = []
+    for sample in samples:
+        route = preclassify(sample, stats=stats)
+        if route is None:
+            continue
+        expected = (sample["agent"], sample.get("document_type"))
+        if (route.agent, route.document_type) == expected:
+            agreed += 1
+        else:
+            disagreements.append((sample["subject"], expected, (route.agent, route.document_type), route.rules))
+    return stats, agreed, disagreements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("samples", nargs="?", default=DEFAULT_SAMPLES)
+    parser.add_argument("--repeat", type=int, default=2000, help="passes over the sample set for timing")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    stats, agreed, disagreements = evaluate(samples)
+    report = stats.report()
+
+    print(f"samples:    {report['total']}")
+    print(f"fast path:  {report['fast_path']} ({report['coverage']:.1%} coverage)")
+    print(f"agreement:  {agreed}/{report['fast_path']} ({agreed / (report['fast_path'] or 1):.1%})")
+    print(f"fallback:   {report['fallback']} (sent to the LLM supervisor)")
+    print("rule hit rates:")
+    for name, rate in report["rule_hit_rates"].items():
+        print(f"  {name:<24}{rate:.1%}")
+    for subject, expected, got, rules in disagreements:
+        print(f"MISMATCH {subject!r}: expected {expected}, got {got} via {rules}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for sample in samples:
+            preclassify(sample, stats=None)
+    elapsed = time.perf_counter() - start
+    n = args.repeat * len(samples)
+    print(f"throughput: {n / elapsed:,.0f} emails/sec ({elapsed / n * 1e6:.1f} us/email)")
+
+
+if __name__ == "__main__":
+    main()
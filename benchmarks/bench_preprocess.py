@@ -0,0 +1,149 @@
+"""
+Bytes and time per page of the pre-OCR preprocessing stage (preprocess.py).
+
+Synthetic inputs cover what the document tools receive: PDF pages rendered at
+200 DPI as full-color PNGs (scanned forms with a gray scanner border), phone
+photos of paper on a desk as large camera JPEGs, and shipping labels with
+barcodes. Each input is preprocessed with the settings of every document type
+that would receive it, once serially and once through the shared process pool.
+Reports input vs output bytes per page and milliseconds per page.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--pages N] [--workers N] [--seed N]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from extraction import DOCUMENT_TYPES
+from preprocess import preprocess_image, preprocess_pages, target_path
+
+# Input kind -> the document types whose pages usually look like it.
+KINDS = {
+    "scanned form": ["bol", "invoice"],
+    "phone photo": ["receipt", "item_label"],
+    "label": ["shipping_label", "item_label"],
+}
+
+
+def font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size default font
+        return ImageFont.load_default()
+
+
+def text_block(draw, rng, left, top, width, lines, size):
+    face = font(size)
+    for row in range(lines):
+        words = " ".join(rng.choice(["BOL", "SHIPPER", "CONSIGNEE", "PO#", "WEIGHT", "LBS", "PALLETS",
+                                     "CARRIER", "FREIGHT", "CHARGES"]) + f" {rng.randint(0, 99999)}"
+                         for _ in range(width // (size * 6)))
+        draw.text((left, top + row * int(size * 1.6)), words, fill=(20, 20, 30), font=face)
+
+
+def scanned_form(rng):
+    """Letter page at 200 DPI, off-white paper on a gray scanner bed, with table rules and noise."""
+    page = Image.new("RGB", (1700, 2200), (120, 120, 120))
+    paper = Image.new("RGB", (1580, 2080), (246, 243, 236))
+    draw = ImageDraw.Draw(paper)
+    for y in range(300, 1900, 120):
+        draw.line((60, y, 1520, y), fill=(90, 90, 90), width=2)
+    text_block(draw, rng, 80, 80, 1400, 55, 22)
+    page.paste(paper, (60, 60))
+    noise = Image.effect_noise(page.size, 18).convert("RGB")
+    return Image.blend(page, noise, 0.08)
+
+
+def phone_photo(rng):
+    """12 MP camera shot of a receipt on a wooden desk, with uneven lighting."""
+    photo = Image.new("RGB", (4032, 3024), (112, 78, 50))
+    draw = ImageDraw.Draw(photo)
+    for x in range(0, 4032, 40):
+        draw.line((x, 0, x + rng.randint(-60, 60), 3024), fill=(100 + rng.randint(0, 30), 70, 45), width=6)
+    paper = Image.new("RGB", (1500, 2600), (236, 234, 228))
+    text_block(ImageDraw.Draw(paper), rng, 80, 120, 1340, 60, 34)
+    shade = Image.linear_gradient("L").resize(paper.size).point(lambda p: 255 - p // 3)
+    paper = Image.composite(paper, Image.new("RGB", paper.size, (150, 148, 140)), shade)
+    photo.paste(paper.rotate(2, expand=True, fillcolor=(112, 78, 50)), (1200, 180))
+    return photo.filter(ImageFilter.GaussianBlur(1.2))
+
+
+def label(rng):
+    """4x6 in shipping label at 300 DPI with a Code-128-like barcode."""
+    image = Image.new("RGB", (1200, 1800), "white")
+    draw = ImageDraw.Draw(image)
+    text_block(draw, rng, 60, 60, 1080, 14, 30)
+    x = 100
+    while x < 1100:
+        width = rng.choice([3, 3, 6, 9])
+        draw.rectangle((x, 900, x + width - 1, 1300), fill="black")
+        x += width + rng.choice([3, 6, 9])
+    text_block(draw, rng, 60, 1380, 1080, 8, 30)
+    return image
+
+
+def make_inputs(directory, pages, seed):
+    rng = random.Random(seed)
+    inputs = []
+    for kind, build, fmt in (("scanned form", scanned_form, "PNG"), ("phone photo", phone_photo, "JPEG"),
+                             ("label", label, "PNG")):
+        for i in range(pages):
+            path = os.path.join(directory, f"{kind.replace(' ', '_')}_{i}.{fmt.lower()}")
+            build(rng).save(path, format=fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+            inputs.append((kind, path))
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=4, help="pages per input kind")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_preprocess_")
+    try:
+        inputs = make_inputs(scratch, args.pages, args.seed)
+        print(f"{args.pages} pages per kind, pool of {args.workers} workers")
+        print(f"  {'input':<13} {'settings':<15} {'in KB/page':>10} {'out KB/page':>11} {'ratio':>6} {'ms/page':>8}")
+        jobs = []
+        for kind, types in KINDS.items():
+            paths = [path for input_kind, path in inputs if input_kind == kind]
+            for document_type in types:
+                settings = DOCUMENT_TYPES[document_type].preprocess
+                start = time.perf_counter()
+                uploads = [preprocess_image(path, target_path(path, settings), settings) for path in paths]
+                elapsed = (time.perf_counter() - start) / len(paths)
+                size_in = sum(os.path.getsize(path) for path in paths) / len(paths)
+                size_out = sum(os.path.getsize(path) for path in uploads) / len(paths)
+                print(f"  {kind:<13} {document_type:<15} {size_in / 1024:10.0f} {size_out / 1024:11.0f} "
+                      f"{size_in / size_out:5.1f}x {elapsed * 1000:8.0f}")
+                for path in uploads:
+                    if path not in paths:
+                        os.remove(path)
+                jobs.extend((path, settings) for path in paths)
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Warm the workers so the timing covers processing, not interpreter start-up
+            list(pool.map(abs, range(args.workers)))
+            start = time.perf_counter()
+            preprocess_pages(jobs, executor=pool)
+            elapsed = time.perf_counter() - start
+        print(f"  process pool   {len(jobs)} pages in {elapsed:.2f} s ({elapsed / len(jobs) * 1000:.0f} ms/page)")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Token budget of the static prompts and of per-email input, with and without
+quote/signature stripping (prompts.strip_quoted_text).
+
+Every labeled sample is measured as-is and as the last reply of a long thread
+(quoted history, forwarded header and signature appended), which is the shape
+that dominates input tokens in production mailboxes.
+
+Usage:
+    python benchmarks/bench_prompts.py [labeled_emails.jsonl] [--thread-depth N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import CACHEABLE_PREFIX_TOKENS, strip_quoted_text, token_budget, token_counter_name
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "labeled_emails.jsonl")
+
+SIGNATURE = "\n\nBest regards,\nJane Doe\nLogistics Coordinator | ACME Freight\n+1 555 0100\n\nSent from my iPhone"
+
+
+def load_samples(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def as_thread(email, depth):
+    """email as the newest reply of a depth-message thread."""
+    history = []
+    for i in range(depth):
+        quoted = "\n".join(f"> {line}" for line in (email.get("body") or "").splitlines())
+        history.append(f"On Mon, Jun {i + 1}, 2025 at 9:{i:02d} AM Ops <ops@example.com> wrote:\n{quoted}")
+    forwarded = (
+        "---------- Forwarded message ---------\nFrom: Carrier <dispatch@carrier.example.com>\n"
+        "Date: Fri, May 30, 2025\nSubject: Load update\n\nSee below for the original load details."
+    )
+    body = (email.get("body") or "") + SIGNATURE + "\n\n" + "\n\n".join(history) + "\n\n" + forwarded
+    return dict(email, body=body)
+
+
+def report(title, emails):
+    budget = token_budget(emails)["emails"]
+    if not budget["count"]:
+        return
+    saved = 1 - budget["stripped_tokens"] / budget["raw_tokens"] if budget["raw_tokens"] else 0.0
+    print(f"{title}: {budget['count']} emails")
+    print(f"  user message tokens  raw {budget['raw_tokens']:7d}  stripped {budget['stripped_tokens']:7d}"
+          f"  ({saved:.0%} saved)")
+    print(f"  largest email        raw {budget['max_raw_tokens']:7d}  stripped {budget['max_stripped_tokens']:7d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("samples", nargs="?", default=DEFAULT_SAMPLES)
+    parser.add_argument("--thread-depth", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    threads = [as_thread(email, args.thread_depth) for email in samples]
+
+    print(f"token counter: {token_counter_name()}")
+    print(f"static prompts (cacheable prefix >= {CACHEABLE_PREFIX_TOKENS} tokens):")
+    for row in token_budget()["prompts"]:
+        print(f"  {row['prompt']:<36}{row['tokens']:6d}  {'cacheable' if row['cacheable'] else ''}")
+    report("labeled samples", samples)
+    report(f"as {args.thread_depth}-reply threads", threads)
+
+    start = time.perf_counter()
+    for email in threads:
+        strip_quoted_text(email["body"])
+    elapsed = time.perf_counter() - start
+    print(f"strip_quoted_text: {elapsed / len(threads) * 1e6:.1f} us per thread email")
+
+
+if __name__ == "__main__":
+    main()
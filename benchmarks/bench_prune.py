@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of None-pruning on synthetic large OCR payloads.
+
+Compares the previous recursive remove_none_values (applied to json.loads output)
+with the iterative copy, in-place pruning and pruning during parsing
+(json_prune.loads_pruned). Reports wall time and tracemalloc peak memory for
+the parse + prune step, and checks how the pruners cope with very deep nesting.
+
+Usage:
+    python benchmarks/bench_prune.py [--line-items N] [--pages N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_prune import loads_pruned, prune_none_inplace, remove_none_values
+
+
+def legacy_remove_none_values(obj):
+    """The recursive implementation previously in tools.py."""
+    if isinstance(obj, dict):
+        return {k: legacy_remove_none_values(v) for k, v in obj.items() if v is not None}
+    elif isinstance(obj, list):
+        return [legacy_remove_none_values(elem) for elem in obj if elem is not None]
+    else:
+        return obj
+
+
+def synthetic_payload(line_items, pages):
+    """A multi-page manifest where roughly half of every record's fields are None."""
+    def item(i):
+        return {
+            "sku": f"SKU-{i:06d}",
+            "description": f"Pallet of widgets #{i}",
+            "qty": i % 17,
+            "weight": {"value": 12.5, "unit": "lb", "tare": None},
+            "hazmat": None,
+            "lot": None if i % 3 else f"LOT-{i}",
+            "dimensions": [10, None, 12, None],
+            "notes": None,
+            "refs": [None, {"type": "po", "value": f"PO-{i}", "line": None}],
+        }
+    return {
+        "document": "manifest",
+        "carrier": {"name": "ACME", "scac": None, "address": {"line1": "1 Main St", "line2": None}},
+        "pages": [
+            {"page": p, "line_items": [item(p * line_items + i) for i in range(line_items)], "footer": None}
+            for p in range(pages)
+        ],
+    }
+
+
+def measure(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(text)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def deep_payload(depth):
+    """Nested lists built without recursion; json.loads itself refuses this depth."""
+    root = node = []
+    for _ in range(depth):
+        child = [None, 1]
+        node.append(child)
+        node = child
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--line-items", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = json.dumps(synthetic_payload(args.line_items, args.pages))
+    print(f"payload: {len(text) / 1e6:.1f} MB, {args.pages} pages x {args.line_items} line items")
+
+    variants = [
+        ("recursive copy (previous)", lambda t: legacy_remove_none_values(json.loads(t))),
+        ("iterative copy", lambda t: remove_none_values(json.loads(t))),
+        ("in place", lambda t: prune_none_inplace(json.loads(t))),
+        ("during parse (loads_pruned)", loads_pruned),
+    ]
+    expected = None
+    for name, fn in variants:
+        result, elapsed, peak = measure(fn, text, args.repeat)
+        expected = expected if expected is not None else result
+        status = "ok" if result == expected else "MISMATCH"
+        print(f"  {name:<30}{elapsed * 1000:8.1f} ms   peak {peak / 1e6:7.1f} MB   {status}")
+
+    depth = sys.getrecursionlimit() * 2
+    print(f"nesting depth {depth} (already-parsed object):")
+    deep_variants = [
+        ("recursive copy (previous)", legacy_remove_none_values),
+        ("iterative copy", remove_none_values),
+        ("in place", prune_none_inplace),
+    ]
+    for name, fn in deep_variants:
+        try:
+            fn(deep_payload(depth))
+            outcome = "ok"
+        except RecursionError:
+            outcome = "RecursionError"
+        print(f"  {name:<30}{outcome}")
+
+
+if __name__ == "__main__":
+    main()
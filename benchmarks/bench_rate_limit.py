@@ -0,0 +1,113 @@
+"""
+Behaviour of the shared rate limiter (rate_limit.py) against a backend that
+enforces its limits with 429s.
+
+A FakeOpenAIServer enforces RPM, TPM and a concurrency cap. A burst of chat
+completions is sent through ChatOpenAI from a thread pool, with the same mix of
+priority lanes the pipeline produces (time-sensitive updates, document
+extraction, acknowledgments). It runs once with plain httpx clients, where only
+the openai SDK's own retries handle the 429s, and once through a BackendLimiter
+configured with the server's RPM/TPM and twice its concurrency, so AIMD has to
+find the cap.
+
+Reports 429s, failed calls, wall time, throughput, p50/p95 latency per lane and
+the limiter's final concurrency limit.
+
+Usage:
+    python benchmarks/bench_rate_limit.py [--requests N] [--threads N] [--rpm N]
+        [--tpm N] [--server-concurrency N] [--latency S] [--prompt-chars N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from fakes import FakeOpenAIServer
+from rate_limit import LOW, NORMAL, URGENT, AsyncRateLimitedTransport, BackendLimiter, RateLimitedTransport, priority
+
+LANES = {URGENT: "urgent", NORMAL: "normal", LOW: "low"}
+# Lane of every 10 requests: 2 time-sensitive updates, 5 documents, 3 acknowledgments.
+LANE_MIX = [NORMAL, LOW, URGENT, NORMAL, LOW, NORMAL, NORMAL, URGENT, LOW, NORMAL]
+
+
+def build_model(url, limiter):
+    if limiter is None:
+        http_client, http_async_client = httpx.Client(), httpx.AsyncClient()
+    else:
+        http_client = httpx.Client(transport=RateLimitedTransport(limiter))
+        http_async_client = httpx.AsyncClient(transport=AsyncRateLimitedTransport(limiter))
+    return ChatOpenAI(
+        model="gpt-4", base_url=url, api_key="sk-offline-benchmark", max_tokens=64,
+        http_client=http_client, http_async_client=http_async_client,
+    )
+
+
+def run(args, limiter):
+    with FakeOpenAIServer(latency=args.latency, rpm=args.rpm, tpm=args.tpm,
+                          max_concurrency=args.server_concurrency) as server:
+        model = build_model(server.url, limiter)
+        prompt = "Shipment update: " + "x" * args.prompt_chars
+
+        def call(i):
+            lane = LANE_MIX[i % len(LANE_MIX)]
+            start = time.perf_counter()
+            try:
+                with priority(lane):
+                    model.invoke(f"{prompt} #{i}")
+                ok = True
+            except Exception:
+                ok = False
+            return lane, ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(call, range(args.requests)))
+        wall = time.perf_counter() - start
+    return server, results, wall
+
+
+def report(name, server, results, wall, limiter):
+    failed = sum(1 for _, ok, _ in results if not ok)
+    print(f"{name}")
+    print(f"  {server.rate_limited} 429s, {failed} failed calls, {wall:.1f} s, "
+          f"{(len(results) - failed) / wall:.1f} completions/s, peak {server.max_in_flight} in flight")
+    for lane, label in LANES.items():
+        latencies = sorted(seconds for call_lane, ok, seconds in results if call_lane == lane and ok)
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"  {label:<7} p50 {statistics.median(latencies):6.2f} s   p95 {p95:6.2f} s   ({len(latencies)} ok)")
+    if limiter is not None:
+        print(f"  limiter {limiter.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=120)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rpm", type=int, default=1200)
+    parser.add_argument("--tpm", type=int, default=120000)
+    parser.add_argument("--server-concurrency", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--prompt-chars", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests from {args.threads} threads; server allows {args.rpm} RPM, "
+          f"{args.tpm} TPM, {args.server_concurrency} concurrent, {args.latency * 1000:.0f} ms each")
+    server, results, wall = run(args, None)
+    report("no limiter (openai SDK retries only)", server, results, wall, None)
+
+    limiter = BackendLimiter("openai", rpm=args.rpm, tpm=args.tpm, max_concurrency=args.server_concurrency * 2,
+                             burst_seconds=1)
+    server, results, wall = run(args, limiter)
+    report("shared limiter", server, results, wall, limiter)
+
+
+if __name__ == "__main__":
+    main()
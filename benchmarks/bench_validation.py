@@ -0,0 +1,89 @@
+"""
+Cost of validating final agent answers (schemas.py).
+
+Compares, per answer, the old json.loads-only parse with json.loads followed by
+validation on the cached AgentResult adapter (what schemas.parse_result does),
+validate_json on the same adapter, a TypeAdapter rebuilt for every call (what
+an uncached validator would pay), and the per-intent model_validate_json that
+schemas.validate_answer uses at the agent boundary. Answers are synthetic
+document, text and acknowledgment results of realistic size.
+
+Usage:
+    python benchmarks/bench_validation.py [--answers N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter
+
+from schemas import RESULT_MODELS, AgentResult, parse_result, result_adapter
+
+
+def answers(count, seed):
+    rng = random.Random(seed)
+    out = []
+    for n in range(count):
+        kind = n % 3
+        if kind == 0:
+            out.append({
+                "email_summary": f"Please process the attached BOL {n}",
+                "processing_intent": "data_extraction_requested",
+                "tool_outputs": {
+                    f"bol_{n}_p{page}.png": {
+                        "fields": {"reference_no": f"BOL-{rng.randint(0, 10 ** 6)}", "carrier": "UPS"},
+                        "line_items": [{"sku": f"A-{i}", "qty": rng.randint(1, 9)} for i in range(20)],
+                    } for page in range(2)
+                },
+            })
+        elif kind == 1:
+            out.append({
+                "email_summary": f"Shipment {n} delayed",
+                "processing_intent": "text_data_extraction",
+                "extracted_data": {"shipment": {"id": n, "status": "delayed", "eta": "2025-06-03"}},
+            })
+        else:
+            out.append({
+                "email_summary": f"FYI {n}",
+                "processing_intent": "informational_acknowledgment",
+                "relevance": "logistics_related",
+                "response": {"status": "acknowledged", "communication_type": "courtesy_info",
+                             "message": "Thanks, noted.", "action_taken": "noted_for_records"},
+            })
+    return [json.dumps(answer) for answer in out]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--answers", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = answers(args.answers, args.seed)
+    assert all(parse_result(text) is not None for text in texts)
+    adapter = result_adapter()
+    intents = {model.model_fields["processing_intent"].default: model for model in RESULT_MODELS.values()}
+    models = [intents[json.loads(text)["processing_intent"]] for text in texts]
+    cases = {
+        "json.loads only (unvalidated)": lambda: [json.loads(text) for text in texts],
+        "json.loads + validate_python": lambda: [adapter.validate_python(json.loads(text)) for text in texts],
+        "validate_json, cached adapter": lambda: [adapter.validate_json(text) for text in texts],
+        "validate_json, adapter per call": lambda: [TypeAdapter(AgentResult).validate_json(text) for text in texts],
+        "model_validate_json per intent": lambda: [
+            model.model_validate_json(text) for model, text in zip(models, texts)
+        ],
+    }
+    print(f"{len(texts)} answers, {sum(map(len, texts)) / len(texts) / 1024:.1f} KB average")
+    for name, run in cases.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"  {name:<34} {best / len(texts) * 1e6:8.1f} us/answer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Persistent content-addressed cache for tool results.
+
+Entries are keyed by tool name, tool version and the SHA-256 of the input
+content (image bytes or normalized text), so the same attachment forwarded
+across threads costs a hash and a lookup instead of an OCR or LLM call.
+Backed by SQLite in WAL mode, with a TTL and size-based LRU eviction.
+
+ResponseCache puts the same store behind LangChain's LLM cache interface, so a
+model built with cache=ResponseCache(...) answers repeated emails locally.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    """SHA-256 of text with runs of whitespace collapsed and ends stripped."""
+    normalized = _WHITESPACE.sub(" ", text or "").strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def make_key(tool_name, version, digest):
+    return f"{tool_name}:{version}:{digest}"
+
+
+class ResultCache:
+    """
+    SQLite-backed JSON value cache with TTL, LRU eviction by total value size,
+    and hit/miss counters. Safe to share between threads.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Stores a JSON-serializable value, then evicts least recently used entries over max_bytes."""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        victims = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """
+        Returns the cached value for key, computing and storing it on a miss.
+        should_cache can veto storing a result (for example error payloads).
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if should_cache is None or should_cache(value):
+                self.set(key, value)
+        return value
+
+    def purge_expired(self):
+        """Deletes every entry older than the TTL. Returns the number removed."""
+        if not self.ttl_seconds:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_seconds,)
+            )
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Per-run noise in serialized messages that must not split cache keys.
+_VOLATILE_FIELDS = {"id", "tool_call_id", "response_metadata", "usage_metadata"}
+
+
+def _canonical_prompt(prompt):
+    """The serialized message list with ids and response metadata dropped."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    stack = [messages]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for field in _VOLATILE_FIELDS & node.keys():
+                # "id" is also the class path of serialized objects; keep those lists
+                if field != "id" or isinstance(node[field], str):
+                    del node[field]
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend(v for v in node if isinstance(v, (dict, list)))
+    return json.dumps(messages, sort_keys=True)
+
+
+class ResponseCache(BaseCache):
+    """
+    LangChain LLM response cache on a ResultCache. Keys cover the model settings
+    (llm_string, including bound tools) and the prompt with whitespace collapsed
+    and per-run message ids removed, so the same normalized email gets the same
+    answer without an API call.
+    """
+
+    version = 1
+
+    def __init__(self, store):
+        self.store = store
+
+    def _key(self, prompt, llm_string):
+        return make_key("llm", self.version, text_digest(f"{llm_string}\n{_canonical_prompt(prompt)}"))
+
+    def lookup(self, prompt, llm_string):
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [ChatGeneration(message=message) for message in messages_from_dict(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        # Only chat generations are stored; their messages round-trip as plain dicts
+        if all(isinstance(generation, ChatGeneration) for generation in return_val):
+            self.store.set(
+                self._key(prompt, llm_string),
+                [message_to_dict(generation.message) for generation in return_val],
+            )
+
+    def clear(self, **kwargs):
+        self.store.clear()
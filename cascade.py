@@ -0,0 +1,150 @@
+"""
+Tiered model cascade for the structured-output nodes.
+
+A node configured with several models (models.NODE_MODELS) sends every call to
+its first, cheapest model. The answer is accepted unless it fails schema
+validation (no tool call, malformed arguments, pydantic errors), the call
+raises, or the model reports a confidence below min_confidence; then the next
+model is asked the same question. The last model's answer is final; if it is
+invalid, that model gets one repair call for the failing fields only
+(schemas.repair).
+
+Escalations and repairs are counted per node in cascade.stats:
+
+    router = structured_cascade("router", [mini, gpt4], RoutingDecision)
+    router.invoke(messages)
+    stats.report()["router"]  # {"calls": 1, "escalated": 0, "escalation_rate": 0.0, ...}
+"""
+import asyncio
+import os
+import threading
+from collections import Counter, defaultdict
+
+from langchain_core.runnables import RunnableLambda
+
+from schemas import repair
+
+# Answers reporting a confidence below this go to the next tier.
+MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.7))
+
+INVALID, LOW_CONFIDENCE, ERROR = "invalid", "low_confidence", "error"
+
+
+class CascadeStats:
+    """Thread-safe counts of cascade calls, the tier that answered, and escalation reasons per node."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.answered_by = defaultdict(Counter)
+        self.escalations = defaultdict(Counter)
+        self.repairs = defaultdict(Counter)
+
+    def record(self, node, tier, reasons):
+        with self._lock:
+            self.calls[node] += 1
+            self.answered_by[node][tier] += 1
+            self.escalations[node].update(reasons)
+
+    def record_repair(self, node, repaired):
+        with self._lock:
+            self.repairs[node]["repaired" if repaired else "failed"] += 1
+
+    def report(self):
+        """
+        Per node: calls, calls escalated at least once, the escalation rate,
+        reasons, answering tiers and repair outcomes.
+        """
+        with self._lock:
+            report = {}
+            for node in {**self.calls, **self.repairs}:
+                calls = self.calls[node]
+                escalated = calls - self.answered_by[node][0]
+                report[node] = {
+                    "calls": calls,
+                    "escalated": escalated,
+                    "escalation_rate": escalated / calls if calls else 0.0,
+                    "reasons": dict(self.escalations[node]),
+                    "answered_by_tier": dict(sorted(self.answered_by[node].items())),
+                    "repairs": dict(self.repairs[node]),
+                }
+            return report
+
+
+stats = CascadeStats()
+
+
+def _check(output, min_confidence):
+    """(parsed, reason): reason is None when the include_raw output is accepted."""
+    parsed = output["parsed"]
+    if output["parsing_error"] is not None or parsed is None:
+        return parsed, INVALID
+    confidence = getattr(parsed, "confidence", None)
+    if confidence is not None and min_confidence is not None and confidence < min_confidence:
+        return parsed, LOW_CONFIDENCE
+    return parsed, None
+
+
+def _raw_args(output):
+    tool_calls = getattr(output["raw"], "tool_calls", None)
+    return tool_calls[0]["args"] if tool_calls else None
+
+
+def structured_cascade(node, models, schema, min_confidence=MIN_CONFIDENCE, stats=stats):
+    """
+    Runnable returning a schema instance from the first of models whose answer
+    is accepted (see the module docstring). A single model never escalates but
+    still gets the repair call.
+    """
+    tiers = [model.with_structured_output(schema, method="function_calling", include_raw=True) for model in models]
+    last = len(tiers) - 1
+
+    def _repair(output, messages):
+        try:
+            result = repair(models[last], schema, _raw_args(output), output["parsing_error"], messages)
+        except Exception:
+            stats.record_repair(node, False)
+            raise
+        stats.record_repair(node, True)
+        return result
+
+    def invoke(messages, config=None):
+        reasons = []
+        for tier, runnable in enumerate(tiers):
+            try:
+                output = runnable.invoke(messages, config)
+            except Exception:
+                if tier == last:
+                    stats.record(node, tier, reasons)
+                    raise
+                reasons.append(ERROR)
+                continue
+            parsed, reason = _check(output, min_confidence)
+            if reason is None or tier == last:
+                stats.record(node, tier, reasons)
+                return parsed if reason != INVALID else _repair(output, messages)
+            reasons.append(reason)
+
+    async def ainvoke(messages, config=None):
+        reasons = []
+        for tier, runnable in enumerate(tiers):
+            try:
+                output = await runnable.ainvoke(messages, config)
+            except Exception:
+                if tier == last:
+                    stats.record(node, tier, reasons)
+                    raise
+                reasons.append(ERROR)
+                continue
+            parsed, reason = _check(output, min_confidence)
+            if reason is None or tier == last:
+                stats.record(node, tier, reasons)
+                if reason != INVALID:
+                    return parsed
+                return await asyncio.to_thread(_repair, output, messages)
+            reasons.append(reason)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"{node}_cascade")
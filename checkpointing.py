@@ -0,0 +1,126 @@
+"""
+Durable, size-bounded checkpointer and store for the supervisor graph.
+
+Checkpoints live in SQLite (WAL mode) instead of process memory, so a restarted
+worker resumes unfinished emails from their last checkpoint rather than
+reprocessing the backlog. apply_retention keeps only the most recent checkpoints
+per thread and the most recent threads overall; compact then returns the freed
+pages to the OS, so long-running pollers hold a steady footprint.
+"""
+import sqlite3
+from collections import namedtuple
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.store.sqlite import SqliteStore
+
+# keep_last: checkpoints kept per (thread, namespace); the newest is always kept.
+# max_threads: most recently active threads kept; older threads are deleted whole.
+RetentionPolicy = namedtuple("RetentionPolicy", ["keep_last", "max_threads"])
+
+DEFAULT_RETENTION = RetentionPolicy(keep_last=5, max_threads=10000)
+
+
+def _connect(path, **kwargs):
+    conn = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    # auto_vacuum only takes effect on a new database, before any table exists
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def open_checkpointer(path):
+    """Returns a SqliteSaver on path with its tables created."""
+    checkpointer = SqliteSaver(_connect(path))
+    checkpointer.setup()
+    return checkpointer
+
+
+def open_store(path, ttl_minutes=None):
+    """
+    Returns a SqliteStore on path with its tables created. With ttl_minutes,
+    items expire that long after their last read or write.
+    """
+    ttl = None
+    if ttl_minutes:
+        ttl = {"default_ttl": ttl_minutes, "refresh_on_read": True}
+    # SqliteStore manages its own transactions, so the connection must autocommit
+    store = SqliteStore(_connect(path, isolation_level=None), ttl=ttl)
+    store.setup()
+    return store
+
+
+def apply_retention(checkpointer, policy=DEFAULT_RETENTION):
+    """
+    Deletes checkpoints (and their pending writes) outside the policy.
+    Checkpoint ids are time-ordered UUIDs, so ordering by id is ordering by time.
+    Returns the number of checkpoints deleted.
+    """
+    with checkpointer.lock, checkpointer.conn:
+        conn = checkpointer.conn
+        before = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        if policy.max_threads:
+            stale = conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id "
+                "ORDER BY MAX(checkpoint_id) DESC LIMIT -1 OFFSET ?",
+                (policy.max_threads,),
+            ).fetchall()
+            conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+            conn.executemany("DELETE FROM writes WHERE thread_id = ?", stale)
+        if policy.keep_last:
+            conn.execute(
+                "DELETE FROM checkpoints WHERE rowid IN ("
+                " SELECT rowid FROM ("
+                "  SELECT rowid, ROW_NUMBER() OVER ("
+                "   PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rank"
+                "  FROM checkpoints) WHERE rank > ?)",
+                (max(policy.keep_last, 1),),
+            )
+            conn.execute(
+                "DELETE FROM writes WHERE NOT EXISTS ("
+                " SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id"
+                " AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)"
+            )
+        after = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+    return before - after
+
+
+def compact(checkpointer):
+    """Folds the WAL back into the database and releases free pages to the OS."""
+    with checkpointer.lock:
+        # sqlite3's execute() steps a statement without result columns only once,
+        # which frees a single page; executescript runs the pragma to completion
+        checkpointer.conn.executescript("PRAGMA incremental_vacuum;")
+        checkpointer.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def maintain(checkpointer, store=None, policy=DEFAULT_RETENTION):
+    """One housekeeping pass for pollers: retention, expired store items, compaction."""
+    deleted = apply_retention(checkpointer, policy)
+    if store is not None and store.ttl_config:
+        store.sweep_ttl()
+    compact(checkpointer)
+    return deleted
+
+
+def incomplete_threads(app):
+    """Returns the ids of threads whose latest checkpoint still has nodes to run."""
+    with app.checkpointer.lock:
+        thread_ids = [
+            row[0] for row in app.checkpointer.conn.execute("SELECT DISTINCT thread_id FROM checkpoints")
+        ]
+    return [
+        thread_id for thread_id in thread_ids
+        if app.get_state({"configurable": {"thread_id": thread_id}}).next
+    ]
+
+
+def resume_incomplete(app):
+    """
+    Resumes every thread a crashed worker left mid-graph from its last checkpoint.
+    Returns {thread_id: final state}.
+    """
+    return {
+        thread_id: app.invoke(None, {"configurable": {"thread_id": thread_id}})
+        for thread_id in incomplete_threads(app)
+    }
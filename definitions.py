@@ -1,284 +1,629 @@
+import asyncio
 import os
 import json
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 load_dotenv()
-from langchain_openai import ChatOpenAI
-from langgraph_supervisor import create_supervisor
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
-from IPython.display import Image, display
-from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.store.memory import InMemoryStore
-
-checkpointer = InMemorySaver()
-store = InMemoryStore()
-
-from sample_tools import (
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, MessagesState, StateGraph
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+from cascade import stats as cascade_stats, structured_cascade
+from checkpointing import maintain, open_checkpointer, open_store
+from models import get_chat_model, get_node_tiers, get_response_cache
+
+# Durable checkpoints: a restarted worker resumes unfinished emails from their last
+# checkpoint. The worker, ingest and pipeline loops call maintain_checkpoints to
+# apply retention and compaction at most every CHECKPOINT_MAINTENANCE_SECONDS.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+CHECKPOINT_MAINTENANCE_SECONDS = float(os.getenv("CHECKPOINT_MAINTENANCE_SECONDS", 600))
+
+from extraction import extract_documents, extract_mixed, infer_page_types
+from instrumentation import instrumented
+import payloads
+from preclassifier import email_priority, preclassify
+from rate_limit import priority
+from schemas import (
+    Acknowledgment,
+    AcknowledgmentResult,
+    DocumentExtractionResult,
+    TextExtraction,
+    TextExtractionResult,
+    validate_answer,
+)
+from prompts import (
+    STRIP_QUOTED_TEXT,
+    acknowledgment_prompt,
+    document_processor_prompt,
+    format_email,
+    payload_ref_instruction,
+    routing_prompt,
+    supervisor_prompt,
+    text_extractor_prompt,
+)
+from tools import (
     invoice_api_tool,
     receipt_api_tool,
     bol_api_tool,
     shipping_label_api_tool,
     item_label_api_tool,
     extract_structured_text_tool,
+    extract_text_direct,
 )
 
-model = ChatOpenAI(model="gpt-4", temperature=0, verbose=True)
-
-document_processor_agent = create_react_agent(
-    model=model,
-    tools=[bol_api_tool, shipping_label_api_tool, item_label_api_tool, invoice_api_tool, receipt_api_tool],
-    name="document_processor_agent",
-    prompt="""
-    You are the **Document Processor Agent**. Your role is to extract structured data from logistics documents when the user explicitly requests data extraction or processing.
-
-    You will receive input containing:
-    - `image_paths`: A list of file paths to the attached documents.
-    - `email_body`: The full text content of the email body.
-    - `document_type`: The type of document to process (e.g., "bol", "shipping_label", "item_label", "invoice", "receipt").
-
-    Your workflow:
-    1. **Email Summary**: Create a concise one-line summary of the email's main request.
-    2. **Document Processing**: Use the appropriate tool based on the `document_type`:
-        * "bol" → use `bol_api_tool`
-        * "shipping_label" → use `shipping_label_api_tool`
-        * "item_label" → use `item_label_api_tool`
-        * "invoice" → use `invoice_api_tool`
-        * "receipt" → use `receipt_api_tool`
-
-    Constraint: You can only call one tool at a time.
-
-    Your final response **must** be a JSON object with the following keys:
-    - `email_summary`: Your one-line summary of the email body.
-    - `processing_intent`: "data_extraction_requested"
-    - `tool_outputs`: A dictionary where keys are the original image file names (or a generated ID) and values are the raw output returned by the specific tool for that image.
-    
-    Example of expected output:
-    JSON
-    {
-        "email_summary": "One-line summary of the email request",
+# "direct": text emails are extracted by one structured-output call whose result is
+# the agent's final answer. "agent": the ReAct agent calling extract_structured_text_tool.
+TEXT_EXTRACTION_MODE = os.getenv("TEXT_EXTRACTION_MODE", "direct")
+
+# "compact": the router picks the agent, the agent runs on the email alone, its tool
+# payloads go to the store by reference and only its final JSON is kept in the state;
+# that JSON is the answer, with no supervisor pass-through turn.
+# "full_history": the langgraph_supervisor graph with every agent transcript in the state.
+GRAPH_STATE_MODE = os.getenv("GRAPH_STATE_MODE", "compact")
+
+
+def _node_models(tiers, node, model):
+    """The model tiers configured for node (see models.NODE_MODELS), or just model."""
+    return (tiers or {}).get(node) or [model]
+
+
+def build_text_extractor(models):
+    """
+    Drop-in replacement for the text_extractor_agent ReAct loop: a one-node graph
+    that makes a single structured-output call and returns its JSON as the agent's
+    final message. One LLM call instead of three, and no re-emitted tool output.
+    models are the call's tiers, cheapest first (see cascade.py).
+    """
+    extractor = structured_cascade("text_extraction", models, TextExtraction)
+
+    def extract(state):
+        email_text = next(
+            (message.content for message in state["messages"] if isinstance(message, HumanMessage)), ""
+        )
+        output = extract_text_direct(email_text, extractor)
+        return {"messages": [AIMessage(content=json.dumps(output), name="text_extractor_agent")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("extract", extract)
+    graph.add_edge(START, "extract")
+    graph.add_edge("extract", END)
+    return graph.compile(name="text_extractor_agent")
+
+
+def with_validated_answer(agent, schema, model):
+    """
+    Wraps a ReAct agent so its final answer is validated against its result
+    model (schemas.py) and replaced by the normalized JSON. An invalid answer
+    gets one repair call on model for the failing fields; one that stays
+    invalid becomes an {"error": ...} answer. Repairs are counted under the
+    agent's name in cascade.stats.
+    """
+    def validate(state):
+        answer = state["messages"][-1]
+        email_message = HumanMessage(content=_email_text(state["messages"]))
+        result = validate_answer(answer.content, schema, model, [email_message], agent.name, cascade_stats)
+        # Same id: replaces the agent's answer instead of appending a second one
+        return {"messages": [AIMessage(content=result.model_dump_json(), name=agent.name, id=answer.id)]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", agent)
+    graph.add_node("validate", validate)
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", "validate")
+    graph.add_edge("validate", END)
+    return graph.compile(name=agent.name)
+
+
+def build_acknowledger(models):
+    """
+    The acknowledgment_agent as a one-node graph. The agent has no tools and
+    fills a fixed template, so one structured-output call (Acknowledgment) does
+    its job, validated, and can start on a cheap model: models are its tiers,
+    cheapest first (see cascade.py).
+    """
+    acknowledge = structured_cascade("acknowledgment", models, Acknowledgment)
+
+    def respond(state):
+        try:
+            result = acknowledge.invoke([
+                SystemMessage(content=acknowledgment_prompt),
+                HumanMessage(content=_email_text(state["messages"])),
+            ])
+        except (ValueError, OutputParserException) as e:
+            print(f"ERROR: Failed to parse acknowledgment: {e}")
+            result = None
+        if result is None:
+            content = json.dumps({"error": "Failed to produce a valid acknowledgment"})
+        else:
+            content = AcknowledgmentResult(
+                email_summary=result.email_summary, relevance=result.relevance, response=result.response
+            ).model_dump_json()
+        return {"messages": [AIMessage(content=content, name="acknowledgment_agent")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("respond", respond)
+    graph.add_edge(START, "respond")
+    graph.add_edge("respond", END)
+    return graph.compile(name="acknowledgment_agent")
+
+
+def build_agents(model, text_extraction=TEXT_EXTRACTION_MODE, by_reference=False, tiers=None):
+    """
+    Builds the three worker agents around model. text_extraction selects the
+    text_extractor_agent implementation ("direct" or "agent", see TEXT_EXTRACTION_MODE).
+    With by_reference, tools return store references instead of their payloads
+    (see payloads.py); used by the compact graph. tiers ({node: [models]}, see
+    models.get_node_tiers) gives nodes their own models instead of model.
+    Returns them keyed by agent name.
+    """
+    from langgraph.prebuilt import create_react_agent
+
+    document_tools = [bol_api_tool, shipping_label_api_tool, item_label_api_tool, invoice_api_tool, receipt_api_tool]
+    text_tools = [extract_structured_text_tool]
+    document_prompt, text_prompt = document_processor_prompt, text_extractor_prompt
+    if by_reference:
+        document_tools = [payloads.by_reference(tool) for tool in document_tools]
+        text_tools = [payloads.by_reference(tool) for tool in text_tools]
+        document_prompt += payload_ref_instruction
+        text_prompt += payload_ref_instruction
+
+    if text_extraction == "direct":
+        text_extractor = build_text_extractor(_node_models(tiers, "text_extraction", model))
+    else:
+        text_models = _node_models(tiers, "text_extraction", model)
+        text_extractor = with_validated_answer(create_react_agent(
+            model=text_models[0],
+            tools=text_tools,
+            name="text_extractor_agent",
+            prompt=text_prompt,
+        ), TextExtractionResult, text_models[-1])
+    document_models = _node_models(tiers, "document_processor", model)
+    agents = [
+        with_validated_answer(create_react_agent(
+            model=document_models[0],
+            tools=document_tools,
+            name="document_processor_agent",
+            prompt=document_prompt,
+        ), DocumentExtractionResult, document_models[-1]),
+        text_extractor,
+        build_acknowledger(_node_models(tiers, "acknowledgment", model)),
+    ]
+    return {agent.name: agent for agent in agents}
+
+
+def build_workflow(model, agents, tiers=None):
+    """
+    Builds the (uncompiled) supervisor graph over agents, as returned by
+    build_agents. Benchmarks and tests pass a fake chat model here.
+    """
+    from langgraph_supervisor import create_supervisor
+
+    return create_supervisor(
+        supervisor_name='supervisor',
+        agents=list(agents.values()),
+        model=_node_models(tiers, "supervisor", model)[0],
+        prompt=supervisor_prompt,
+        output_mode="full_history",
+        add_handoff_messages=True,
+        add_handoff_back_messages=False,
+    )
+
+
+class RoutingDecision(BaseModel):
+    """Structured output of the batch routing step."""
+    agent: Literal["document_processor_agent", "text_extractor_agent", "acknowledgment_agent"] = Field(
+        description="The agent the email must be routed to."
+    )
+    document_type: Optional[Literal["bol", "shipping_label", "item_label", "invoice", "receipt"]] = Field(
+        default=None, description="Type of the attached documents, only for document_processor_agent."
+    )
+    confidence: Optional[float] = Field(
+        default=None, ge=0, le=1, description="How sure you are of this routing, from 0 (guess) to 1 (certain)."
+    )
+
+
+def _routing_inputs(emails):
+    return [
+        [SystemMessage(content=routing_prompt), HumanMessage(content=format_email(email, STRIP_QUOTED_TEXT))]
+        for email in emails
+    ]
+
+
+def _fast_path(emails, use_fast_path):
+    """
+    Applies the deterministic pre-classifier. Returns the decisions list with
+    fast-pathed entries filled in and the indices still needing the LLM router.
+    """
+    decisions = [None] * len(emails)
+    pending = []
+    for i, email in enumerate(emails):
+        route = preclassify(email) if use_fast_path else None
+        if route is None:
+            pending.append(i)
+        else:
+            decisions[i] = RoutingDecision(agent=route.agent, document_type=route.document_type)
+    return decisions, pending
+
+
+def route_emails(emails, max_concurrency=8, use_fast_path=True):
+    """
+    Runs the intent-routing step for all emails in one batched pass. Emails the
+    pre-classifier is confident about skip the LLM entirely.
+    Returns one RoutingDecision per email, or the exception raised for that email.
+    """
+    decisions, pending = _fast_path(emails, use_fast_path)
+    if pending:
+        routed = get_router().batch(
+            _routing_inputs([emails[i] for i in pending]),
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for i, decision in zip(pending, routed):
+            decisions[i] = decision
+    return decisions
+
+
+async def aroute_emails(emails, max_concurrency=8, use_fast_path=True):
+    """Async variant of route_emails."""
+    decisions, pending = _fast_path(emails, use_fast_path)
+    if pending:
+        routed = await get_router().abatch(
+            _routing_inputs([emails[i] for i in pending]),
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for i, decision in zip(pending, routed):
+            decisions[i] = decision
+    return decisions
+
+
+def _agent_input(email, decision):
+    content = format_email(email)
+    if decision.agent == "document_processor_agent":
+        content += f"document_type: {decision.document_type}\n"
+    return {"messages": [HumanMessage(content=content)]}
+
+
+def one_line_summary(email_data, limit=200):
+    """Subject line, or the first line of the body when there is no subject."""
+    text = email_data.get('subject') or ''
+    if not text.strip():
+        text = next((line for line in (email_data.get('body') or '').splitlines() if line.strip()), '')
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def extract_documents_direct(email_data, document_type):
+    """
+    Deterministic replacement for document_processor_agent: runs the registry
+    extractor without an LLM tool-selection turn. Every page is extracted as
+    document_type when the router set one; otherwise each page is typed from its
+    file name and mixed types go through in one pass. Returns the agent's output
+    format, or None when some page has no known type (the agent then handles the
+    email).
+    """
+    image_paths = email_data.get('attachment_paths') or []
+    pages = infer_page_types(image_paths, document_type) if image_paths else None
+    if not pages:
+        return None
+    page_types = {page_type for _, page_type in pages}
+    if len(page_types) == 1:
+        tool_outputs = extract_documents(image_paths, page_types.pop())
+    else:
+        tool_outputs = extract_mixed(pages)
+    return {
+        "email_summary": one_line_summary(email_data),
         "processing_intent": "data_extraction_requested",
-        "tool_outputs": {
-            "filename.png": {
-                // data returned from the tool
-            }
-        }
+        "tool_outputs": tool_outputs,
     }
+
+
+def _direct_result(email, decision):
+    if decision.agent != "document_processor_agent":
+        return None
+    output = extract_documents_direct(email, decision.document_type)
+    if output is None:
+        return None
+    messages = _agent_input(email, decision)["messages"]
+    messages.append(AIMessage(content=json.dumps(output), name="document_processor_agent"))
+    return {"messages": messages}
+
+
+class CompactState(MessagesState):
     """
-)
+    State of the compact graph: the email message, the routing decision and the
+    agent's final answer. email optionally carries the parsed email dict, which
+    enables deterministic document extraction.
+    """
+    email: Optional[dict]
+    route: Optional[dict]
 
-text_extractor_agent = create_react_agent(
-    model=model,
-    tools=[extract_structured_text_tool],
-    name="text_extractor_agent",
-    prompt="""
-    You are the **Text Extractor Agent**. Your role is to extract and structure logistics information directly from email content when no documents are attached but the email contains valuable logistics data.
-
-    You will receive input containing:
-    - `email_body`: The full text content of the email.
-
-    Common scenarios you handle:
-    - Shipment status updates without attachments
-    - Delivery notifications with tracking details
-    - Order confirmations with logistics details
-    - Rate quotes and pricing information
-    - Pickup/delivery schedules and appointments
-    - Carrier notifications and alerts
-    - Load confirmations and assignments
-
-    Your workflow:
-    1. **Email Summary**: Create a concise one-line summary of the logistics information.
-    2. **Text Extraction**: Use `extract_structured_text_tool` to structure the email content.
-
-    Your final response **must** be a JSON object with the following keys:
-    - `email_summary`: Your one-line summary of the email body.
-    - `processing_intent`: "text_data_extraction"
-    - `extracted_data`: The raw structured output returned by the `extract_structured_text_tool`.
-
-    Example of expected output:
-    JSON
-    {
-        "email_summary": "One-line summary of the logistics information",
-        "processing_intent": "text_data_extraction",
-        "extracted_data": {
-            // Structured logistics data returned from tool
-        }
-    }
+
+def _email_text(messages):
+    return next((message.content for message in messages if isinstance(message, HumanMessage)), "")
+
+
+def _final_output(content):
+    """The agent's final answer with stored payloads swapped back in."""
+    try:
+        output = json.loads(content)
+    except (TypeError, ValueError):
+        return content
+    return json.dumps(payloads.resolve_payloads(output))
+
+
+def build_compact_workflow(model, agents, tiers=None):
     """
-)
+    Builds the (uncompiled) compact-state graph: one routing call, then the chosen
+    agent on a fresh context holding only the email. Agent transcripts stay inside
+    the agent; the state receives a single message with its final JSON, which ends
+    the run (a deterministic pass-through instead of another supervisor turn).
+    Build agents with by_reference=True and compile with a store to keep tool
+    payloads out of the agents' context as well. The routing call uses the
+    "router" tiers when given (see cascade.py).
+    """
+    route_model = structured_cascade("router", _node_models(tiers, "router", model), RoutingDecision)
+
+    def supervisor(state):
+        email = state.get("email")
+        text = format_email(email, STRIP_QUOTED_TEXT) if email else _email_text(state["messages"])
+        decision = route_model.invoke([SystemMessage(content=routing_prompt), HumanMessage(content=text)])
+        return {"route": decision.model_dump()}
+
+    def worker(agent_name):
+        def run(state):
+            decision = RoutingDecision(**state["route"])
+            email = state.get("email")
+            result = _direct_result(email, decision) if email else None
+            if result is None:
+                content = _email_text(state["messages"])
+                if decision.agent == "document_processor_agent":
+                    content += f"document_type: {decision.document_type}\n"
+                result = agents[agent_name].invoke({"messages": [HumanMessage(content=content)]})
+            answer = result["messages"][-1]
+            return {"messages": [AIMessage(content=_final_output(answer.content), name=agent_name)]}
+        return run
+
+    graph = StateGraph(CompactState)
+    graph.add_node("supervisor", supervisor)
+    for agent_name in agents:
+        graph.add_node(agent_name, worker(agent_name))
+        graph.add_edge(agent_name, END)
+    graph.add_edge(START, "supervisor")
+    graph.add_conditional_edges("supervisor", lambda state: state["route"]["agent"], list(agents))
+    return graph
+
+
+# The shared model, agents, router and compiled graph are built on first use, not
+# at import, so short-lived workers only pay for what they run. The module
+# attributes (definitions.app, .agents, .model, ...) resolve to the same objects.
+_built = {}
+_build_lock = threading.RLock()
+
+
+def _get_or_build(name, build):
+    with _build_lock:
+        if name not in _built:
+            _built[name] = build()
+        return _built[name]
+
+
+def get_agents():
+    """The three worker agents around the shared model, keyed by agent name."""
+    return _get_or_build("agents", lambda: build_agents(get_chat_model(), tiers=get_node_tiers()))
+
+
+def get_router():
+    """The router tiers bound to the RoutingDecision structured output (see cascade.py)."""
+    return _get_or_build(
+        "router", lambda: structured_cascade("router", get_node_tiers()["router"], RoutingDecision)
+    )
+
+
+def get_checkpointer():
+    return _get_or_build("checkpointer", lambda: open_checkpointer(CHECKPOINT_DB))
+
+
+def get_store():
+    return _get_or_build(
+        "store", lambda: open_store(CHECKPOINT_DB, ttl_minutes=int(os.getenv("STORE_TTL_MINUTES", 7 * 24 * 60)))
+    )
+
+
+def get_workflow():
+    """The uncompiled graph for GRAPH_STATE_MODE."""
+    def build():
+        model, tiers = get_chat_model(), get_node_tiers()
+        if GRAPH_STATE_MODE == "compact":
+            return build_compact_workflow(model, build_agents(model, by_reference=True, tiers=tiers), tiers)
+        return build_workflow(model, get_agents(), tiers)
+
+    return _get_or_build("workflow", build)
+
+
+def get_app():
+    """The compiled graph with the SQLite checkpointer and store, built on first call."""
+    return _get_or_build(
+        "app", lambda: get_workflow().compile(checkpointer=get_checkpointer(), store=get_store())
+    )
+
+
+_LAZY_ATTRIBUTES = {
+    "model": get_chat_model,
+    "response_cache": get_response_cache,
+    "router": get_router,
+    "agents": get_agents,
+    "document_processor_agent": lambda: get_agents()["document_processor_agent"],
+    "text_extractor_agent": lambda: get_agents()["text_extractor_agent"],
+    "acknowledgment_agent": lambda: get_agents()["acknowledgment_agent"],
+    "checkpointer": get_checkpointer,
+    "store": get_store,
+    "workflow": get_workflow,
+    "app": get_app,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-acknowledgment_agent = create_react_agent(
-    model=model,
-    tools=[],
-    name="acknowledgment_agent",
-    prompt="""
-    You are the **Acknowledgment Agent**. Your role is to acknowledge emails that don't require data extraction but may need confirmation or filing.
-
-    You will receive input containing:
-    - `email_body`: The full text content of the email.
-
-    You handle scenarios like:
-    - Training data submissions ("attached is a BOL doc, use this to train the model")
-    - Document sharing for reference ("FYI - here's the invoice for your records")
-    - Courtesy copies and informational emails
-    - Archive/storage requests
-    - General correspondence that mentions logistics documents but doesn't request processing
-
-    Your workflow:
-    1. **Email Summary**: Create a concise one-line summary of what the sender is communicating.
-    2. **Relevance Assessment**: Determine if the email is logistics-related or completely irrelevant.
-    3. **Intent Classification**: Identify the type of communication.
-    4. **Return Acknowledgment**: Provide appropriate response based on relevance and type.
-
-    Your final response **must** be a JSON object with only the following keys:
-    - `email_summary`: Your one-line summary of the email body.
-    - `processing_intent`: "informational_acknowledgment"
-    - `response`: containing the following keys: status,communication_type, message, action_taken
-
-    Example of expected output:
-    Json
-    {
-        "email_summary": "One-line summary of the sender's communication",
-        "processing_intent": "informational_acknowledgment",
-        "relevance": "logistics_related" | "non_logistics" | "irrelevant",
-        "response": {
-            "status": "acknowledged",
-            "communication_type": "business_confirmation" | "document_delivery" | "training_data" | "reference_sharing" | "courtesy_info" | "non_logistics_business" | "personal" | "spam_irrelevant",
-            "message": "Appropriate professional acknowledgment or polite dismissal",
-            "action_taken": "received_and_filed" | "noted_for_records" | "forwarded_to_relevant_team" | "stored_for_training" | "marked_as_irrelevant" | "no_action_required"
-        }
+def run_route(email, decision, config=None):
+    """
+    Runs one routed email: deterministic extraction when possible, otherwise the
+    agent. Its model and OCR calls run in the email's priority lane, and its
+    metrics are recorded in instrumentation.get_registry().
+    """
+    with priority(email_priority(email, decision.agent)), instrumented(email.get('message_id'), config) as config:
+        result = _direct_result(email, decision)
+        if result is None:
+            result = get_agents()[decision.agent].invoke(_agent_input(email, decision), config)
+    return result
+
+
+async def arun_route(email, decision, config=None):
+    """Async variant of run_route."""
+    with priority(email_priority(email, decision.agent)), instrumented(email.get('message_id'), config) as config:
+        result = await asyncio.to_thread(_direct_result, email, decision)
+        if result is None:
+            result = await get_agents()[decision.agent].ainvoke(_agent_input(email, decision), config)
+    return result
+
+
+def _agent_result(email, decision, result):
+    return {
+        "message_id": email.get('message_id'),
+        "agent": decision.agent,
+        "document_type": decision.document_type,
+        "messages": result["messages"],
     }
+
+
+def _run_agent(job):
+    email, decision = job
+    if isinstance(decision, Exception):
+        return {"message_id": email.get('message_id'), "error": str(decision)}
+    return _agent_result(email, decision, run_route(email, decision))
+
+
+async def _arun_agent(job):
+    email, decision = job
+    if isinstance(decision, Exception):
+        return {"message_id": email.get('message_id'), "error": str(decision)}
+    return _agent_result(email, decision, await arun_route(email, decision))
+
+
+def _collect(emails, results):
+    return [
+        {"message_id": email.get('message_id'), "error": str(result)} if isinstance(result, Exception) else result
+        for email, result in zip(emails, results)
+    ]
+
+
+def _run_graph(email_data, config):
     """
-)
-# "response": {
-#             "status": "acknowledged",
-#             "message": "Appropriate acknowledgment message",
-#             "action_taken": "none" | "filed" | "forwarded" | "noted"
-#         }
-
-supervisor_prompt = """
-You are an **Email Processing Supervisor** focused on **Intent Detection**. Your primary responsibility is to understand WHY the email was sent and determine the appropriate processing action.
-
-The email details are provided in the user message. You must analyze the INTENT behind the email, not just its content.
-
-**INTENT CATEGORIES & AGENT ROUTING:**
-
-**INTENT 1: DATA EXTRACTION REQUESTED**
-- **Purpose**: User wants structured data extracted from attached documents
-- **Key Indicators** (ALL must be present):
-  * Has attachments AND
-  * Contains EXPLICIT extraction language:
-    - Direct commands: "extract data from", "process the attached", "pull information from", "analyze the document"
-    - Task assignments: "please extract", "can you get the data from", "need you to process"
-    - System integration: "for your records", "add to database", "update our system", "enter into accounting"
-    - Questions about document content: "what's the total amount in", "who is the vendor on", "when is the due date"
-    - Processing requests: "parse this document", "get the details from the attachment"
-
-- **NOT extraction requests**:
-  * Notifications: "attached is your invoice", "here's your receipt"  
-  * Reference sharing: "FYI attached", "for reference"
-  * Confirmations: "your order confirmation attached"
-  * Training data: "use this to train the model", "sample document"
-
-- **Agent**: document_processor_agent
-- **Input**:
-  ```
-  email_body: Full email content
-  image_paths: List of attachment file paths  
-  document_type: Identified type ("bol", "shipping_label", "item_label", "invoice", "receipt")
-  ```
-
-**INTENT 2: TEXT DATA EXTRACTION**
-- **Purpose**: Extract logistics information from email body when it contains actionable operational data
-- **Indicators**:
-  * Real-time updates: "your shipment has been delivered", "tracking shows delayed"
-  * Status changes: "order status changed to", "delivery rescheduled to"
-  * Rate quotes with request: "please confirm this rate", "do you accept this quote"
-  * Appointment requests: "can you confirm pickup time", "please schedule delivery"
-  * Data-rich notifications requiring follow-up action
-
-- **NOT text extraction**:
-  * Simple notifications: "your delivery is scheduled", "advance shipping notice"
-  * Courtesy updates: "FYI your package arrives tomorrow"
-  * Standard confirmations: "order received", "payment processed"
-
-- **Conditions**: Email contains structured logistics data that requires extraction for operational use
-- **Agent**: text_extractor_agent
-- **Input**: 
-  ```
-  email_body: Full email content
-  ```
-
-**INTENT 3: ACKNOWLEDGMENT/FILING ONLY**
-- **Purpose**: Email doesn't require data extraction but needs professional acknowledgment
-- **Indicators**:
-  * **Informational Logistics**: Advance shipping notices, delivery notifications, order confirmations
-  * **Document Sharing**: "attached is your invoice", "here's your receipt"
-  * **Courtesy Communications**: Status updates, delivery confirmations, pickup notifications  
-  * **Training/Reference**: "for training", "sample document", "use this for the model"
-  * **Business Correspondence**: Meeting requests, policy updates, general business communication
-  * **Non-Logistics Content**: Personal messages, marketing, HR announcements, social events
-  * **Irrelevant/Spam**: Promotional content, misdirected emails, unrelated correspondence
-
-- **Agent**: acknowledgment_agent
-- **Input**: 
-  ```
-  email_body: Full email content
-  ```
-
-**CRITICAL DECISION LOGIC:**
-
-1. **Check for Explicit Action Requests**: 
-   - Does the sender use command language asking the recipient to DO something with the data?
-   - Look for verbs: "record", "extract", "process", "analyze", "get", "pull", "parse", "enter"
-
-2. **Distinguish Notifications from Requests**:
-   - "Your invoice is attached" = notification (Intent 3)
-   - "Please process the attached invoice" = request (Intent 1)
-   - "Advance shipping notice" = notification (Intent 3)  
-   - "Extract data from this shipping notice" = request (Intent 1)
-
-3. **Attachment Purpose Analysis**:
-   - For reference = Intent 3
-   - For processing/extraction = Intent 1
-   - For training/samples = Intent 3
-
-**EXAMPLES OF CORRECT CLASSIFICATION:**
-
-**INTENT 1 (Data Extraction):**
-- "Can you extract the vendor details from this invoice?"
-- "Please process the attached BOL for our database"
-- "I need the shipment details from the attached documents"
-- "What's the total amount on this invoice?"
-- "please fill this file in our records."
-
-**INTENT 2 (Text Extraction):**  
-- "Shipment ABC123 delayed - new ETA needed for planning"
-- "Rate quote: $1,500 for Chicago to LA - please confirm"
-- "Urgent: Delivery appointment changed to 3 PM today"
-
-**INTENT 3 (Acknowledgment):**
-- "Advance Shipping Notice – PO# 123456 / 2 Pallets (ETA: June 10, 2025)" 
-- "Your invoice for Order #XYZ-7890 is attached"
-- "Delivery confirmation: Package delivered at 2:15 PM"
-- "Here's the BOL for training the model"
-- "FYI - shipment status update attached"
-
-**OUTPUT INSTRUCTION**: 
-When receiving processed output from a subagent, return it EXACTLY as-is without modification.
-Do not summarize, reformat, or add commentary - pass through the agent's response directly.
-"""
+    Runs the supervisor graph for an email, checkpointed under its message_id and
+    instrumented like run_route.
+    """
+    config = dict(config or {})
+    configurable = dict(config.get("configurable") or {})
+    configurable.setdefault("thread_id", email_data.get('message_id') or str(uuid.uuid4()))
+    config["configurable"] = configurable
+
+    app = get_app()
+    snapshot = app.get_state(config)
+    if snapshot.values and not snapshot.next:
+        return snapshot.values["messages"]
+    with instrumented(configurable["thread_id"], config) as config:
+        if snapshot.next:
+            return app.invoke(None, config)["messages"]
+        workflow_input = {"messages": [{"role": "user", "content": format_email(email_data)}]}
+        if GRAPH_STATE_MODE == "compact":
+            workflow_input["email"] = email_data
+        return app.invoke(workflow_input, config)["messages"]
+
+
+def discard_checkpoint(message_id):
+    """
+    Deletes the checkpointed graph run of an email, so the next process_email
+    runs it from scratch instead of returning the saved (e.g. failed) answer.
+    """
+    get_checkpointer().delete_thread(message_id)
+
+
+_last_maintenance = None
+_maintenance_lock = threading.Lock()
 
-workflow = create_supervisor(
-    supervisor_name='supervisor',
-    agents=[document_processor_agent, text_extractor_agent, acknowledgment_agent],
-    model=model,
-    prompt=supervisor_prompt,
-    output_mode="full_history",
-    add_handoff_messages=True,
-    add_handoff_back_messages=False,
-)
 
-app = workflow.compile()
+def maintain_checkpoints():
+    """
+    Applies retention and compaction to CHECKPOINT_DB (checkpointing.maintain), at
+    most once every CHECKPOINT_MAINTENANCE_SECONDS per process. Skipped while the
+    database does not exist. Returns the number of checkpoints deleted, or None
+    when skipped.
+    """
+    global _last_maintenance
+    with _maintenance_lock:
+        now = time.monotonic()
+        if _last_maintenance is not None and now - _last_maintenance < CHECKPOINT_MAINTENANCE_SECONDS:
+            return None
+        if not os.path.exists(CHECKPOINT_DB):
+            return None
+        _last_maintenance = now
+        return maintain(get_checkpointer(), get_store())
+
+
+def process_email(email_data, config=None):
+    """
+    Single-email entry point. Routes straight to the agent when the pre-classifier
+    is confident, otherwise runs the full supervisor graph.
+
+    Graph runs are checkpointed under the email's message_id (unless config sets a
+    thread_id): an email that already finished returns its saved messages, and one
+    interrupted mid-graph resumes from its last checkpoint. Model and OCR calls
+    run in the email's rate-limit lane (preclassifier.email_priority), and the
+    run's per-node metrics are recorded in instrumentation.get_registry().
+    Returns the resulting message list.
+    """
+    route = preclassify(email_data)
+    if route is None:
+        with priority(email_priority(email_data)):
+            return _run_graph(email_data, config)
+    decision = RoutingDecision(agent=route.agent, document_type=route.document_type)
+    return run_route(email_data, decision, config)["messages"]
+
+
+def process_emails_batch(emails, max_concurrency=8):
+    """
+    Batch entry point: routes every email in one batched pass, then runs each
+    email's agent concurrently, skipping the supervisor handoff turns. Document
+    emails of a known type are extracted directly, without an agent.
+    Returns one dict per email, in input order, with the chosen agent and the
+    agent's messages (the final answer is messages[-1].content), or an 'error' key.
+    """
+    decisions = route_emails(emails, max_concurrency=max_concurrency)
+    results = RunnableLambda(_run_agent).batch(
+        list(zip(emails, decisions)),
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    return _collect(emails, results)
+
+
+async def aprocess_emails_batch(emails, max_concurrency=8):
+    """Async variant of process_emails_batch."""
+    decisions = await aroute_emails(emails, max_concurrency=max_concurrency)
+    results = await RunnableLambda(_arun_agent).abatch(
+        list(zip(emails, decisions)),
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    return _collect(emails, results)
 
 # Example usage:
 """
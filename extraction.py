@@ -0,0 +1,219 @@
+"""
+Registry-based document extraction engine.
+
+Every document type maps to the OCR request name of its extractor and the schema
+its output is normalized to. Once the supervisor (or the pre-classifier) has
+decided the document type, extraction runs deterministically from this registry,
+with no LLM turn to pick a tool, and attachments of mixed types go through in a
+single concurrent OCR pass.
+"""
+import os
+import threading
+from collections import namedtuple
+from typing import Optional, Union
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from cache import ResultCache, file_digest, make_key
+from ocr_client import get_ocr_client
+from preclassifier import detect_document_type
+from preprocess import PreprocessSettings, preprocess_pages
+
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "tool_cache.sqlite")
+
+_tool_cache = None
+_lock = threading.Lock()
+
+
+def get_tool_cache():
+    """Returns the shared OCR and text-extraction result cache, opened on first use."""
+    global _tool_cache
+    with _lock:
+        if _tool_cache is None:
+            _tool_cache = ResultCache(
+                TOOL_CACHE_PATH,
+                max_bytes=int(os.getenv("TOOL_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+                ttl_seconds=int(os.getenv("TOOL_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+            )
+        return _tool_cache
+
+
+Amount = Union[float, str]
+
+
+class DocumentResult(BaseModel):
+    """Base output schema. OCR fields outside the declared ones are kept as-is."""
+    model_config = ConfigDict(extra="allow")
+
+    amount_due: Optional[Amount] = None
+    currency: Optional[str] = None
+    due_date: Optional[str] = None
+    associated_shipment_id: Optional[str] = None
+
+
+class BOLResult(DocumentResult):
+    bol_no: Optional[str] = None
+
+
+class InvoiceResult(DocumentResult):
+    inv_no: Optional[str] = None
+
+
+class ReceiptResult(DocumentResult):
+    bol_no: Optional[str] = None
+
+
+class ShippingLabelResult(DocumentResult):
+    bol_no: Optional[str] = None
+
+
+class ItemLabelResult(DocumentResult):
+    bol_no: Optional[str] = None
+
+
+# version: bump whenever the request name or the output format changes, so
+# stale cache entries stop matching.
+# mock_id: (field, format) of the placeholder id used while OCR_API_URL is unset.
+# preprocess: how pages are shrunk before OCR upload (see preprocess.py), None to upload as-is.
+DocumentSpec = namedtuple("DocumentSpec", ["tool_name", "request_name", "schema", "version", "mock_id", "preprocess"])
+
+# Dense printed forms: 1-bit at about 200 DPI keeps small print and is the smallest upload.
+FORM_PAGE = PreprocessSettings(max_side=2200, mode="binary", crop=True, fmt="png", quality=None)
+# Barcodes need hard edges and enough pixels per bar.
+LABEL_PAGE = PreprocessSettings(max_side=2000, mode="binary", crop=True, fmt="png", quality=None)
+# Mostly phone photos with shadows and colored backgrounds, where a global
+# threshold drops text: keep grayscale.
+PHOTO_PAGE = PreprocessSettings(max_side=1800, mode="gray", crop=True, fmt="jpeg", quality=85)
+
+DOCUMENT_TYPES = {
+    "bol": DocumentSpec("bol_api_tool", 11, BOLResult, 2, ("bol_no", "BOL-MOCK-{:03d}"), FORM_PAGE),
+    "shipping_label": DocumentSpec(
+        "shipping_label_api_tool", 10, ShippingLabelResult, 2, ("bol_no", "BOL-MOCK-{:03d}"), LABEL_PAGE
+    ),
+    "item_label": DocumentSpec("item_label_api_tool", 12, ItemLabelResult, 2, ("bol_no", "BOL-MOCK-{:03d}"), PHOTO_PAGE),
+    "invoice": DocumentSpec("invoice_api_tool", 11, InvoiceResult, 2, ("inv_no", "lalalalala-{:03d}"), FORM_PAGE),
+    "receipt": DocumentSpec("receipt_api_tool", 11, ReceiptResult, 2, ("bol_no", "BOL-MOCK-{:03d}"), PHOTO_PAGE),
+}
+
+
+def mock_result(spec, i):
+    # Mock data for demonstration
+    field, template = spec.mock_id
+    return {
+        field: template.format(i + 1),
+        "amount_due": 1000.00 + (i * 100),
+        "currency": "USD",
+        "due_date": "2024-07-01",
+        "associated_shipment_id": "ABC-123"
+    }
+
+
+def normalize(spec, result):
+    """Validates an OCR result against the type's schema; results that don't fit are returned unchanged."""
+    if "error" in result:
+        return result
+    try:
+        return spec.schema.model_validate(result).model_dump(exclude_none=True)
+    except ValidationError:
+        return result
+
+
+def extract_pages(pages):
+    """
+    Extracts a list of (image_path, document_type) pages. Pages whose bytes are
+    already cached are served from tool_cache; the rest go to the OCR backend (or
+    get mock results, which are not cached, while OCR_API_URL is unset) as
+    one concurrent batch, each with its own type's request name, after being
+    shrunk with the type's preprocess settings. Pages with the same bytes and
+    type are sent once.
+    Returns one result per page, in input order.
+    """
+    specs = [DOCUMENT_TYPES[document_type] for _, document_type in pages]
+    keys = [
+        make_key(spec.tool_name, spec.version, file_digest(path))
+        for (path, _), spec in zip(pages, specs)
+    ]
+    tool_cache = get_tool_cache()
+    results = [tool_cache.get(key) for key in keys]
+    first = {}
+    for i, result in enumerate(results):
+        if result is None:
+            first.setdefault(keys[i], i)
+    missing = list(first.values())
+    if not missing:
+        return results
+
+    client = get_ocr_client()
+    if client is not None:
+        # Results stay keyed by the original page's bytes; only the upload is preprocessed
+        uploads = preprocess_pages([(pages[i][0], specs[i].preprocess) for i in missing])
+        # OCR responses are pruned of None values while being parsed
+        fresh = client.recognize_pages([(upload, specs[i].request_name) for upload, i in zip(uploads, missing)])
+    else:
+        # Mock ids count pages per document type, like the per-tool loops did
+        seen = {}
+        fresh = []
+        for i in missing:
+            index = seen.get(specs[i].tool_name, 0)
+            seen[specs[i].tool_name] = index + 1
+            fresh.append(mock_result(specs[i], index))
+
+    for i, result in zip(missing, fresh):
+        results[i] = normalize(specs[i], result)
+        # Mock results are never cached: they would be served for real OCR once OCR_API_URL is set
+        if client is not None and "error" not in results[i]:
+            tool_cache.set(keys[i], results[i])
+    return [result if result is not None else results[first[key]] for key, result in zip(keys, results)]
+
+
+def file_names(paths):
+    """
+    Result keys for paths: their file names, with ' (2)', ' (3)', ... added when
+    different files share a name (attachments are stored by content, see
+    attachment_index.py, so same-named files no longer overwrite each other).
+    """
+    names = []
+    seen = set()
+    for path in paths:
+        name = os.path.basename(path)
+        stem, extension = os.path.splitext(name)
+        count = 1
+        while name in seen:
+            count += 1
+            name = f"{stem} ({count}){extension}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def extract_documents(image_paths, document_type):
+    """Extracts pages of one document type. Returns {file_name: result} in input order."""
+    results = extract_pages([(path, document_type) for path in image_paths])
+    return dict(zip(file_names(image_paths), results))
+
+
+def infer_page_types(image_paths, document_type=None):
+    """
+    Pairs each page with a document type. A known document_type (the router's)
+    applies to every page; only when the router left the email untyped is each
+    page typed from its file name (e.g. 'invoice_12_page1.png'). Returns None if
+    any page stays untyped.
+    """
+    if document_type in DOCUMENT_TYPES:
+        return [(path, document_type) for path in image_paths]
+    typed = []
+    for path in image_paths:
+        page_type = detect_document_type(os.path.basename(path).replace('_', ' '))
+        if page_type not in DOCUMENT_TYPES:
+            return None
+        typed.append((path, page_type))
+    return typed
+
+
+def extract_mixed(pages):
+    """
+    Extracts (image_path, document_type) pages of several types in one pass.
+    Returns {file_name: result} in input order, like extract_documents.
+    """
+    results = extract_pages(pages)
+    return dict(zip(file_names(path for path, _ in pages), results))
@@ -0,0 +1,369 @@
+"""
+Per-node latency, token and cost instrumentation for the supervisor graph.
+
+EmailInstrumentation is a LangChain callback handler attached to one email's
+run. It attributes wall time, LLM calls, prompt/completion tokens and tool time
+to the graph node they ran in (nested agent nodes are reported as
+'document_processor_agent/agent', '.../tools', ...), counts the errors raised in
+each node, and can abort the run once the email's cost budget is exceeded.
+MetricsRegistry keeps totals across emails and exports them as JSON lines or
+Prometheus text, with no LangSmith dependency.
+
+    with instrumented(message_id, config) as config:
+        app.invoke(workflow_input, config)
+
+instrumented() attaches the handler to config["callbacks"] and records it in
+get_registry() when the run ends; the entry points in definitions run every
+email this way. METRICS_JSONL_PATH and METRICS_PROMETHEUS_PATH export the
+default registry, EMAIL_BUDGET_USD caps each email's cost.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH") or None
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH") or None
+EMAIL_BUDGET_USD = float(os.environ["EMAIL_BUDGET_USD"]) if os.getenv("EMAIL_BUDGET_USD") else None
+
+# USD per 1K (prompt, completion) tokens. Unknown models are costed at zero.
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised from the callback when an email's LLM cost passes its budget."""
+
+
+def model_cost(model, prompt_tokens, completion_tokens):
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            prompt_price, completion_price = MODEL_PRICES[name]
+            return prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price
+    return 0.0
+
+
+def _node_label(metadata):
+    """'parent:task|child:task' checkpoint namespaces become 'parent/child'."""
+    metadata = metadata or {}
+    namespace = metadata.get("langgraph_checkpoint_ns") or metadata.get("checkpoint_ns") or ""
+    parts = [segment.split(":")[0] for segment in namespace.split("|") if segment]
+    node = metadata.get("langgraph_node")
+    if node and (not parts or parts[-1] != node):
+        parts.append(node)
+    return "/".join(parts) or "(graph)"
+
+
+def _new_node_stats():
+    return {
+        "wall_seconds": 0.0,
+        "runs": 0,
+        "errors": 0,
+        "llm_calls": 0,
+        "llm_seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost_usd": 0.0,
+        "tool_calls": 0,
+        "tool_seconds": 0.0,
+        "tools": defaultdict(float),
+    }
+
+
+def _token_usage(response):
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    prompt = usage.get("prompt_tokens")
+    completion = usage.get("completion_tokens")
+    if prompt is None:
+        prompt = completion = 0
+        for generations in response.generations:
+            for generation in generations:
+                meta = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt += meta.get("input_tokens", 0)
+                completion += meta.get("output_tokens", 0)
+    return prompt or 0, completion or 0
+
+
+class EmailInstrumentation(BaseCallbackHandler):
+    """Collects per-node metrics for one email's graph run."""
+
+    raise_error = True
+
+    def __init__(self, email_id, budget_usd=None):
+        self.email_id = email_id
+        self.budget_usd = budget_usd
+        self.started = time.time()
+        self.finished = None
+        self.nodes = defaultdict(_new_node_stats)
+        self.models = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        self.cost_usd = 0.0
+        self.error = None
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, metadata, **extra):
+        with self._lock:
+            self._runs[run_id] = dict(extra, node=_node_label(metadata), start=time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            run["elapsed"] = time.perf_counter() - run["start"]
+        return run
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        # Only the node's own runnable, not the chains nested inside it. A compiled
+        # subgraph used as a node is reported once, not again as its own run.
+        if not metadata or kwargs.get("name") != metadata.get("langgraph_node"):
+            return
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+        if parent is None or parent["node"] != _node_label(metadata):
+            self._start(run_id, metadata)
+
+    def _end_chain(self, run_id, failed=False):
+        run = self._finish(run_id)
+        if run is not None:
+            with self._lock:
+                stats = self.nodes[run["node"]]
+                stats["wall_seconds"] += run["elapsed"]
+                stats["runs"] += 1
+                stats["errors"] += failed
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        self._end_chain(run_id)
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end_chain(run_id, failed=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or (metadata or {}).get("ls_model_name")
+        self._start(run_id, metadata, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, metadata, model=params.get("model") or params.get("model_name"))
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        run = self._finish(run_id)
+        if run is None:
+            return
+        prompt_tokens, completion_tokens = _token_usage(response)
+        model = run.get("model") or (response.llm_output or {}).get("model_name") or "unknown"
+        cost = model_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            stats = self.nodes[run["node"]]
+            stats["llm_calls"] += 1
+            stats["llm_seconds"] += run["elapsed"]
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost_usd"] += cost
+            per_model = self.models[model]
+            per_model["calls"] += 1
+            per_model["prompt_tokens"] += prompt_tokens
+            per_model["completion_tokens"] += completion_tokens
+            self.cost_usd += cost
+            over_budget = self.budget_usd is not None and self.cost_usd > self.budget_usd
+        if over_budget:
+            raise BudgetExceeded(
+                f"Email {self.email_id} cost ${self.cost_usd:.4f}, over its ${self.budget_usd:.4f} budget"
+            )
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            with self._lock:
+                self.nodes[run["node"]]["errors"] += 1
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                      inputs=None, **kwargs):
+        self._start(run_id, metadata, tool=(serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    def _end_tool(self, run_id, failed=False):
+        run = self._finish(run_id)
+        if run is not None:
+            with self._lock:
+                stats = self.nodes[run["node"]]
+                stats["tool_calls"] += 1
+                stats["tool_seconds"] += run["elapsed"]
+                stats["tools"][run["tool"]] += run["elapsed"]
+                stats["errors"] += failed
+
+    def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+        self._end_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end_tool(run_id, failed=True)
+
+    def summary(self):
+        """Returns the email's metrics as a JSON-serializable dict."""
+        with self._lock:
+            finished = self.finished or time.time()
+            nodes = {
+                node: dict(stats, tools=dict(stats["tools"]))
+                for node, stats in self.nodes.items()
+            }
+            return {
+                "email_id": self.email_id,
+                "started": self.started,
+                "wall_seconds": finished - self.started,
+                "llm_calls": sum(stats["llm_calls"] for stats in nodes.values()),
+                "prompt_tokens": sum(stats["prompt_tokens"] for stats in nodes.values()),
+                "completion_tokens": sum(stats["completion_tokens"] for stats in nodes.values()),
+                "tool_seconds": sum(stats["tool_seconds"] for stats in nodes.values()),
+                "errors": sum(stats["errors"] for stats in nodes.values()),
+                "error": self.error,
+                "cost_usd": self.cost_usd,
+                "budget_usd": self.budget_usd,
+                "nodes": nodes,
+                "models": {model: dict(stats) for model, stats in self.models.items()},
+            }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Accumulates finished EmailInstrumentation summaries for export."""
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.emails = 0
+        self.failed = 0
+        self.email_seconds = 0.0
+        self.cost_usd = 0.0
+        self.nodes = defaultdict(_new_node_stats)
+        self._lock = threading.Lock()
+
+    def record(self, handler, error=None):
+        """
+        Finalizes a handler, folds it into the totals and appends it to jsonl_path
+        if set. error is the exception the email's run raised, if any.
+        """
+        handler.finished = handler.finished or time.time()
+        if error is not None:
+            handler.error = handler.error or repr(error)
+        summary = handler.summary()
+        with self._lock:
+            self.emails += 1
+            self.failed += summary["error"] is not None
+            self.email_seconds += summary["wall_seconds"]
+            self.cost_usd += summary["cost_usd"]
+            for node, stats in summary["nodes"].items():
+                total = self.nodes[node]
+                for key, value in stats.items():
+                    if key == "tools":
+                        for tool_name, seconds in value.items():
+                            total["tools"][tool_name] += seconds
+                    else:
+                        total[key] += value
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(summary) + "\n")
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+        return summary
+
+    def prometheus_text(self):
+        """Renders the totals in the Prometheus text exposition format."""
+        series = [
+            ("email_graph_node_seconds_total", "counter", "Wall time spent in each graph node.", "wall_seconds"),
+            ("email_graph_node_runs_total", "counter", "Times each graph node ran.", "runs"),
+            ("email_graph_node_errors_total", "counter", "Errors raised in each graph node, its LLM calls and tools.",
+             "errors"),
+            ("email_graph_llm_calls_total", "counter", "LLM calls made inside each graph node.", "llm_calls"),
+            ("email_graph_llm_seconds_total", "counter", "LLM latency inside each graph node.", "llm_seconds"),
+            ("email_graph_prompt_tokens_total", "counter", "Prompt tokens sent from each graph node.", "prompt_tokens"),
+            ("email_graph_completion_tokens_total", "counter", "Completion tokens received in each graph node.",
+             "completion_tokens"),
+            ("email_graph_cost_usd_total", "counter", "Estimated LLM cost of each graph node.", "cost_usd"),
+            ("email_graph_tool_seconds_total", "counter", "Tool time inside each graph node.", "tool_seconds"),
+        ]
+        lines = []
+        with self._lock:
+            for name, kind, help_text, key in series:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for node, stats in sorted(self.nodes.items()):
+                    lines.append(f'{name}{{node="{_escape(node)}"}} {stats[key]}')
+            lines.append("# HELP email_graph_tool_seconds_by_tool_total Time spent in each tool.")
+            lines.append("# TYPE email_graph_tool_seconds_by_tool_total counter")
+            for node, stats in sorted(self.nodes.items()):
+                for tool_name, seconds in sorted(stats["tools"].items()):
+                    lines.append(
+                        f'email_graph_tool_seconds_by_tool_total{{node="{_escape(node)}",tool="{_escape(tool_name)}"}} {seconds}'
+                    )
+            lines.append("# HELP email_graph_email_seconds Wall time per email.")
+            lines.append("# TYPE email_graph_email_seconds summary")
+            lines.append(f"email_graph_email_seconds_sum {self.email_seconds}")
+            lines.append(f"email_graph_email_seconds_count {self.emails}")
+            lines.append("# HELP email_graph_email_failures_total Emails whose run raised an error.")
+            lines.append("# TYPE email_graph_email_failures_total counter")
+            lines.append(f"email_graph_email_failures_total {self.failed}")
+            lines.append("# HELP email_graph_email_cost_usd_total Estimated LLM cost across all emails.")
+            lines.append("# TYPE email_graph_email_cost_usd_total counter")
+            lines.append(f"email_graph_email_cost_usd_total {self.cost_usd}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Writes prometheus_text() atomically, e.g. for node_exporter's textfile collector."""
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """The process-wide registry the entry points record into, created on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH)
+        return _registry
+
+
+def with_callback(config, handler):
+    """Returns a copy of config with handler added to its callbacks."""
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler)
+    else:
+        callbacks = list(callbacks or []) + [handler]
+    config["callbacks"] = callbacks
+    return config
+
+
+@contextlib.contextmanager
+def instrumented(email_id, config=None, registry=None, budget_usd=EMAIL_BUDGET_USD):
+    """
+    Yields config with an EmailInstrumentation for email_id attached, and records
+    the handler in registry (default get_registry()) once the run ends or raises.
+    """
+    handler = EmailInstrumentation(email_id, budget_usd)
+    registry = registry or get_registry()
+    try:
+        yield with_callback(config, handler)
+    except BaseException as e:
+        registry.record(handler, error=e)
+        raise
+    registry.record(handler)
@@ -0,0 +1,202 @@
+"""
+Durable local job queue for multi-process email processing.
+
+Parsed emails are enqueued as jobs in a SQLite table (WAL mode, shared by every
+process on the host), keyed by message_id so enqueueing the same email twice is
+a no-op. A worker claims a job with a lease that expires after the visibility
+timeout; a worker that crashes or hangs loses its lease and the job becomes
+claimable again, so every email is processed at least once. Failed jobs are
+retried with backoff and dead-lettered after max_attempts.
+
+Delivery is at-least-once: a worker that dies after finishing an email but
+before complete() leaves the job to be claimed again. Emails that went through
+the supervisor graph are checkpointed under the message_id (see
+definitions.process_email), so that second run returns the saved result.
+Emails routed by the pre-classifier fast path are not checkpointed and run
+again; their OCR and text-extraction results come from tool_cache, but the
+model calls are repeated.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+QUEUE_DB = os.getenv("QUEUE_DB", "email_queue.sqlite")
+DEFAULT_VISIBILITY_TIMEOUT = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", 600))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+DEFAULT_RETRY_DELAY = 30.0
+
+QUEUED, LEASED, DONE, DEAD = "queued", "leased", "done", "dead"
+
+Job = namedtuple("Job", ["message_id", "email", "attempts", "lease_expires"])
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with leases. Each process opens its own JobQueue on
+    the same path; one instance must not be shared between threads.
+    """
+
+    def __init__(self, path=QUEUE_DB, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " message_id TEXT PRIMARY KEY, email TEXT NOT NULL, status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL,"
+            " lease_owner TEXT, lease_expires REAL, last_error TEXT, result TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, available_at)")
+
+    def enqueue(self, email):
+        """
+        Adds a parsed email (a dict with a message_id) as a job. Returns False when
+        a job for that message_id already exists, whatever its status.
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (message_id, email, status, available_at, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (email['message_id'], json.dumps(email, default=str), QUEUED, now, now, now),
+        )
+        return cursor.rowcount == 1
+
+    def enqueue_many(self, emails):
+        """
+        Enqueues emails in one transaction: when it returns, all of them are in
+        the queue; when it raises, none are. Returns the number that were new.
+        """
+        with self._transaction():
+            return sum(self.enqueue(email) for email in emails)
+
+    def claim(self, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """
+        Leases the oldest claimable job to worker_id for visibility_timeout seconds:
+        a queued job that is due, or a leased job whose lease expired. Jobs whose
+        lease expired on their last attempt are dead-lettered instead.
+        Returns a Job, or None when nothing is claimable.
+        """
+        now = time.time()
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, updated = ?"
+                " WHERE status = ? AND lease_expires <= ? AND attempts >= ?",
+                (DEAD, "lease expired on the last attempt (worker crashed or timed out)", now,
+                 LEASED, now, self.max_attempts),
+            )
+            row = self._conn.execute(
+                "SELECT message_id, email, attempts FROM jobs"
+                " WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires <= ?)"
+                " ORDER BY available_at LIMIT 1",
+                (QUEUED, now, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            message_id, email, attempts = row
+            lease_expires = now + visibility_timeout
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, lease_owner = ?, lease_expires = ?, updated = ?"
+                " WHERE message_id = ?",
+                (LEASED, attempts + 1, worker_id, lease_expires, now, message_id),
+            )
+        return Job(message_id, json.loads(email), attempts + 1, lease_expires)
+
+    def extend_lease(self, message_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Pushes back the lease of a job worker_id still holds. Returns False if the lease was lost."""
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ?"
+            " WHERE message_id = ? AND status = ? AND lease_owner = ?",
+            (now + visibility_timeout, now, message_id, LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, message_id, worker_id, result=None):
+        """
+        Marks a leased job done and stores its JSON-serializable result. Returns
+        False (and changes nothing) if worker_id no longer holds the lease.
+        """
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL,"
+            " last_error = NULL, updated = ? WHERE message_id = ? AND status = ? AND lease_owner = ?",
+            (DONE, json.dumps(result, default=str), time.time(), message_id, LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, message_id, worker_id, error, retry_delay=DEFAULT_RETRY_DELAY):
+        """
+        Records a failed attempt. The job is retried after retry_delay * 2**(attempts - 1)
+        seconds, or dead-lettered once it has used max_attempts. Returns the new
+        status, or None if worker_id no longer holds the lease.
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE message_id = ? AND status = ? AND lease_owner = ?",
+                (message_id, LEASED, worker_id),
+            ).fetchone()
+            if row is None:
+                return None
+            status = DEAD if row[0] >= self.max_attempts else QUEUED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL,"
+                " last_error = ?, updated = ? WHERE message_id = ?",
+                (status, now + retry_delay * 2 ** (row[0] - 1), str(error), now, message_id),
+            )
+        return status
+
+    def requeue_dead(self, message_ids=None):
+        """Puts dead-lettered jobs (all, or the given ones) back in the queue with fresh attempts."""
+        now = time.time()
+        query = "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated = ? WHERE status = ?"
+        params = [QUEUED, now, now, DEAD]
+        if message_ids is not None:
+            message_ids = list(message_ids)
+            query += f" AND message_id IN ({', '.join('?' * len(message_ids))})"
+            params.extend(message_ids)
+        return self._conn.execute(query, params).rowcount
+
+    def dead_letters(self):
+        """(message_id, attempts, last_error) of every dead-lettered job."""
+        return self._conn.execute(
+            "SELECT message_id, attempts, last_error FROM jobs WHERE status = ? ORDER BY updated", (DEAD,)
+        ).fetchall()
+
+    def result(self, message_id):
+        """The stored result of a finished job, or None."""
+        row = self._conn.execute(
+            "SELECT result FROM jobs WHERE message_id = ? AND status = ?", (message_id, DONE)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge_done(self, older_than_seconds):
+        """Deletes finished jobs last updated more than older_than_seconds ago. Returns the number removed."""
+        return self._conn.execute(
+            "DELETE FROM jobs WHERE status = ? AND updated < ?", (DONE, time.time() - older_than_seconds)
+        ).rowcount
+
+    def stats(self):
+        counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, LEASED, DONE, DEAD)}
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes cannot
+        # read the same claimable row and both lease it
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
@@ -0,0 +1,84 @@
+"""
+None-pruning for large OCR payloads without deep recursion.
+
+The recursive remove_none_values rebuilt every container through the call stack,
+so deeply nested output could hit the recursion limit. The functions here walk
+the tree with an explicit stack. prune_none_inplace avoids the second copy
+altogether, and loads_pruned drops Nones while the JSON is being parsed, so the
+None-laden tree is never built.
+"""
+import json
+
+_CONTAINERS = (dict, list)
+
+
+def remove_none_values(obj):
+    """
+    Returns a copy of obj with None dict values and None list elements removed
+    at every depth. Iterative, so nesting depth is not limited by the stack.
+    """
+    if not isinstance(obj, _CONTAINERS):
+        return obj
+    root = {} if isinstance(obj, dict) else []
+    stack = [(obj, root)]
+    while stack:
+        src, dst = stack.pop()
+        if isinstance(src, dict):
+            for k, v in src.items():
+                if v is None:
+                    continue
+                if isinstance(v, _CONTAINERS):
+                    child = {} if isinstance(v, dict) else []
+                    stack.append((v, child))
+                    v = child
+                dst[k] = v
+        else:
+            for elem in src:
+                if elem is None:
+                    continue
+                if isinstance(elem, _CONTAINERS):
+                    child = {} if isinstance(elem, dict) else []
+                    stack.append((elem, child))
+                    elem = child
+                dst.append(elem)
+    return root
+
+
+def prune_none_inplace(obj):
+    """Removes None values from obj in place, at every depth. Returns obj."""
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k in [k for k, v in node.items() if v is None]:
+                del node[k]
+            stack.extend(v for v in node.values() if isinstance(v, _CONTAINERS))
+        elif isinstance(node, list):
+            node[:] = [elem for elem in node if elem is not None]
+            stack.extend(elem for elem in node if isinstance(elem, _CONTAINERS))
+    return obj
+
+
+def _prune_lists(value):
+    """
+    Drops None elements from value and any lists nested directly inside it.
+    Dicts inside are left alone: the object_hook has already pruned them.
+    """
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        node[:] = [elem for elem in node if elem is not None]
+        stack.extend(elem for elem in node if isinstance(elem, list))
+    return value
+
+
+def _object_hook(pairs):
+    return {k: _prune_lists(v) if isinstance(v, list) else v for k, v in pairs.items() if v is not None}
+
+
+def loads_pruned(text):
+    """json.loads that drops None values while parsing. Equivalent to remove_none_values(json.loads(text))."""
+    obj = json.loads(text, object_hook=_object_hook)
+    if isinstance(obj, list):
+        _prune_lists(obj)
+    return obj
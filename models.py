@@ -0,0 +1,117 @@
+"""
+Shared chat model clients.
+
+langchain_openai (and the openai SDK under it) is the slowest import in the
+tree, so it is only imported when the first client is built, not when
+definitions or tools are imported. Every caller asking for the same model gets
+the same ChatOpenAI instance, and with it one pooled HTTP connection pool per
+model instead of one per module. Every request goes through the shared
+"openai" limiter (rate_limit.py), so all models stay within one RPM/TPM budget.
+
+    model = get_chat_model()            # gpt-4, temperature 0
+    set_chat_model(FakeChatModel())     # benchmarks and tests
+
+Each graph node has its own model tiers (NODE_MODELS): the first model answers
+and the later ones are the escalation path of cascade.structured_cascade.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from cache import ResponseCache, ResultCache
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+# Connections kept open to the OpenAI API, shared by every thread and task using a model.
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", 32))
+
+# Small, fast first-pass model for the tiered nodes.
+CHEAP_MODEL = os.getenv("OPENAI_CHEAP_MODEL", "gpt-4o-mini")
+
+# Model tiers per graph node, cheapest first. Override a node with a comma-separated
+# MODEL_<NODE> variable, e.g. MODEL_ROUTER="gpt-4" (no cascade) or
+# MODEL_TEXT_EXTRACTION="gpt-4o-mini,gpt-4". Only the structured-output nodes
+# (router, acknowledgment, text_extraction in direct mode) escalate; the tool-calling
+# nodes use their first model.
+NODE_MODELS = {
+    "router": (CHEAP_MODEL, DEFAULT_MODEL),
+    "acknowledgment": (CHEAP_MODEL, DEFAULT_MODEL),
+    "text_extraction": (DEFAULT_MODEL,),
+    "document_processor": (DEFAULT_MODEL,),
+    "supervisor": (DEFAULT_MODEL,),
+}
+
+# Local LLM response cache keyed on the normalized prompt; RESPONSE_CACHE_PATH="" disables it.
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite")
+
+_clients = {}
+_response_cache = None
+_lock = threading.Lock()
+
+
+def _get_response_cache():
+    global _response_cache
+    if _response_cache is None and RESPONSE_CACHE_PATH:
+        _response_cache = ResponseCache(ResultCache(
+            RESPONSE_CACHE_PATH,
+            ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+        ))
+    return _response_cache
+
+
+def get_response_cache():
+    """Returns the shared ResponseCache, or None when RESPONSE_CACHE_PATH is empty."""
+    with _lock:
+        return _get_response_cache()
+
+
+def _build_chat_model(name, temperature):
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    from rate_limit import AsyncRateLimitedTransport, RateLimitedTransport, get_limiter
+
+    limits = httpx.Limits(max_connections=MODEL_POOL_SIZE, max_keepalive_connections=MODEL_POOL_SIZE)
+    limiter = get_limiter("openai")
+    return ChatOpenAI(
+        model=name,
+        temperature=temperature,
+        verbose=True,
+        cache=_get_response_cache(),
+        http_client=httpx.Client(transport=RateLimitedTransport(limiter, httpx.HTTPTransport(limits=limits))),
+        http_async_client=httpx.AsyncClient(
+            transport=AsyncRateLimitedTransport(limiter, httpx.AsyncHTTPTransport(limits=limits))
+        ),
+    )
+
+
+def get_chat_model(name=None, temperature=0):
+    """Returns the shared client for (name, temperature), building it on first use."""
+    key = (name or DEFAULT_MODEL, temperature)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _build_chat_model(*key)
+        return client
+
+
+def set_chat_model(client, name=None, temperature=0):
+    """Makes client the shared model for (name, temperature), e.g. a fakes.FakeChatModel."""
+    with _lock:
+        _clients[(name or DEFAULT_MODEL, temperature)] = client
+
+
+def node_model_names(node):
+    """Model names for node, cheapest first: MODEL_<NODE> when set, else NODE_MODELS."""
+    override = os.getenv(f"MODEL_{node.upper()}")
+    if override:
+        names = tuple(name.strip() for name in override.split(",") if name.strip())
+        if names:
+            return names
+    return NODE_MODELS[node]
+
+
+def get_node_tiers():
+    """{node: [shared chat model per tier]} for every node in NODE_MODELS."""
+    return {node: [get_chat_model(name) for name in node_model_names(node)] for node in NODE_MODELS}
@@ -0,0 +1,102 @@
+"""
+Concurrent OCR backend for the document tools.
+
+Multi-page PDFs become one PNG per page, so a single email used to make N serial
+OCR round trips. OCRClient sends all pages of a request in parallel over one
+pooled HTTP session, so per-email latency is roughly that of a single page.
+
+Wire format: each page is POSTed as raw bytes to {OCR_API_URL}/ocr with the
+request name and file name as query parameters; the response body is the OCR
+JSON for that page.
+
+Every page is admitted by the shared "ocr" limiter (rate_limit.py) in the
+caller's priority lane; a 429 pauses the limiter for the server's Retry-After
+and the page is retried.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from json_prune import loads_pruned
+from rate_limit import RATE_LIMIT_RETRIES, current_priority, get_limiter, priority
+
+DEFAULT_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", 8))
+DEFAULT_TIMEOUT = float(os.getenv("OCR_TIMEOUT_SECONDS", 120))
+
+
+class OCRClient:
+    """Thread-safe OCR client with a pooled session and a bounded worker pool."""
+
+    def __init__(self, base_url, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT, api_key=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr')
+
+    def recognize(self, image_path, request_name):
+        """OCRs one image. Returns the parsed JSON result with None values removed."""
+        limiter = get_limiter("ocr")
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with limiter.call() as call, open(image_path, 'rb') as f:
+                response = self.session.post(
+                    f"{self.base_url}/ocr",
+                    params={'name': int(request_name), 'filename': os.path.basename(image_path)},
+                    data=f,
+                    headers={'Content-Type': 'application/octet-stream'},
+                    timeout=self.timeout,
+                )
+                call.observe(response.status_code, response.headers)
+            if response.status_code != 429:
+                break
+        response.raise_for_status()
+        return loads_pruned(response.text)
+
+    def _recognize_or_error(self, job):
+        image_path, request_name, lane = job
+        try:
+            with priority(lane):
+                return self.recognize(image_path, request_name)
+        except Exception as e:
+            print(f"ERROR: OCR failed for '{image_path}': {e}")
+            return {"error": f"OCR failed: {e}"}
+
+    def recognize_pages(self, jobs):
+        """
+        OCRs (image_path, request_name) jobs concurrently. Returns one result per
+        job, in input order; a page that fails yields {"error": ...} instead of
+        failing the batch. Pages run in the caller's priority lane.
+        """
+        lane = current_priority()
+        return list(self.executor.map(self._recognize_or_error, [(*job, lane) for job in jobs]))
+
+    def recognize_many(self, image_paths, request_name):
+        """OCRs all images with the same request name. See recognize_pages."""
+        return self.recognize_pages([(path, request_name) for path in image_paths])
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ocr_client():
+    """Returns the shared OCRClient configured from OCR_API_URL, or None when it is unset."""
+    global _client
+    base_url = os.getenv("OCR_API_URL")
+    if not base_url:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = OCRClient(base_url, api_key=os.getenv("OCR_API_KEY"))
+        return _client
@@ -0,0 +1,87 @@
+"""
+Tool payloads passed by reference instead of through the message history.
+
+In compact state mode the document tools are wrapped with by_reference: the
+full OCR result is written to the graph's store and the agent only sees a small
+reference ({"payload_ref": ..., "files": [...], "fields": [...]}). The agent
+copies that reference into its final JSON, and resolve_payloads swaps the
+stored result back in once the agent is done, so large tool outputs are never
+paid for as prompt or completion tokens.
+"""
+import uuid
+
+from langchain_core.tools import StructuredTool
+from langgraph.config import get_store
+
+PAYLOAD_NAMESPACE = ("tool_payloads",)
+
+
+def _current_store():
+    try:
+        return get_store()
+    except RuntimeError:
+        # Called outside a graph run (e.g. the batch path): no store to write to
+        return None
+
+
+def _summary(result):
+    """File names and field names of a {file_name: result} tool output."""
+    if not isinstance(result, dict):
+        return {}
+    fields = set()
+    for value in result.values():
+        if isinstance(value, dict):
+            fields.update(value)
+    return {"files": list(result), "fields": sorted(fields)}
+
+
+def store_payload(result, store=None):
+    """Puts result in the store and returns its reference, or result itself when there is no store."""
+    store = store or _current_store()
+    if store is None:
+        return result
+    ref = uuid.uuid4().hex
+    store.put(PAYLOAD_NAMESPACE, ref, {"value": result})
+    return {"payload_ref": ref, **_summary(result)}
+
+
+def by_reference(tool):
+    """A copy of tool (same name, description and arguments) whose output is stored by reference."""
+    def run(**kwargs):
+        return store_payload(tool.invoke(kwargs))
+
+    return StructuredTool.from_function(
+        func=run,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+    )
+
+
+def resolve_payloads(obj, store=None):
+    """
+    Returns obj with every {"payload_ref": ...} object replaced by the stored
+    payload. Unknown references are left as they are. Iterative, like json_prune.
+    """
+    store = store or _current_store()
+    if store is None:
+        return obj
+
+    def lookup(node):
+        if isinstance(node, dict) and isinstance(node.get("payload_ref"), str):
+            item = store.get(PAYLOAD_NAMESPACE, node["payload_ref"])
+            if item is not None:
+                return item.value["value"]
+        return node
+
+    root = [lookup(obj)]
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        keys = node.keys() if isinstance(node, dict) else range(len(node))
+        for key in keys:
+            value = lookup(node[key])
+            node[key] = value
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+    return root[0]
@@ -0,0 +1,285 @@
+"""
+Streaming email pipeline: fetch -> parse -> classify -> extract -> sink.
+
+Each stage runs as asyncio tasks connected by bounded queues, so a slow stage
+applies backpressure all the way back to the Gmail listing and memory stays
+flat however large the backlog is. Every finished email is written to the
+sink straight away as one record holding the parsed final agent JSON (not the
+LangChain message list), so downstream systems see results within seconds.
+
+    service = authenticate_gmail()
+    stats = process_mailbox(service, 'from:ops@carrier.com in:inbox', 'results.jsonl')
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from schemas import final_result
+from utils import (
+    BATCH_MODIFY_LIMIT,
+    _add_attachment_paths,
+    _mark_messages_read,
+    download_attachment,
+    get_email_details,
+    iter_message_ids,
+    parse_email_content,
+    worker_clients,
+)
+
+# Records written between checkpoint maintenance calls (see run_pipeline)
+MAINTAIN_EVERY = 500
+
+_STOP = object()
+
+
+def final_output(messages):
+    """
+    The final agent answer of a message list as a validated result dict (see
+    schemas.final_result). Answers that do not validate against any intent's
+    result model come back as {"raw": text}.
+    """
+    result = final_result(messages)
+    if result is None:
+        return {"raw": messages[-1].content if messages else ""}
+    return result.model_dump(mode="json")
+
+
+def _record(email, decision=None, output=None, error=None):
+    # A result carrying an error (schemas.ErrorResult, an agent's error dict) is a
+    # failure: counted as an error and never marked read
+    if error is None and isinstance(output, dict):
+        error = output.get("error")
+    record = {
+        "message_id": email.get('message_id'),
+        "subject": email.get('subject'),
+        "sender": email.get('sender'),
+        "date": email.get('date'),
+        "agent": getattr(decision, 'agent', None),
+        "document_type": getattr(decision, 'document_type', None),
+        "result": output,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if error is not None:
+        record["error"] = str(error)
+    return record
+
+
+class JsonlSink:
+    """Appends one JSON line per record and flushes it, so readers can tail the file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Writes records to a Parquet file in row groups of batch_size. result is kept
+    as a JSON string column, since its shape depends on the intent. Needs pyarrow.
+    """
+
+    def __init__(self, path, batch_size=256):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetSink needs pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._schema = pa.schema([
+            (name, pa.string()) for name in
+            ("message_id", "subject", "sender", "date", "agent", "document_type", "result", "finished_at", "error")
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self.batch_size = batch_size
+        self._rows = []
+
+    def write(self, record):
+        row = dict(record, result=json.dumps(record.get("result"), default=str))
+        self._rows.append({name: row.get(name) for name in self._schema.names})
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_sink(path):
+    """A ParquetSink for *.parquet paths, a JsonlSink otherwise."""
+    return ParquetSink(path) if path.endswith('.parquet') else JsonlSink(path)
+
+
+async def _next_id(iterator):
+    return await asyncio.to_thread(next, iterator, _STOP)
+
+
+async def run_pipeline(service, message_ids, sink, save_path='.', fetch_workers=8, extract_workers=8,
+                       classify_batch=8, queue_size=32, max_retries=5, service_factory=None,
+                       mark_as_read=False, route=None, run=None, maintain=None):
+    """
+    Streams message_ids (any iterable, e.g. utils.iter_message_ids) through the
+    pipeline and writes one record per email to sink (see JsonlSink).
+
+    fetch_workers threads fetch and parse messages, downloading attachments; a
+    message whose details or attachments cannot be fetched becomes an error
+    record (never marked read).
+    One classifier routes up to classify_batch parsed emails per call.
+    extract_workers tasks run the routed agents. queue_size bounds every queue
+    between stages.
+
+    route and run default to definitions.aroute_emails and definitions.arun_route;
+    maintain, called every MAINTAIN_EVERY records and at the end, then defaults
+    to definitions.maintain_checkpoints.
+    service_factory, and the per-thread streaming attachment session, work as in
+    utils.ingest_messages_concurrent. With
+    mark_as_read, written messages lose their UNREAD label in batchModify chunks.
+    Returns {"processed", "errors", "elapsed_seconds"}.
+    """
+    if route is None or run is None:
+        import definitions
+        route = route or definitions.aroute_emails
+        run = run or definitions.arun_route
+        maintain = maintain or definitions.maintain_checkpoints
+
+    ids_queue = asyncio.Queue(queue_size)
+    parsed_queue = asyncio.Queue(queue_size)
+    routed_queue = asyncio.Queue(queue_size)
+    results_queue = asyncio.Queue(queue_size)
+    stats = {"processed": 0, "errors": 0}
+    start = time.perf_counter()
+
+    worker_service, worker_session = worker_clients(service, service_factory)
+
+    def fetch_and_parse(message_id):
+        detail = get_email_details(worker_service(), message_id, max_retries=max_retries)
+        if not detail:
+            return None
+        email = parse_email_content(worker_service(), detail, save_path, fetch_attachments=False)
+        email['message_id'] = message_id
+        # As in utils.ingest_messages_concurrent, an email missing an attachment is
+        # a failed fetch (an error record), never processed without it
+        for attachment_id, filename in email.pop('pending_attachments'):
+            saved = download_attachment(
+                worker_service(), message_id, attachment_id, filename, save_path,
+                max_retries=max_retries, session=worker_session(),
+            )
+            if not saved:
+                raise RuntimeError(f"attachment '{filename}' could not be downloaded")
+            _add_attachment_paths(email, saved)
+        return email
+
+    pool = ThreadPoolExecutor(max_workers=fetch_workers)
+    loop = asyncio.get_running_loop()
+
+    async def produce():
+        iterator = iter(message_ids)
+        while (message_id := await _next_id(iterator)) is not _STOP:
+            await ids_queue.put(message_id)
+        for _ in range(fetch_workers):
+            await ids_queue.put(_STOP)
+
+    async def fetch():
+        while (message_id := await ids_queue.get()) is not _STOP:
+            try:
+                email = await loop.run_in_executor(pool, fetch_and_parse, message_id)
+            except Exception as e:
+                email, error = None, e
+            else:
+                error = None if email else "message could not be fetched"
+            if email is None:
+                await results_queue.put(_record({'message_id': message_id}, error=error))
+            else:
+                await parsed_queue.put(email)
+
+    async def fetch_stage():
+        await asyncio.gather(*(fetch() for _ in range(fetch_workers)))
+        await parsed_queue.put(_STOP)
+
+    async def classify():
+        done = False
+        while not done:
+            batch = [await parsed_queue.get()]
+            while len(batch) < classify_batch and not parsed_queue.empty():
+                batch.append(parsed_queue.get_nowait())
+            if batch[-1] is _STOP:
+                batch.pop()
+                done = True
+            if batch:
+                try:
+                    decisions = await route(batch)
+                except Exception as e:
+                    decisions = [e] * len(batch)
+                for email, decision in zip(batch, decisions):
+                    await routed_queue.put((email, decision))
+        for _ in range(extract_workers):
+            await routed_queue.put(_STOP)
+
+    async def extract():
+        while (job := await routed_queue.get()) is not _STOP:
+            email, decision = job
+            if isinstance(decision, Exception):
+                await results_queue.put(_record(email, error=decision))
+                continue
+            try:
+                result = await run(email, decision)
+                record = _record(email, decision, output=final_output(result["messages"]))
+            except Exception as e:
+                record = _record(email, decision, error=e)
+            await results_queue.put(record)
+
+    async def extract_stage():
+        await asyncio.gather(*(extract() for _ in range(extract_workers)))
+        await results_queue.put(_STOP)
+
+    async def write():
+        to_mark = []
+        while (record := await results_queue.get()) is not _STOP:
+            sink.write(record)
+            stats["errors" if "error" in record else "processed"] += 1
+            if maintain is not None and (stats["errors"] + stats["processed"]) % MAINTAIN_EVERY == 0:
+                await asyncio.to_thread(maintain)
+            if mark_as_read and "error" not in record:
+                to_mark.append(record["message_id"])
+                if len(to_mark) >= BATCH_MODIFY_LIMIT:
+                    await asyncio.to_thread(_mark_messages_read, service, to_mark, max_retries)
+                    to_mark = []
+        if to_mark:
+            await asyncio.to_thread(_mark_messages_read, service, to_mark, max_retries)
+        if maintain is not None:
+            await asyncio.to_thread(maintain)
+
+    try:
+        await asyncio.gather(produce(), fetch_stage(), classify(), extract_stage(), write())
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    stats["elapsed_seconds"] = time.perf_counter() - start
+    return stats
+
+
+def process_mailbox(service, query, sink_path, save_path='.', **kwargs):
+    """
+    Synchronous entry point: streams every message matching query through
+    run_pipeline into the JSONL (or *.parquet) file at sink_path.
+    Returns the run_pipeline stats.
+    """
+    sink = open_sink(sink_path)
+    try:
+        return asyncio.run(run_pipeline(
+            service, iter_message_ids(service, query), sink, save_path=save_path, **kwargs
+        ))
+    finally:
+        sink.close()
@@ -0,0 +1,164 @@
+"""
+Deterministic fast-path intent classifier that runs in front of the LLM supervisor.
+
+Most of supervisor_prompt is keyword rules. This module applies the unambiguous
+ones with compiled regexes plus the has_attachments flag from
+utils.parse_email_content. An email is fast-pathed only when every rule that
+fired agrees on one agent (and, for document extraction, on one document type);
+anything else returns None and goes to the LLM supervisor.
+
+email_priority picks the rate-limit lane (rate_limit.py) an email's model and
+OCR calls run in, so time-sensitive operational updates go first.
+"""
+import re
+import threading
+from collections import Counter, namedtuple
+
+from rate_limit import LOW, NORMAL, URGENT
+
+DOCUMENT_PROCESSOR = "document_processor_agent"
+TEXT_EXTRACTOR = "text_extractor_agent"
+ACKNOWLEDGMENT = "acknowledgment_agent"
+
+FastRoute = namedtuple("FastRoute", ["agent", "document_type", "rules"])
+
+Rule = namedtuple("Rule", ["name", "agent", "pattern", "attachments"])
+
+
+def _compile(*phrases):
+    return re.compile(r"\b(?:" + "|".join(phrases) + r")\b", re.IGNORECASE)
+
+
+# attachments: True -> rule only applies when the email has attachments,
+# False -> only when it has none, None -> always.
+RULES = [
+    Rule("training_data", ACKNOWLEDGMENT, _compile(
+        r"for training", r"train(?:ing)? (?:the|our|your) model", r"use (?:this|these|it) to train",
+        r"sample (?:document|doc|bol|invoice|receipt|label)s?", r"training (?:data|purposes|sample)",
+    ), None),
+    Rule("reference_sharing", ACKNOWLEDGMENT, _compile(
+        r"fyi", r"for (?:your )?reference", r"for your information", r"no action (?:is )?(?:required|needed)",
+    ), None),
+    Rule("document_notification", ACKNOWLEDGMENT, _compile(
+        r"(?:attached is|here is|here's|please find) your (?:invoice|receipt|order confirmation|bol|bill of lading)",
+        r"your (?:invoice|receipt|order confirmation)(?: for [^.\n]{0,40})? (?:is|are) attached",
+    ), True),
+    Rule("non_logistics", ACKNOWLEDGMENT, _compile(
+        r"unsubscribe", r"happy hour", r"team lunch", r"newsletter", r"webinar", r"open enrollment",
+    ), None),
+    Rule("extraction_request", DOCUMENT_PROCESSOR, _compile(
+        r"(?:please|kindly|can you|could you|need you to) (?:extract|process|parse|pull|record|enter|get the (?:data|details))",
+        r"process the attached", r"extract (?:the )?(?:data|details|information|vendor details)",
+        r"pull (?:the )?(?:data|details|information) from", r"analy[sz]e the (?:document|attachment)",
+        r"add (?:it |this |them )?to (?:the |our )?(?:database|system)", r"update our system",
+        r"enter (?:it |this |them )?into", r"fill this file", r"in our records",
+        r"get the details from the attachment",
+    ), True),
+    Rule("operational_update", TEXT_EXTRACTOR, _compile(
+        r"delayed", r"new eta", r"rescheduled", r"appointment (?:changed|moved|rescheduled)",
+        r"please confirm (?:this|the) (?:rate|quote|pickup|appointment)", r"do you accept this (?:rate|quote)",
+        r"can you confirm (?:the )?pickup", r"please schedule (?:the )?delivery",
+    ), False),
+]
+
+# Operational updates that lose value by waiting: delays, new ETAs, moved appointments.
+TIME_SENSITIVE = _compile(
+    r"delay(?:ed|s)?", r"new eta", r"eta (?:changed|moved|update[ds]?)", r"reschedul(?:e|ed|ing)",
+    r"appointment (?:changed|moved|cancell?ed|rescheduled)", r"missed (?:pickup|delivery|appointment)",
+    r"urgent", r"asap",
+)
+
+DOCUMENT_TYPES = [
+    ("bol", re.compile(r"\b(?:bol|bols|bill of lading|bills of lading)\b", re.IGNORECASE)),
+    ("shipping_label", re.compile(r"\bshipping labels?\b", re.IGNORECASE)),
+    ("item_label", re.compile(r"\bitem labels?\b", re.IGNORECASE)),
+    ("invoice", re.compile(r"\binvoices?\b", re.IGNORECASE)),
+    ("receipt", re.compile(r"\breceipts?\b", re.IGNORECASE)),
+]
+
+
+class PreclassifierStats:
+    """Thread-safe counters of rule hits, fast-path routes and LLM fallbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.fast_path = 0
+        self.rule_hits = Counter()
+        self.routes = Counter()
+
+    def record(self, fired, route):
+        with self._lock:
+            self.total += 1
+            self.rule_hits.update(fired)
+            if route is not None:
+                self.fast_path += 1
+                self.routes[route.agent] += 1
+
+    def report(self):
+        """Returns counts and hit rates (fraction of classified emails) per rule."""
+        with self._lock:
+            total = self.total or 1
+            return {
+                "total": self.total,
+                "fast_path": self.fast_path,
+                "fallback": self.total - self.fast_path,
+                "coverage": self.fast_path / total,
+                "routes": dict(self.routes),
+                "rule_hit_rates": {rule.name: self.rule_hits[rule.name] / total for rule in RULES},
+            }
+
+
+stats = PreclassifierStats()
+
+
+def detect_document_type(text):
+    """Returns the single document type mentioned in text, or None if zero or several match."""
+    found = [doc_type for doc_type, pattern in DOCUMENT_TYPES if pattern.search(text)]
+    return found[0] if len(found) == 1 else None
+
+
+def preclassify(email_data, stats=stats):
+    """
+    Classifies a parsed email dict without an LLM call.
+    Returns a FastRoute when the rules are unanimous, otherwise None.
+    """
+    has_attachments = bool(email_data.get('has_attachments'))
+    text = f"{email_data.get('subject') or ''}\n{email_data.get('body') or ''}"
+
+    fired = [
+        rule for rule in RULES
+        if (rule.attachments is None or rule.attachments == has_attachments) and rule.pattern.search(text)
+    ]
+    agents = {rule.agent for rule in fired}
+
+    route = None
+    if len(agents) == 1:
+        agent = agents.pop()
+        document_type = None
+        if agent == DOCUMENT_PROCESSOR:
+            names = " ".join(email_data.get('attachment_paths') or [])
+            document_type = detect_document_type(f"{text}\n{names}")
+        if agent != DOCUMENT_PROCESSOR or document_type:
+            route = FastRoute(agent, document_type, tuple(rule.name for rule in fired))
+
+    if stats is not None:
+        stats.record([rule.name for rule in fired], route)
+    return route
+
+
+def email_priority(email_data, agent=None):
+    """
+    Rate-limit lane for an email: LOW for acknowledgments, URGENT for
+    time-sensitive text-extraction emails, NORMAL otherwise. agent is the routed
+    agent, or None when the supervisor has not decided yet.
+    """
+    if agent == ACKNOWLEDGMENT:
+        return LOW
+    text = f"{email_data.get('subject') or ''}\n{email_data.get('body') or ''}"
+    if agent in (None, TEXT_EXTRACTOR) and not email_data.get('has_attachments') and TIME_SENSITIVE.search(text):
+        return URGENT
+    return NORMAL
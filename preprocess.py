@@ -0,0 +1,178 @@
+"""
+Page preprocessing before OCR upload.
+
+Rendered PDF pages and phone photos used to reach the OCR backend as they came:
+200 DPI full-color PNGs and multi-megabyte camera JPEGs. preprocess_pages
+shrinks every page for its document type (PreprocessSettings, set per type in
+extraction.DOCUMENT_TYPES): uniform borders are cropped, the longer side is
+downscaled to max_side, the page becomes grayscale or 1-bit (Otsu threshold),
+and it is re-encoded. The work is CPU-bound Pillow code, so it runs in a shared
+process pool. Each result is kept next to its source under a name derived from
+the settings, so a page is processed once however often it is extracted. A page
+that would not get smaller is uploaded as it is, and an empty marker file
+records that, so it is not processed again either.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageChops, ImageOps
+
+# max_side: longest side in pixels after downscaling (never upscaled).
+# mode: "color", "gray" or "binary" (1-bit, Otsu threshold).
+# crop: trim borders of the background color, keeping CROP_MARGIN pixels.
+# fmt: "png" or "jpeg"; quality only applies to JPEG.
+PreprocessSettings = namedtuple("PreprocessSettings", ["max_side", "mode", "crop", "fmt", "quality"])
+
+DEFAULT_SETTINGS = PreprocessSettings(max_side=2200, mode="gray", crop=True, fmt="png", quality=None)
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_PAGES", "1") != "0"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", os.cpu_count() or 1))
+CROP_MARGIN = 16
+# Gray levels a pixel must differ from the border color by to count as content.
+CROP_TOLERANCE = 40
+
+EXTENSIONS = {"png": "png", "jpeg": "jpg"}
+
+
+def otsu_threshold(gray):
+    """Gray level that best separates an 'L' image's histogram into two classes."""
+    histogram = gray.histogram()
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = background_sum = 0
+    best, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_sum += level * count
+        mean_background = background_sum / background
+        mean_foreground = (weighted_total - background_sum) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best, best_variance = level, variance
+    return best
+
+
+def content_box(gray, margin=CROP_MARGIN, tolerance=CROP_TOLERANCE):
+    """
+    Bounding box of everything that differs from the border color, plus margin,
+    or None when the page is blank. Found on a 1/4 scale copy, which averages
+    away scanner speckles.
+    """
+    scale = 4
+    small = gray.resize((max(1, gray.width // scale), max(1, gray.height // scale)), Image.BOX)
+    edge = small.crop((0, 0, small.width, 1)).histogram()
+    for strip in ((0, small.height - 1, small.width, small.height), (0, 0, 1, small.height),
+                  (small.width - 1, 0, small.width, small.height)):
+        edge = [a + b for a, b in zip(edge, small.crop(strip).histogram())]
+    background = max(range(256), key=edge.__getitem__)
+    mask = ImageChops.difference(small, Image.new("L", small.size, background))
+    box = mask.point(lambda p: 255 if p > tolerance else 0).getbbox()
+    if box is None:
+        return None
+    left, top, right, bottom = (value * scale for value in box)
+    return (max(0, left - margin), max(0, top - margin),
+            min(gray.width, right + margin), min(gray.height, bottom + margin))
+
+
+def preprocess_image(source, target, settings):
+    """
+    Writes the preprocessed source to target. Returns the path to upload:
+    target, or source when preprocessing would not make the file smaller (then
+    the passthrough_path(target) marker is written instead).
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGB" if settings.mode == "color" else "L")
+    if settings.crop:
+        box = content_box(image if image.mode == "L" else image.convert("L"))
+        if box is not None:
+            image = image.crop(box)
+    if max(image.size) > settings.max_side:
+        image.thumbnail((settings.max_side, settings.max_side), Image.LANCZOS)
+    if settings.mode == "binary":
+        threshold = otsu_threshold(image)
+        image = image.point(lambda p: 255 if p > threshold else 0).convert("1")
+
+    tmp_path = f"{target}.part"
+    if settings.fmt == "jpeg":
+        image.save(tmp_path, format="JPEG", quality=settings.quality or 85, optimize=True)
+    else:
+        image.save(tmp_path, format="PNG", optimize=True)
+    if os.path.getsize(tmp_path) >= os.path.getsize(source):
+        os.remove(tmp_path)
+        open(passthrough_path(target), "w").close()
+        return source
+    os.replace(tmp_path, target)
+    return target
+
+
+def target_path(path, settings):
+    """Where the preprocessed copy of path goes: next to it, named after the settings."""
+    tag = hashlib.sha256(repr(tuple(settings)).encode()).hexdigest()[:8]
+    stem = os.path.splitext(path)[0]
+    return f"{stem}.pre-{tag}.{EXTENSIONS.get(settings.fmt, settings.fmt)}"
+
+
+def passthrough_path(target):
+    """Marker recording that the page at target's source is uploaded unprocessed."""
+    return f"{target}.passthrough"
+
+
+def _run(job):
+    source, target, settings = job
+    try:
+        return preprocess_image(source, target, settings)
+    except Exception as e:
+        print(f"ERROR: Preprocessing failed for '{source}': {e}")
+        return source
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_preprocess_pool():
+    """The shared process pool. Workers are spawned, not forked, since callers are multi-threaded."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def preprocess_pages(jobs, executor=None):
+    """
+    Preprocesses (image_path, settings) jobs, in the shared process pool unless
+    executor is given. Pages already processed with the same settings are reused,
+    as are earlier decisions to upload a page as it is. Returns the path to
+    upload for each job, in input order; a page that fails is uploaded as it is.
+    """
+    uploads = [None] * len(jobs)
+    pending = []
+    for i, (path, settings) in enumerate(jobs):
+        if not PREPROCESS_ENABLED or settings is None:
+            uploads[i] = path
+            continue
+        target = target_path(path, settings)
+        if os.path.exists(target):
+            uploads[i] = target
+        elif os.path.exists(passthrough_path(target)):
+            uploads[i] = path
+        else:
+            pending.append((i, (path, target, settings)))
+    if pending:
+        executor = executor or get_preprocess_pool()
+        for (i, _), upload in zip(pending, executor.map(_run, [job for _, job in pending])):
+            uploads[i] = upload
+    return uploads
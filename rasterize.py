@@ -0,0 +1,121 @@
+"""
+Parallel, streaming PDF rasterization.
+
+convert_from_path on a whole file loads every page into memory as a PIL image.
+Here the PDF is split into page ranges; each range is rendered by its own
+pdftoppm process straight to disk (paths_only=True), so no page is ever decoded
+in Python and peak memory stays flat as the page count grows. The pool only
+waits on pdftoppm subprocesses, so threads are enough to use every core.
+
+Every PDF in the process shares one pool of RASTERIZE_WORKERS threads (default:
+CPU count), so concurrent ingest threads never run more pdftoppm processes
+than there are cores.
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+DEFAULT_DPI = int(os.getenv("PDF_DPI", 200))
+DEFAULT_FORMAT = os.getenv("PDF_FORMAT", "png")
+# Pages are rendered as grayscale: about a third of the disk of color pages, and
+# the preprocessing stage (preprocess.py) drops color for every document type anyway.
+GRAYSCALE = os.getenv("PDF_GRAYSCALE", "1") != "0"
+DEFAULT_PAGES_PER_TASK = 4
+RASTERIZE_WORKERS = int(os.getenv("RASTERIZE_WORKERS", 0)) or os.cpu_count()
+
+# File extension pdftoppm writes for each pdf2image format name.
+EXTENSIONS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "tiff": "tif", "tif": "tif", "ppm": "ppm"}
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide rasterization pool, created on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RASTERIZE_WORKERS, thread_name_prefix="rasterize")
+        return _executor
+
+
+def page_count(pdf_path):
+    return pdfinfo_from_path(pdf_path)["Pages"]
+
+
+def _convert_range(pdf_path, first_page, last_page, output_dir, base_name, dpi, fmt):
+    """Renders pages first_page..last_page to '{base_name}_page{n}.{ext}' files."""
+    prefix = f".{base_name}-{uuid.uuid4().hex}"
+    paths = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        output_folder=output_dir,
+        first_page=first_page,
+        last_page=last_page,
+        fmt=fmt,
+        grayscale=GRAYSCALE,
+        output_file=prefix,
+        paths_only=True,
+    )
+    # pdftoppm zero-pads page numbers within one call, so a lexical sort is page order.
+    pages = []
+    for page, path in zip(range(first_page, last_page + 1), sorted(paths)):
+        target = os.path.join(output_dir, f"{base_name}_page{page}.{EXTENSIONS.get(fmt, fmt)}")
+        os.replace(path, target)
+        pages.append((page, target))
+    return pages
+
+
+def iter_rasterized_pages(pdf_path, dpi=DEFAULT_DPI, fmt=DEFAULT_FORMAT, output_dir=None,
+                          pages_per_task=DEFAULT_PAGES_PER_TASK, max_workers=None, executor=None):
+    """
+    Renders pdf_path in parallel page ranges and yields (page_number, path) as
+    soon as each range is on disk. Ranges finish out of order; pages within a
+    range are yielded in order.
+
+    Ranges run on executor, by default the shared get_executor() pool; with
+    max_workers, a private pool of that size is created for this file instead.
+    """
+    output_dir = output_dir or os.path.dirname(os.path.abspath(pdf_path))
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    total = page_count(pdf_path)
+    ranges = [
+        (first, min(first + pages_per_task - 1, total))
+        for first in range(1, total + 1, pages_per_task)
+    ]
+
+    own_executor = executor is None and max_workers is not None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    executor = executor or get_executor()
+    futures = []
+    try:
+        futures = [
+            executor.submit(_convert_range, pdf_path, first, last, output_dir, base_name, dpi, fmt)
+            for first, last in ranges
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        # Ranges not started yet are dropped when the caller stops early
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+def rasterize_pdf(pdf_path, dpi=DEFAULT_DPI, fmt=DEFAULT_FORMAT, output_dir=None,
+                  pages_per_task=DEFAULT_PAGES_PER_TASK, max_workers=None, executor=None):
+    """
+    Renders every page of pdf_path to disk in parallel.
+    Returns the page file paths in page order.
+    """
+    pages = iter_rasterized_pages(
+        pdf_path, dpi=dpi, fmt=fmt, output_dir=output_dir, pages_per_task=pages_per_task,
+        max_workers=max_workers, executor=executor,
+    )
+    return [path for _, path in sorted(pages)]
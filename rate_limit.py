@@ -0,0 +1,339 @@
+"""
+Shared, adaptive rate limiting for the OpenAI and OCR backends.
+
+Every call to a backend is admitted by that backend's BackendLimiter, shared
+by all threads and event loops in the process:
+
+- token buckets for requests/min and tokens/min, with tokens estimated from
+  the size of the request (prompt, tool schemas and max_tokens);
+- an AIMD concurrency limit: one more slot after `limit` successful calls,
+  halved on a 429 (once per window: 429s of calls admitted before the last
+  decrease are not counted again); a 429 also empties the token buckets and
+  holds new calls until the server's Retry-After has passed;
+- priority lanes: waiting calls are admitted lowest lane first, in arrival
+  order within a lane, so time-sensitive emails go ahead of acknowledgments.
+
+The lane is a context variable set with `with priority(URGENT): ...`, so it
+reaches the calls LangChain and LangGraph make on their worker threads (they
+copy the context). Budgets are per process: with several worker processes,
+give each its share through the environment.
+
+    limiter = get_limiter("openai")
+    with limiter.call(tokens=1200) as call:
+        response = send()
+        call.observe(response.status_code, response.headers)
+"""
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+import httpx
+
+URGENT, NORMAL, LOW = 0, 1, 2
+
+# Pause after a 429 that carries no Retry-After header.
+DEFAULT_RETRY_AFTER = 1.0
+# Times the transports re-send a request answered with 429 (through the limiter again).
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", 5))
+
+# Completion tokens assumed for requests that do not set max_tokens.
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Per-backend defaults, overridable as {NAME}_RPM, {NAME}_TPM, {NAME}_MAX_CONCURRENCY
+# and {NAME}_BURST_SECONDS (e.g. OPENAI_TPM=30000). 0 disables a budget.
+# burst_seconds: how much of the per-minute budget may be spent at once.
+LIMIT_DEFAULTS = {
+    "openai": {"rpm": 500, "tpm": 80000, "max_concurrency": 32, "burst_seconds": 10},
+    "ocr": {"rpm": 600, "tpm": 0, "max_concurrency": 8, "burst_seconds": 10},
+}
+
+_lane = contextvars.ContextVar("rate_limit_lane", default=NORMAL)
+
+
+@contextlib.contextmanager
+def priority(lane):
+    """Runs the block's backend calls in lane (URGENT, NORMAL or LOW)."""
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_priority():
+    return _lane.get()
+
+
+class TokenBucket:
+    """Refills at rate_per_minute up to capacity (one minute's worth by default). Not locked on its own."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        """Seconds until amount (capped at capacity) is available; 0 if it is now."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Call:
+    """Outcome of one admitted call, filled in by observe()."""
+
+    def __init__(self):
+        self.admitted = time.monotonic()
+        self.rate_limited = False
+        self.retry_after = None
+        self.ok = False
+
+    def observe(self, status_code, headers=None):
+        if status_code == 429:
+            self.rate_limited = True
+            self.retry_after = _retry_after(headers or {})
+        else:
+            self.ok = status_code < 500
+
+
+def _retry_after(headers):
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value) * scale
+            except ValueError:
+                return None
+    return None
+
+
+class BackendLimiter:
+    """Token buckets, AIMD concurrency and priority lanes for one backend. Safe to share."""
+
+    def __init__(self, name, rpm=None, tpm=None, max_concurrency=32, min_concurrency=1,
+                 initial_concurrency=None, burst_seconds=10):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.requests = TokenBucket(rpm, max(1, rpm * burst_seconds / 60)) if rpm else None
+        self.tokens = TokenBucket(tpm, max(1, tpm * burst_seconds / 60)) if tpm else None
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._async_waiters = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _try_admit(self, entry, tokens):
+        """0 when entry is admitted, else the longest to wait before trying again (None: until notified)."""
+        if self._waiters[0] != entry or self.in_flight >= max(1, int(self.limit)):
+            return None
+        now = time.monotonic()
+        wait = self._paused_until - now
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None and amount:
+                wait = max(wait, bucket.wait_time(amount, now))
+        if wait > 0:
+            return wait
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None and amount:
+                bucket.take(amount)
+        heapq.heappop(self._waiters)
+        self.in_flight += 1
+        self.calls += 1
+        self._notify()
+        return 0
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    def _leave(self, entry):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+        self._notify()
+
+    def acquire(self, tokens=0, lane=None):
+        """Blocks until a call of tokens may start in lane (default: the current priority)."""
+        start = time.monotonic()
+        with self._cond:
+            entry = (current_priority() if lane is None else lane, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while (wait := self._try_admit(entry, tokens)) != 0:
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(entry)
+                raise
+            self.wait_seconds += time.monotonic() - start
+
+    async def aacquire(self, tokens=0, lane=None):
+        """Async variant of acquire; waits without blocking the event loop."""
+        start = time.monotonic()
+        event = asyncio.Event()
+        with self._cond:
+            entry = (current_priority() if lane is None else lane, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            self._async_waiters[entry] = (asyncio.get_running_loop(), event)
+        try:
+            while True:
+                with self._cond:
+                    event.clear()
+                    wait = self._try_admit(entry, tokens)
+                    if wait == 0:
+                        self.wait_seconds += time.monotonic() - start
+                        return
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(event.wait(), wait)
+        except BaseException:
+            with self._cond:
+                self._leave(entry)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.pop(entry, None)
+
+    def release(self, call):
+        """Frees the call's slot and adapts the concurrency limit to its outcome."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if call.rate_limited:
+                self.rate_limited += 1
+                if call.admitted >= self._last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+                # The server's burst allowance is smaller than ours: pace from empty buckets
+                for bucket in (self.requests, self.tokens):
+                    if bucket is not None:
+                        bucket.tokens = min(bucket.tokens, 0.0)
+                pause = call.retry_after if call.retry_after is not None else DEFAULT_RETRY_AFTER
+                self._paused_until = max(self._paused_until, now + pause)
+            elif call.ok:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._notify()
+
+    @contextlib.contextmanager
+    def call(self, tokens=0, lane=None):
+        """Admits one call; report its HTTP status with call.observe() inside the block."""
+        self.acquire(tokens, lane)
+        call = _Call()
+        try:
+            yield call
+        finally:
+            self.release(call)
+
+    @contextlib.asynccontextmanager
+    async def acall(self, tokens=0, lane=None):
+        """Async variant of call."""
+        await self.aacquire(tokens, lane)
+        call = _Call()
+        try:
+            yield call
+        finally:
+            self.release(call)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": self.name,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """The process-wide limiter for backend name, configured from the environment on first use."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            defaults = LIMIT_DEFAULTS.get(name, LIMIT_DEFAULTS["openai"])
+            settings = {
+                key: float(os.getenv(f"{name.upper()}_{key.upper()}", value)) for key, value in defaults.items()
+            }
+            limiter = _limiters[name] = BackendLimiter(name, **settings)
+        return limiter
+
+
+def estimate_request_tokens(request):
+    """
+    Tokens an OpenAI request counts against TPM: its JSON body at ~4 bytes per
+    token (messages, tool schemas) plus the completion budget.
+    """
+    body = request.content or b""
+    max_tokens = None
+    try:
+        payload = json.loads(body)
+        max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens")
+    except (ValueError, AttributeError):
+        pass
+    return len(body) // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport that admits every request through limiter and re-sends 429s."""
+
+    def __init__(self, limiter, transport=None, estimate=estimate_request_tokens):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport()
+        self.estimate = estimate
+
+    def handle_request(self, request):
+        tokens = self.estimate(request)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with self.limiter.call(tokens) as call:
+                response = self.transport.handle_request(request)
+                call.observe(response.status_code, response.headers)
+            if not call.rate_limited or attempt == RATE_LIMIT_RETRIES:
+                return response
+            response.close()
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async variant of RateLimitedTransport."""
+
+    def __init__(self, limiter, transport=None, estimate=estimate_request_tokens):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.estimate = estimate
+
+    async def handle_async_request(self, request):
+        tokens = self.estimate(request)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            async with self.limiter.acall(tokens) as call:
+                response = await self.transport.handle_async_request(request)
+                call.observe(response.status_code, response.headers)
+            if not call.rate_limited or attempt == RATE_LIMIT_RETRIES:
+                return response
+            await response.aclose()
+
+    async def aclose(self):
+        await self.transport.aclose()
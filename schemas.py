@@ -0,0 +1,233 @@
+"""
+Typed results of the three intents.
+
+Agent answers used to be free-form "JSON objects" described in the prompts, and
+every consumer re-parsed the final message string. Each intent now has a
+result model. Structured-output calls return them through function calling,
+the ReAct agents' final answers are validated at the agent boundary
+(validate_answer), and downstream code reads results back with final_result.
+
+Validators are compiled once: pydantic builds each model's validator with the
+class, the AgentResult union adapter and the partial repair models are built on
+first use and cached. An agent's answer goes straight to pydantic-core
+(model_validate_json) without a json.loads pass. An answer that fails
+validation gets one repair call that asks the model for the failing fields
+only; the valid fields are kept.
+"""
+import functools
+import json
+import re
+from typing import Annotated, Any, Dict, Literal, Optional, Union
+
+from langchain_core.messages import HumanMessage, convert_to_messages
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, Tag, TypeAdapter, ValidationError, create_model
+
+from prompts import REPAIR_PROMPT
+
+DOCUMENT_INTENT = "data_extraction_requested"
+TEXT_INTENT = "text_data_extraction"
+ACKNOWLEDGMENT_INTENT = "informational_acknowledgment"
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+# Structured-output call schemas: what the model fills in through function calling.
+
+class TextExtraction(BaseModel):
+    """Structured output of the direct text-extraction call."""
+    email_summary: str = Field(description="Concise one-line summary of the logistics information.")
+    extracted_data: Dict[str, Any] = Field(
+        description="All logistics information from the email, structured as the content suggests."
+    )
+
+
+class StructuredText(BaseModel):
+    """Structured output of extract_structured_text_tool."""
+    data: Dict[str, Any] = Field(description="The logistics information, structured as the content suggests.")
+
+
+class AcknowledgmentResponse(BaseModel):
+    status: Literal["acknowledged"] = "acknowledged"
+    communication_type: Literal[
+        "business_confirmation", "document_delivery", "training_data", "reference_sharing", "courtesy_info",
+        "non_logistics_business", "personal", "spam_irrelevant",
+    ]
+    message: str = Field(description="Appropriate professional acknowledgment or polite dismissal.")
+    action_taken: Literal[
+        "received_and_filed", "noted_for_records", "forwarded_to_relevant_team", "stored_for_training",
+        "marked_as_irrelevant", "no_action_required",
+    ]
+
+
+class Acknowledgment(BaseModel):
+    """Structured output of the acknowledgment call."""
+    email_summary: str = Field(description="One-line summary of the sender's communication.")
+    relevance: Literal["logistics_related", "non_logistics", "irrelevant"]
+    response: AcknowledgmentResponse
+    confidence: Optional[float] = Field(
+        default=None, ge=0, le=1, description="How sure you are of this classification, from 0 (guess) to 1 (certain)."
+    )
+
+
+# Agent results: the final answer of each agent, as written to the sinks.
+
+class DocumentExtractionResult(BaseModel):
+    """Final answer of document_processor_agent (Intent 1)."""
+    email_summary: str = Field(description="One-line summary of the email request.")
+    processing_intent: Literal["data_extraction_requested"] = DOCUMENT_INTENT
+    tool_outputs: Dict[str, Any] = Field(
+        description="Output of the extraction tool per image file name, exactly as the tool returned it."
+    )
+
+
+class TextExtractionResult(BaseModel):
+    """Final answer of text_extractor_agent (Intent 2)."""
+    email_summary: str = Field(description="Concise one-line summary of the logistics information.")
+    processing_intent: Literal["text_data_extraction"] = TEXT_INTENT
+    extracted_data: Dict[str, Any] = Field(
+        description="The structured output of extract_structured_text_tool, exactly as returned."
+    )
+
+
+class AcknowledgmentResult(BaseModel):
+    """Final answer of acknowledgment_agent (Intent 3)."""
+    email_summary: str
+    processing_intent: Literal["informational_acknowledgment"] = ACKNOWLEDGMENT_INTENT
+    relevance: Literal["logistics_related", "non_logistics", "irrelevant"]
+    response: AcknowledgmentResponse
+
+
+class ErrorResult(BaseModel):
+    """An agent answer that could not be produced or validated."""
+    model_config = ConfigDict(extra="allow")
+    error: str
+
+
+RESULT_MODELS = {
+    "document_processor_agent": DocumentExtractionResult,
+    "text_extractor_agent": TextExtractionResult,
+    "acknowledgment_agent": AcknowledgmentResult,
+}
+
+
+def _result_tag(value):
+    get = value.get if isinstance(value, dict) else functools.partial(getattr, value)
+    return "error" if get("error", None) is not None else get("processing_intent", None)
+
+
+AgentResult = Annotated[
+    Union[
+        Annotated[DocumentExtractionResult, Tag(DOCUMENT_INTENT)],
+        Annotated[TextExtractionResult, Tag(TEXT_INTENT)],
+        Annotated[AcknowledgmentResult, Tag(ACKNOWLEDGMENT_INTENT)],
+        Annotated[ErrorResult, Tag("error")],
+    ],
+    Discriminator(_result_tag),
+]
+
+
+@functools.cache
+def result_adapter():
+    """The cached validator for AgentResult (any intent, or an error), chosen by processing_intent."""
+    return TypeAdapter(AgentResult)
+
+
+def _strip_fence(text):
+    return _FENCE.sub("", text.strip())
+
+
+def parse_result(content):
+    """A final answer (JSON string or dict) as its typed AgentResult, or None when it does not validate."""
+    try:
+        # The union's discriminator picks the model from a dict, so parse first;
+        # validate_json is slower here (benchmarks/bench_validation.py)
+        data = json.loads(_strip_fence(content)) if isinstance(content, str) else content
+        return result_adapter().validate_python(data)
+    except (ValueError, ValidationError):
+        return None
+
+
+def final_result(messages):
+    """The typed result of a message list's final answer (see parse_result)."""
+    return parse_result(messages[-1].content) if messages else None
+
+
+def failing_fields(schema, error):
+    """Top-level fields of schema named in a ValidationError; every field when none is (or error is None)."""
+    fields = set()
+    if isinstance(error, ValidationError):
+        fields = {str(detail["loc"][0]) for detail in error.errors() if detail["loc"]} & schema.model_fields.keys()
+    return tuple(name for name in schema.model_fields if name in fields or not fields)
+
+
+@functools.lru_cache(maxsize=256)
+def repair_model(schema, fields):
+    """schema restricted to fields, so a repair call can only answer those."""
+    return create_model(
+        f"{schema.__name__}Repair",
+        __doc__=f"Corrected values for the invalid fields of {schema.__name__}.",
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fields},
+    )
+
+
+def _error_lines(error):
+    if not isinstance(error, ValidationError):
+        return f"- {error or 'no answer in the required format'}"
+    return "\n".join(
+        f"- {'.'.join(str(part) for part in detail['loc']) or '(answer)'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+def repair(model, schema, data, error, messages):
+    """
+    One repair call: appends the previous answer (data) and its validation errors
+    to the original messages and asks model for the failing fields only, through
+    function calling. Returns the merged answer as a schema instance; raises
+    ValidationError (or the model's parse error) when it is still invalid.
+    """
+    fields = failing_fields(schema, error)
+    fixer = model.with_structured_output(repair_model(schema, fields), method="function_calling")
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    prompt = REPAIR_PROMPT.format(
+        answer=json.dumps(data, default=str) if data is not None else "(none)",
+        errors=_error_lines(error),
+        fields=", ".join(fields),
+    )
+    fixed = fixer.invoke([*convert_to_messages(messages), HumanMessage(content=prompt)])
+    if fixed is None:
+        raise ValueError(f"Repair of {schema.__name__} returned no answer")
+    return schema.model_validate({**(data if isinstance(data, dict) else {}), **fixed.model_dump()})
+
+
+def validate_answer(content, schema, model=None, messages=(), node=None, stats=None):
+    """
+    An agent's final answer (JSON text, optionally fenced) validated against
+    schema. An invalid answer is repaired once with model, given the original
+    messages as context. Returns the schema instance, or an ErrorResult (with
+    the validation errors as detail) when the answer is still invalid or there
+    is no model to repair it with. Invalid answers are counted under node in
+    stats (a cascade.CascadeStats), as repaired or failed.
+    """
+    text = _strip_fence(content) if isinstance(content, str) else json.dumps(content, default=str)
+    try:
+        return schema.model_validate_json(text)
+    except ValidationError as e:
+        error = e
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if model is not None:
+        try:
+            result = repair(model, schema, data, error, messages)
+        except Exception as e:
+            error = e
+        else:
+            if stats is not None:
+                stats.record_repair(node, True)
+            return result
+    if stats is not None:
+        stats.record_repair(node, False)
+    return ErrorResult(error=f"Invalid {schema.__name__} answer", detail=str(error), raw=content)
@@ -0,0 +1,98 @@
+import operator
+import os
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+
+import checkpointing
+import definitions
+from checkpointing import RetentionPolicy, apply_retention, compact, open_checkpointer
+
+
+class Counter(TypedDict):
+    count: Annotated[int, operator.add]
+
+
+def app_on(checkpointer):
+    graph = StateGraph(Counter)
+    graph.add_node("step", lambda state: {"count": 1})
+    graph.add_edge(START, "step")
+    graph.add_edge("step", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def run(app, thread_id, times=1):
+    config = {"configurable": {"thread_id": thread_id}}
+    for _ in range(times):
+        app.invoke({"count": 0}, config)
+    return app.get_state(config).values
+
+
+def counts(checkpointer):
+    rows = checkpointer.conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id")
+    return dict(rows.fetchall())
+
+
+@pytest.fixture
+def checkpointer(tmp_path):
+    checkpointer = open_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+    yield checkpointer
+    checkpointer.conn.close()
+
+
+def test_retention_keeps_the_latest_checkpoints(checkpointer):
+    app = app_on(checkpointer)
+    final = run(app, "a", times=3)
+    assert counts(checkpointer)["a"] > 2
+
+    deleted = apply_retention(checkpointer, RetentionPolicy(keep_last=2, max_threads=None))
+    assert deleted > 0
+    assert counts(checkpointer) == {"a": 2}
+    assert app.get_state({"configurable": {"thread_id": "a"}}).values == final
+    orphans = checkpointer.conn.execute(
+        "SELECT COUNT(*) FROM writes w WHERE NOT EXISTS (SELECT 1 FROM checkpoints c"
+        " WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns"
+        " AND c.checkpoint_id = w.checkpoint_id)"
+    ).fetchone()[0]
+    assert orphans == 0
+
+
+def test_retention_drops_the_oldest_threads(checkpointer):
+    app = app_on(checkpointer)
+    for thread_id in ("old", "middle", "new"):
+        run(app, thread_id)
+
+    apply_retention(checkpointer, RetentionPolicy(keep_last=None, max_threads=2))
+    assert set(counts(checkpointer)) == {"middle", "new"}
+    assert apply_retention(checkpointer, RetentionPolicy(keep_last=None, max_threads=2)) == 0
+
+
+def test_compact_releases_free_pages(checkpointer, tmp_path):
+    app = app_on(checkpointer)
+    for i in range(50):
+        run(app, f"t{i}", times=2)
+    apply_retention(checkpointer, RetentionPolicy(keep_last=1, max_threads=5))
+    compact(checkpointer)
+
+    assert checkpointer.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert os.path.getsize(str(tmp_path / "checkpoints.sqlite-wal")) == 0
+    assert len(counts(checkpointer)) == 5
+
+
+def test_maintain_checkpoints_is_throttled(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoints.sqlite")
+    monkeypatch.setattr(definitions, "CHECKPOINT_DB", path)
+    monkeypatch.setattr(definitions, "_built", {})
+    monkeypatch.setattr(definitions, "_last_maintenance", None)
+    assert definitions.maintain_checkpoints() is None
+    assert not os.path.exists(path)
+
+    run(app_on(definitions.get_checkpointer()), "a", times=3)
+    monkeypatch.setattr(definitions, "maintain", lambda checkpointer, store: checkpointing.maintain(
+        checkpointer, store, RetentionPolicy(keep_last=1, max_threads=None)))
+    assert definitions.maintain_checkpoints() > 0
+    assert counts(definitions.get_checkpointer()) == {"a": 1}
+
+    run(app_on(definitions.get_checkpointer()), "a")
+    assert definitions.maintain_checkpoints() is None
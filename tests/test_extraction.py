@@ -0,0 +1,66 @@
+import pytest
+
+import extraction
+from cache import ResultCache
+
+
+class FakeOCRClient:
+    def __init__(self):
+        self.pages = []
+
+    def recognize_pages(self, pages):
+        self.pages.extend(pages)
+        return [{"bol_no": "BOL-REAL-1", "currency": "USD"} for _ in pages]
+
+
+@pytest.fixture
+def page(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "_tool_cache", ResultCache(str(tmp_path / "tool_cache.sqlite")))
+    monkeypatch.setattr(extraction, "preprocess_pages", lambda uploads: [path for path, _ in uploads])
+    path = tmp_path / "bol.png"
+    path.write_bytes(b"page bytes")
+    return str(path)
+
+
+def test_mock_results_are_not_cached(page, monkeypatch):
+    monkeypatch.setattr(extraction, "get_ocr_client", lambda: None)
+    [mock] = extraction.extract_pages([(page, "bol")])
+    assert mock["bol_no"] == "BOL-MOCK-001"
+    assert extraction.get_tool_cache().stats()["entries"] == 0
+
+    client = FakeOCRClient()
+    monkeypatch.setattr(extraction, "get_ocr_client", lambda: client)
+    [real] = extraction.extract_pages([(page, "bol")])
+    assert real["bol_no"] == "BOL-REAL-1"
+    assert len(client.pages) == 1
+
+
+def test_ocr_results_are_cached(page, monkeypatch):
+    client = FakeOCRClient()
+    monkeypatch.setattr(extraction, "get_ocr_client", lambda: client)
+    extraction.extract_pages([(page, "bol")])
+    [cached] = extraction.extract_pages([(page, "bol")])
+    assert cached["bol_no"] == "BOL-REAL-1"
+    assert len(client.pages) == 1
+
+
+def test_router_type_wins_over_file_names():
+    pages = extraction.infer_page_types(["a/invoice_1.png", "a/receipt_2.png"], "bol")
+    assert pages == [("a/invoice_1.png", "bol"), ("a/receipt_2.png", "bol")]
+
+
+def test_untyped_email_is_typed_per_page():
+    pages = extraction.infer_page_types(["a/invoice_1.png", "a/receipt_2.png"])
+    assert pages == [("a/invoice_1.png", "invoice"), ("a/receipt_2.png", "receipt")]
+    assert extraction.infer_page_types(["a/invoice_1.png", "a/scan.png"]) is None
+
+
+def test_mixed_results_keep_the_single_type_shape(page, monkeypatch):
+    monkeypatch.setattr(extraction, "get_ocr_client", lambda: FakeOCRClient())
+    outputs = extraction.extract_mixed([(page, "bol"), (page, "invoice")])
+    assert list(outputs) == ["bol.png", "bol (2).png"]
+    assert outputs["bol.png"]["bol_no"] == "BOL-REAL-1"
+    assert outputs == {
+        **extraction.extract_documents([page], "bol"),
+        "bol (2).png": extraction.extract_documents([page], "invoice")["bol.png"],
+    }
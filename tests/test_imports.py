@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_pipeline_creates_no_files(tmp_path):
+    env = {key: value for key, value in os.environ.items() if not key.endswith(("_PATH", "_DB"))}
+    env["PYTHONPATH"] = ROOT
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    subprocess.run(
+        [sys.executable, "-c", "import definitions, pipeline, tools, utils, workers"],
+        cwd=tmp_path, env=env, check=True,
+    )
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import definitions
+import extraction
+import instrumentation
+import models
+from cache import ResultCache
+from fakes import FakeChatModel, _tool_call, default_script
+from instrumentation import MetricsRegistry, instrumented
+
+EMAIL = {'message_id': 'm0', 'subject': 'Hello', 'body': 'See below', 'has_attachments': False}
+
+
+def failing_extraction(messages, tool_names):
+    if "TextExtraction" in tool_names:
+        raise RuntimeError("model unavailable")
+    if "RoutingDecision" in tool_names:
+        return _tool_call("RoutingDecision", {"agent": "text_extractor_agent"})
+    return default_script(messages, tool_names)
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    def use(script=None):
+        model = FakeChatModel(latency=0.01, script=script)
+        monkeypatch.setattr(models, "_clients", {})
+        monkeypatch.setattr(models, "RESPONSE_CACHE_PATH", "")
+        models.set_chat_model(model)
+        models.set_chat_model(model, name=models.CHEAP_MODEL)
+        return model
+
+    monkeypatch.setattr(definitions, "CHECKPOINT_DB", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(definitions, "_built", {})
+    monkeypatch.setattr(extraction, "_tool_cache", ResultCache(str(tmp_path / "tool_cache.sqlite")))
+    monkeypatch.setattr(instrumentation, "_registry", MetricsRegistry(str(tmp_path / "metrics.jsonl")))
+    return use
+
+
+def test_process_email_records_node_timings_and_tokens(graph, tmp_path):
+    model = graph()
+    definitions.process_email(EMAIL)
+
+    registry = instrumentation.get_registry()
+    assert registry.emails == 1 and registry.failed == 0
+    supervisor = registry.nodes["supervisor"]
+    assert supervisor["runs"] >= 1
+    assert supervisor["wall_seconds"] >= 0.01
+    llm_calls = sum(stats["llm_calls"] for stats in registry.nodes.values())
+    assert llm_calls == model.call_count
+    assert sum(stats["prompt_tokens"] for stats in registry.nodes.values()) > 0
+    assert sum(stats["completion_tokens"] for stats in registry.nodes.values()) > 0
+    assert sum(stats["errors"] for stats in registry.nodes.values()) == 0
+
+    with open(tmp_path / "metrics.jsonl") as f:
+        summary = json.loads(f.readline())
+    assert summary["email_id"] == "m0"
+    assert summary["llm_calls"] == llm_calls
+
+
+def test_failed_run_counts_node_errors(graph):
+    graph(failing_extraction)
+    with pytest.raises(RuntimeError):
+        definitions.process_email(EMAIL)
+
+    registry = instrumentation.get_registry()
+    assert registry.emails == 1 and registry.failed == 1
+    assert registry.nodes["text_extractor_agent/extract"]["errors"] >= 1
+    assert registry.nodes["supervisor"]["errors"] == 0
+    text = registry.prometheus_text()
+    assert 'email_graph_node_errors_total{node="text_extractor_agent/extract"}' in text
+    assert "email_graph_email_failures_total 1" in text
+
+
+def test_instrumented_keeps_existing_callbacks():
+    registry = MetricsRegistry()
+    existing = object()
+    with instrumented("m0", {"callbacks": [existing]}, registry) as config:
+        assert config["callbacks"][0] is existing
+        assert isinstance(config["callbacks"][1], instrumentation.EmailInstrumentation)
+    assert registry.emails == 1
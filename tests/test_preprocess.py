@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+import preprocess
+from preprocess import PreprocessSettings, preprocess_pages
+
+SETTINGS = PreprocessSettings(max_side=2200, mode="gray", crop=True, fmt="png", quality=None)
+
+
+def counting_run(monkeypatch):
+    processed = []
+    run = preprocess._run
+
+    def counted(job):
+        processed.append(job[0])
+        return run(job)
+
+    monkeypatch.setattr(preprocess, "_run", counted)
+    return processed
+
+
+def test_shrunk_pages_are_processed_once(tmp_path, monkeypatch):
+    processed = counting_run(monkeypatch)
+    path = str(tmp_path / "bol_page1.png")
+    image = Image.new("RGB", (1600, 2000), "white")
+    ImageDraw.Draw(image).rectangle((400, 400, 1200, 1400), fill="navy")
+    image.save(path)
+
+    with ThreadPoolExecutor(1) as executor:
+        [first] = preprocess_pages([(path, SETTINGS)], executor)
+        [second] = preprocess_pages([(path, SETTINGS)], executor)
+    assert first == second == preprocess.target_path(path, SETTINGS)
+    assert processed == [path]
+
+
+def test_pages_that_would_not_shrink_are_skipped_next_time(tmp_path, monkeypatch):
+    processed = counting_run(monkeypatch)
+    path = str(tmp_path / "label_page1.png")
+    Image.new("L", (8, 8), 0).save(path, optimize=True)
+
+    with ThreadPoolExecutor(1) as executor:
+        [first] = preprocess_pages([(path, SETTINGS)], executor)
+        [second] = preprocess_pages([(path, SETTINGS)], executor)
+    assert first == second == path
+    assert processed == [path]
+    assert not (tmp_path / preprocess.target_path(path, SETTINGS)).exists()
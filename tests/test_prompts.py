@@ -0,0 +1,78 @@
+import definitions
+import prompts
+from prompts import format_email, strip_quoted_text
+
+FORWARDED_QUOTE = {
+    "subject": "Fwd: LTL rate quote",
+    "body": (
+        "Hi team, please confirm the rate below.\n\n"
+        "---------- Forwarded message ---------\n"
+        "From: Carrier Sales <sales@carrier.example>\n"
+        "Date: Mon, Jun 2, 2025\n"
+        "Subject: LTL rate quote\n\n"
+        "Origin: Chicago, IL 60601\n"
+        "Destination: Miami, FL 33101\n"
+        "Rate: $1,245.00 all-in\n"
+    ),
+    "has_attachments": False,
+}
+
+SIGN_OFF_THEN_DATA = {
+    "subject": "Re: Shipment 88231",
+    "body": "Thanks,\nNew ETA for shipment 88231 is 2025-06-04 14:00.\nPRO 4455-221\n",
+    "has_attachments": False,
+}
+
+INLINE_REPLY = {
+    "subject": "Re: Pickup",
+    "body": (
+        "See answers inline.\n\n"
+        "On Mon, Jun 2, 2025 at 9:00 AM Dispatch <dispatch@example.com> wrote:\n"
+        "> Pickup time?\n"
+        "Dock 4, 08:30 tomorrow, reference PU-7781\n"
+    ),
+    "has_attachments": False,
+}
+
+
+def test_stripping_is_off_by_default():
+    assert prompts.STRIP_QUOTED_TEXT is False
+
+
+def test_format_email_keeps_forwarded_content():
+    text = format_email(FORWARDED_QUOTE)
+    assert "Rate: $1,245.00 all-in" in text
+    assert "Destination: Miami, FL 33101" in text
+
+
+def test_format_email_keeps_content_after_sign_off():
+    text = format_email(SIGN_OFF_THEN_DATA)
+    assert "New ETA for shipment 88231 is 2025-06-04 14:00." in text
+    assert "PRO 4455-221" in text
+
+
+def test_format_email_keeps_inline_reply_below_quote_marker():
+    text = format_email(INLINE_REPLY)
+    assert "Dock 4, 08:30 tomorrow, reference PU-7781" in text
+
+
+def test_strip_quoted_text_cuts_forwarded_history():
+    assert strip_quoted_text(FORWARDED_QUOTE["body"]) == "Hi team, please confirm the rate below."
+
+
+def test_extraction_input_is_never_stripped(monkeypatch):
+    monkeypatch.setattr(definitions, "STRIP_QUOTED_TEXT", True)
+    decision = definitions.RoutingDecision(agent="text_extractor_agent")
+    for email in (FORWARDED_QUOTE, SIGN_OFF_THEN_DATA, INLINE_REPLY):
+        content = definitions._agent_input(email, decision)["messages"][0].content
+        assert content == format_email(email)
+
+
+def test_routing_input_is_stripped_only_when_enabled(monkeypatch):
+    [[_, message]] = definitions._routing_inputs([FORWARDED_QUOTE])
+    assert "Rate: $1,245.00 all-in" in message.content
+
+    monkeypatch.setattr(definitions, "STRIP_QUOTED_TEXT", True)
+    [[_, message]] = definitions._routing_inputs([FORWARDED_QUOTE])
+    assert "Rate: $1,245.00 all-in" not in message.content
+    assert "please confirm the rate below" in message.content
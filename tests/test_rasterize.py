@@ -0,0 +1,33 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rasterize
+
+
+def test_concurrent_pdfs_share_one_pool(tmp_path, monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def convert_range(pdf_path, first, last, output_dir, base_name, dpi, fmt):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return [(page, f"{base_name}_page{page}.png") for page in range(first, last + 1)]
+
+    monkeypatch.setattr(rasterize, "page_count", lambda pdf_path: 8)
+    monkeypatch.setattr(rasterize, "_convert_range", convert_range)
+    monkeypatch.setattr(rasterize, "_executor", ThreadPoolExecutor(max_workers=2))
+
+    def rasterize_one(i):
+        return rasterize.rasterize_pdf(str(tmp_path / f"doc{i}.pdf"), pages_per_task=1)
+
+    # Like the ingest pool: several threads each rasterizing their own PDF
+    with ThreadPoolExecutor(max_workers=4) as ingest:
+        results = list(ingest.map(rasterize_one, range(4)))
+    assert results[3] == [f"doc3_page{page}.png" for page in range(1, 9)]
+    assert max(peak) == 2
@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from fakes import FakeOpenAIServer
+from rate_limit import LOW, URGENT, BackendLimiter, RateLimitedTransport, _Call
+
+RATE_LIMITED = {"retry-after-ms": "0"}
+
+
+def calls(limiter, count):
+    """Admits count calls at once, like requests in flight when the server starts refusing."""
+    admitted = []
+    for _ in range(count):
+        limiter.acquire()
+        admitted.append(_Call())
+    return admitted
+
+
+def release_429s(limiter, admitted):
+    for call in admitted:
+        call.observe(429, RATE_LIMITED)
+        limiter.release(call)
+
+
+def test_concurrency_is_halved_once_per_window():
+    limiter = BackendLimiter("test", max_concurrency=8)
+    release_429s(limiter, calls(limiter, 4))
+    # Four 429s of calls admitted before the decrease count as one
+    assert limiter.limit == 4
+    assert limiter.rate_limited == 4
+
+    time.sleep(0.01)
+    release_429s(limiter, calls(limiter, 1))
+    assert limiter.limit == 2
+
+
+def test_successes_grow_the_limit_additively():
+    limiter = BackendLimiter("test", max_concurrency=8, initial_concurrency=2)
+    for call in calls(limiter, 2):
+        call.observe(200)
+        limiter.release(call)
+    # 2 + 1/2, then + 1/2.5: one slot per `limit` successes
+    assert limiter.limit == pytest.approx(2.9)
+
+
+def test_retry_after_pauses_new_calls():
+    limiter = BackendLimiter("test", max_concurrency=8)
+    with limiter.call() as call:
+        call.observe(429, {"retry-after-ms": "200"})
+    start = time.monotonic()
+    with limiter.call() as call:
+        call.observe(200)
+    assert time.monotonic() - start >= 0.19
+
+
+def test_buckets_are_drained_after_a_429():
+    # 600 rpm with a 10 s burst: 100 requests may start at once, then 10 per second
+    limiter = BackendLimiter("test", rpm=600, max_concurrency=8, burst_seconds=10)
+    with limiter.call() as call:
+        call.observe(200)
+    start = time.monotonic()
+    with limiter.call() as call:
+        call.observe(429, RATE_LIMITED)
+    assert time.monotonic() - start < 0.05
+    assert limiter.requests.tokens <= 0
+
+    start = time.monotonic()
+    with limiter.call() as call:
+        call.observe(200)
+    assert time.monotonic() - start >= 0.08
+
+
+def test_urgent_calls_are_admitted_before_low_ones():
+    limiter = BackendLimiter("test", max_concurrency=1)
+    order = []
+
+    def wait_in(lane, name):
+        with limiter.call(lane=lane) as call:
+            order.append(name)
+            call.observe(200)
+
+    with limiter.call() as held:
+        threads = []
+        for lane, name in ((LOW, "low"), (URGENT, "urgent")):
+            threads.append(threading.Thread(target=wait_in, args=(lane, name)))
+            threads[-1].start()
+            while limiter.stats()["waiting"] < len(threads):
+                time.sleep(0.001)
+        held.observe(200)
+    for thread in threads:
+        thread.join()
+    assert order == ["urgent", "low"]
+
+
+def test_transport_backs_off_a_rate_limiting_server():
+    with FakeOpenAIServer(latency=0.05, max_concurrency=2) as server:
+        limiter = BackendLimiter("test", max_concurrency=8)
+        with httpx.Client(transport=RateLimitedTransport(limiter)) as client:
+            def send(i):
+                body = {"model": "gpt-4", "messages": [{"role": "user", "content": f"email {i}"}]}
+                return client.post(f"{server.url}/chat/completions", json=body).status_code
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                statuses = list(executor.map(send, range(16)))
+    assert statuses == [200] * 16
+    assert server.rate_limited > 0
+    assert limiter.rate_limited == server.rate_limited
+    assert limiter.limit < 8
+    assert server.max_in_flight <= 2
@@ -0,0 +1,69 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import pipeline
+from cascade import CascadeStats
+from fakes import FakeChatModel, FakeGmailService, _tool_call, make_message
+from schemas import DocumentExtractionResult, ErrorResult, validate_answer
+
+MISSING_SUMMARY = '{"processing_intent": "data_extraction_requested", "tool_outputs": {"a.png": {"bol_no": "B1"}}}'
+
+
+def test_repair_asks_for_failing_fields_and_is_counted():
+    asked = []
+
+    def fixer(messages, tool_names):
+        asked.append(tool_names)
+        return _tool_call(tool_names[0], {"email_summary": "Process the attached BOL"})
+
+    stats = CascadeStats()
+    result = validate_answer(
+        MISSING_SUMMARY, DocumentExtractionResult, FakeChatModel(script=fixer), [HumanMessage(content="email")],
+        "document_processor_agent", stats,
+    )
+    assert isinstance(result, DocumentExtractionResult)
+    assert result.email_summary == "Process the attached BOL"
+    assert result.tool_outputs == {"a.png": {"bol_no": "B1"}}
+    assert asked == [("DocumentExtractionResultRepair",)]
+    assert stats.report()["document_processor_agent"]["repairs"] == {"repaired": 1}
+
+
+def test_invalid_answer_becomes_error_result_and_is_counted(capsys):
+    stats = CascadeStats()
+    result = validate_answer("not json", DocumentExtractionResult, node="document_processor_agent", stats=stats)
+    assert isinstance(result, ErrorResult)
+    assert result.error == "Invalid DocumentExtractionResult answer"
+    assert "Invalid JSON" in result.detail
+    assert stats.report()["document_processor_agent"]["repairs"] == {"failed": 1}
+    assert capsys.readouterr().out == ""
+
+
+def test_pipeline_record_with_error_result_is_a_failure():
+    error = validate_answer("not json", DocumentExtractionResult)
+    output = pipeline.final_output([AIMessage(content=error.model_dump_json())])
+    record = pipeline._record({"message_id": "m0"}, output=output)
+    assert record["error"] == "Invalid DocumentExtractionResult answer"
+    assert record["result"]["raw"] == "not json"
+
+
+def test_pipeline_does_not_mark_error_results_read(tmp_path):
+    service = FakeGmailService()
+    service.add_message(*make_message('m0', 'carrier@example.com', 'BOL', 'Please process'))
+    error = validate_answer("not json", DocumentExtractionResult)
+    records = []
+
+    class Sink:
+        write = staticmethod(records.append)
+
+    async def route(batch):
+        return [None] * len(batch)
+
+    async def run(email, decision):
+        return {"messages": [AIMessage(content=error.model_dump_json())]}
+
+    stats = asyncio.run(pipeline.run_pipeline(
+        service, ['m0'], Sink(), save_path=str(tmp_path), route=route, run=run, mark_as_read=True,
+    ))
+    assert (stats["processed"], stats["errors"]) == (0, 1)
+    assert 'UNREAD' in service.messages['m0']['labelIds']
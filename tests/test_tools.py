@@ -0,0 +1,34 @@
+import extraction
+import models
+import tools
+from cache import ResultCache
+from fakes import FakeChatModel
+
+
+def test_structured_text_chain_is_built_once(monkeypatch):
+    monkeypatch.setattr(models, "_clients", {})
+    models.set_chat_model(FakeChatModel(latency=0))
+    chain = tools.get_structured_text_chain()
+    assert tools.get_structured_text_chain() is chain
+
+    models.set_chat_model(FakeChatModel(latency=0))
+    assert tools.get_structured_text_chain() is not chain
+
+
+def test_extract_structured_text_tool_reuses_chain(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, "_clients", {})
+    models.set_chat_model(FakeChatModel(latency=0))
+    monkeypatch.setattr(extraction, "_tool_cache", ResultCache(str(tmp_path / "tool_cache.sqlite")))
+    monkeypatch.setattr(extraction.get_tool_cache(), "get_or_compute",
+                        lambda key, compute, should_cache=None: compute())
+    built = []
+    original = tools.structured_cascade
+
+    def structured_cascade(*args, **kwargs):
+        built.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(tools, "structured_cascade", structured_cascade)
+    for text in ("Shipment 1 delayed to Friday", "Shipment 2 delivered"):
+        assert "error" not in tools.extract_structured_text_tool.invoke({"raw_text": text})
+    assert len(built) == 1
@@ -0,0 +1,284 @@
+import asyncio
+import base64
+import os
+
+import pipeline
+import utils
+from fakes import FakeAuthorizedSession, FakeGmailService, make_message
+
+SENDER = 'carrier@example.com'
+
+
+def mailbox(count=3, attachments=False):
+    service = FakeGmailService()
+    for i in range(count):
+        files = [(f'bol_{i}.png', 'image/png', f'page {i}'.encode())] if attachments else ()
+        service.add_message(*make_message(f'm{i}', SENDER, f'BOL {i}', f'Shipment {i}', files))
+    return service
+
+
+def poll(service, tmp_path, **kwargs):
+    return utils.check_new_emails_from_sender(
+        service, SENDER, state_path=str(tmp_path / 'sync_state.json'), save_path=str(tmp_path / 'files'),
+        max_workers=2, max_retries=0, **kwargs
+    )
+
+
+def test_ingest_reports_failed_message(tmp_path):
+    service = mailbox()
+    service.fail_message('m1')
+    emails, failed = utils.ingest_messages_concurrent(
+        service, ['m0', 'm1', 'm2'], str(tmp_path), max_workers=2, max_retries=0
+    )
+    assert [email['message_id'] for email in emails] == ['m0', 'm2']
+    assert failed == ['m1']
+
+
+def test_ingest_reports_failed_attachment(tmp_path):
+    service = mailbox(attachments=True)
+    del service.attachments[('m2', 'm2-att1')]
+    emails, failed = utils.ingest_messages_concurrent(
+        service, ['m0', 'm1', 'm2'], str(tmp_path), max_workers=2, max_retries=0
+    )
+    assert [email['message_id'] for email in emails] == ['m0', 'm1']
+    assert failed == ['m2']
+
+
+def test_failed_message_is_retried_on_next_poll(tmp_path):
+    service = mailbox()
+    service.fail_message('m1')
+    first = poll(service, tmp_path)
+    assert [email['message_id'] for email in first] == ['m0', 'm2']
+    assert utils.load_sync_state(str(tmp_path / 'sync_state.json'))['failed_ids'] == {'m1': 1}
+
+    service.add_message(*make_message('m3', SENDER, 'BOL 3', 'Shipment 3'))
+    second = poll(service, tmp_path)
+    assert [email['message_id'] for email in second] == ['m1', 'm3']
+    assert utils.load_sync_state(str(tmp_path / 'sync_state.json'))['failed_ids'] == {}
+
+
+def test_failed_message_is_given_up_after_retry_polls(tmp_path):
+    service = mailbox(count=1)
+    service.fail_message('m0', times=utils.SYNC_RETRY_POLLS)
+    for _ in range(utils.SYNC_RETRY_POLLS):
+        assert poll(service, tmp_path) == []
+    assert utils.load_sync_state(str(tmp_path / 'sync_state.json'))['failed_ids'] == {}
+    assert poll(service, tmp_path) == []
+
+
+def streaming_sessions(monkeypatch):
+    sessions = []
+
+    def authorized_session(service):
+        sessions.append(FakeAuthorizedSession(service))
+        return sessions[-1]
+
+    monkeypatch.setattr(utils, 'authorized_session', authorized_session)
+    return sessions
+
+
+def streamed(sessions):
+    return sorted(uri.rsplit('/', 1)[-1].split('?')[0] for session in sessions for uri in session.streamed)
+
+
+def test_ingest_streams_attachments_by_default(tmp_path, monkeypatch):
+    sessions = streaming_sessions(monkeypatch)
+    service = mailbox(attachments=True)
+    emails, failed = utils.ingest_messages_concurrent(
+        service, ['m0', 'm1', 'm2'], str(tmp_path), max_workers=2, max_retries=0
+    )
+    assert failed == []
+    assert 1 <= len(sessions) <= 2
+    assert streamed(sessions) == ['m0-att1', 'm1-att1', 'm2-att1']
+    with open(emails[1]['attachment_paths'][0], 'rb') as f:
+        assert f.read() == b'page 1'
+
+
+def test_incremental_sync_streams_attachments_by_default(tmp_path, monkeypatch):
+    sessions = streaming_sessions(monkeypatch)
+    emails = poll(mailbox(attachments=True), tmp_path)
+    assert len(emails) == 3
+    assert streamed(sessions) == ['m0-att1', 'm1-att1', 'm2-att1']
+
+
+def test_pipeline_fetch_streams_attachments_by_default(tmp_path, monkeypatch):
+    sessions = streaming_sessions(monkeypatch)
+    service = mailbox(attachments=True)
+    records = []
+
+    class Sink:
+        write = staticmethod(records.append)
+
+    async def route(batch):
+        return [None] * len(batch)
+
+    async def run(email, decision):
+        return {"messages": []}
+
+    stats = asyncio.run(pipeline.run_pipeline(
+        service, ['m0', 'm1', 'm2'], Sink(), save_path=str(tmp_path), fetch_workers=2, route=route, run=run,
+    ))
+    assert stats["processed"] == 3
+    assert streamed(sessions) == ['m0-att1', 'm1-att1', 'm2-att1']
+
+
+def test_worker_threads_get_their_own_service(tmp_path, monkeypatch):
+    service = mailbox()
+    service._http = type('AuthorizedHttp', (), {'credentials': object()})()
+    built = []
+
+    def build(name, version, credentials=None, cache_discovery=True):
+        assert credentials is service._http.credentials
+        built.append(mailbox())
+        return built[-1]
+
+    monkeypatch.setattr(utils, 'build', build)
+    monkeypatch.setattr(utils, 'authorized_session', lambda service: None)
+    emails, failed = utils.ingest_messages_concurrent(
+        service, ['m0', 'm1', 'm2'], str(tmp_path), max_workers=2, max_retries=0
+    )
+    assert len(emails) == 3 and failed == []
+    assert 1 <= len(built) <= 2
+    assert 'messages.get' not in service.calls
+    assert sum(fake.calls['messages.get'] for fake in built) == 3
+
+
+def test_service_without_credentials_is_shared():
+    assert utils.service_builder(FakeGmailService()) is None
+
+
+def test_pipeline_failed_attachment_is_an_error_record(tmp_path):
+    service = mailbox(attachments=True)
+    del service.attachments[('m1', 'm1-att1')]
+    records, routed = [], []
+
+    class Sink:
+        write = staticmethod(records.append)
+
+    async def route(batch):
+        routed.extend(email['message_id'] for email in batch)
+        return [None] * len(batch)
+
+    async def run(email, decision):
+        return {"messages": []}
+
+    maintained = []
+    stats = asyncio.run(pipeline.run_pipeline(
+        service, ['m0', 'm1', 'm2'], Sink(), save_path=str(tmp_path), route=route, run=run, mark_as_read=True,
+        max_retries=0, maintain=lambda: maintained.append(True),
+    ))
+    assert (stats["processed"], stats["errors"]) == (2, 1)
+    assert maintained == [True]
+    assert sorted(routed) == ['m0', 'm2']
+    [failed] = [record for record in records if record["message_id"] == 'm1']
+    assert "bol_1.png" in failed["error"]
+    assert 'UNREAD' in service.messages['m1']['labelIds']
+    assert 'UNREAD' not in service.messages['m0']['labelIds']
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def text_part(mime_type, text, charset='utf-8'):
+    return {
+        'mimeType': mime_type, 'filename': '',
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': b64(text.encode(charset))},
+    }
+
+
+def file_part(filename, attachment_id, mime_type='image/png', headers=()):
+    return {'mimeType': mime_type, 'filename': filename, 'headers': list(headers),
+            'body': {'attachmentId': attachment_id, 'size': 10}}
+
+
+def multipart(mime_type, *parts, headers=()):
+    return {'mimeType': mime_type, 'filename': '', 'headers': list(headers), 'body': {'size': 0},
+            'parts': list(parts)}
+
+
+def parse(payload, tmp_path):
+    message = {'id': 'm0', 'payload': dict(payload, headers=payload['headers'] + [
+        {'name': 'Subject', 'value': 'BOL 1'}, {'name': 'From', 'value': SENDER},
+    ])}
+    return utils.parse_email_content(None, message, str(tmp_path), fetch_attachments=False)
+
+
+def test_alternative_inside_mixed_uses_the_plain_text(tmp_path):
+    payload = multipart(
+        'multipart/mixed',
+        multipart('multipart/alternative',
+                  text_part('text/plain', 'Shipment delayed'),
+                  text_part('text/html', '<p>Shipment <b>delayed</b></p>')),
+        file_part('bol_1.pdf', 'att1', 'application/pdf'),
+    )
+    email = parse(payload, tmp_path)
+    assert email['subject'] == 'BOL 1'
+    assert email['body'] == 'Shipment delayed'
+    assert email['html_body'] == '<p>Shipment <b>delayed</b></p>'
+    assert email['has_attachments']
+    assert email['pending_attachments'] == [('att1', 'bol_1.pdf')]
+
+
+def test_forwarded_message_attachments_are_found(tmp_path):
+    forwarded = multipart(
+        'message/rfc822',
+        multipart('multipart/mixed', text_part('text/plain', 'Original BOL attached'),
+                  file_part('bol_2.png', 'att2')),
+    )
+    payload = multipart('multipart/mixed', text_part('text/plain', 'FYI, see below'), forwarded,
+                        file_part('invoice_1.png', 'att3'))
+    parts = list(utils.iter_message_parts(payload))
+    assert [part['mimeType'] for part in parts] == ['text/plain', 'text/plain', 'image/png', 'image/png']
+
+    email = parse(payload, tmp_path)
+    assert email['body'] == 'FYI, see below\n\nOriginal BOL attached'
+    assert email['pending_attachments'] == [('att2', 'bol_2.png'), ('att3', 'invoice_1.png')]
+
+
+def test_inline_images_with_content_id(tmp_path):
+    png = b'\x89PNG\r\n\x1a\n inline logo'
+    inline = {'mimeType': 'image/png', 'filename': 'logo.png',
+              'headers': [{'name': 'Content-ID', 'value': '<logo@carrier>'},
+                          {'name': 'Content-Disposition', 'value': 'inline; filename="logo.png"'}],
+              'body': {'data': b64(png), 'size': len(png)}}
+    related = multipart(
+        'multipart/related',
+        text_part('text/html', '<p>Label below</p><img src="cid:logo@carrier">'),
+        inline,
+        file_part('label_1.png', 'att4', headers=[{'name': 'Content-ID', 'value': '<label@carrier>'}]),
+    )
+    email = parse(multipart('multipart/mixed', related), tmp_path)
+    assert email['body'] == 'Label below'
+    assert email['pending_attachments'] == [('att4', 'label_1.png')]
+    [saved] = email['attachment_paths']
+    assert os.path.exists(saved)
+    with open(saved, 'rb') as f:
+        assert f.read() == png
+
+
+def test_non_utf8_charsets_are_decoded(tmp_path):
+    payload = multipart(
+        'multipart/alternative',
+        text_part('text/plain', 'Livraison retardée à Besançon', charset='iso-8859-1'),
+        text_part('text/plain', 'Доставка задерживается', charset='koi8-r'),
+    )
+    email = parse(payload, tmp_path)
+    assert email['body'] == 'Livraison retardée à Besançon\n\nДоставка задерживается'
+
+
+def test_unknown_charset_falls_back_to_utf8(tmp_path):
+    part = text_part('text/plain', 'Shipment delayed')
+    part['headers'] = [{'name': 'Content-Type', 'value': 'text/plain; charset=x-made-up'}]
+    email = parse(multipart('multipart/mixed', part), tmp_path)
+    assert email['body'] == 'Shipment delayed'
+
+
+def test_html_only_message_falls_back_to_text(tmp_path):
+    html = ('<html><head><style>p {color: red}</style></head><body><p>Shipment &amp; invoice</p>'
+            '<div>ETA Friday<br>Dock 4</div><script>track()</script></body></html>')
+    email = parse(multipart('multipart/mixed', text_part('text/html', html)), tmp_path)
+    assert email['html_body'] == html
+    assert email['body'] == 'Shipment & invoice\nETA Friday\nDock 4'
+    assert not email['has_attachments']
@@ -0,0 +1,152 @@
+import json
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import definitions
+import extraction
+import models
+import utils
+import workers
+from cache import ResultCache
+from fakes import FakeChatModel, FakeGmailService, _tool_call, make_message
+from job_queue import DEAD, DONE, QUEUED, JobQueue
+
+SENDER = 'carrier@example.com'
+ANSWER = {
+    "email_summary": "Shipment delayed",
+    "processing_intent": "text_data_extraction",
+    "extracted_data": {"status": "delayed"},
+}
+
+
+def answer(email):
+    return [AIMessage(content=json.dumps(ANSWER))]
+
+
+def error_answer(email):
+    return [AIMessage(content=json.dumps({"error": "Invalid TextExtractionResult answer", "raw": "nope"}))]
+
+
+def stolen_lease(email):
+    queue = JobQueue(email['queue_path'])
+    queue._conn.execute("UPDATE jobs SET lease_owner = 'other-worker'")
+    queue.close()
+    time.sleep(0.3)
+    return answer(email)
+
+
+@pytest.fixture
+def service():
+    service = FakeGmailService()
+    for i in range(2):
+        service.add_message(*make_message(f'm{i}', SENDER, f'Update {i}', f'Shipment {i} delayed'))
+    return service
+
+
+def run_ingest(service, tmp_path):
+    return workers.ingest(
+        str(tmp_path / 'queue.sqlite'), SENDER, state_path=str(tmp_path / 'sync_state.json'),
+        save_path=str(tmp_path), service_factory=lambda: service,
+    )
+
+
+def test_sync_state_is_saved_only_after_enqueue(service, tmp_path, monkeypatch):
+    def crash(queue, emails):
+        raise RuntimeError("crashed before enqueueing")
+
+    monkeypatch.setattr(workers, 'enqueue_emails', crash)
+    with pytest.raises(RuntimeError):
+        run_ingest(service, tmp_path)
+    assert utils.load_sync_state(str(tmp_path / 'sync_state.json')) == {}
+
+    monkeypatch.undo()
+    assert run_ingest(service, tmp_path) == 2
+    assert utils.load_sync_state(str(tmp_path / 'sync_state.json'))['history_id']
+
+
+def enqueue(tmp_path, count=1):
+    path = str(tmp_path / 'queue.sqlite')
+    queue = JobQueue(path)
+    for i in range(count):
+        queue.enqueue({'message_id': f'm{i}', 'queue_path': path})
+    return queue, path
+
+
+def test_answer_completes_job(tmp_path):
+    queue, path = enqueue(tmp_path)
+    assert workers.run_worker(path, process='test_workers:answer', exit_when_empty=True) == 1
+    assert queue.result('m0') == ANSWER
+
+
+def test_error_result_fails_until_dead_lettered(tmp_path):
+    queue, path = enqueue(tmp_path)
+    assert workers.run_worker(path, process='test_workers:error_answer', max_attempts=1, exit_when_empty=True,
+                              reset=None) == 0
+    assert queue.stats()[DEAD] == 1
+    [(message_id, attempts, error)] = queue.dead_letters()
+    assert (message_id, attempts) == ('m0', 1)
+    assert "Invalid TextExtractionResult answer" in error
+
+
+maintenance_runs = []
+
+
+def count_maintenance():
+    maintenance_runs.append(time.monotonic())
+
+
+def test_worker_runs_maintenance_between_jobs(tmp_path):
+    maintenance_runs.clear()
+    queue, path = enqueue(tmp_path, count=2)
+    workers.run_worker(path, process='test_workers:answer', maintain='test_workers:count_maintenance',
+                       exit_when_empty=True)
+    # Before each of the two claims, and before the empty one
+    assert len(maintenance_runs) == 3
+
+
+def test_error_result_is_retried(tmp_path):
+    queue, path = enqueue(tmp_path)
+    workers.run_worker(path, process='test_workers:error_answer', max_attempts=3, exit_when_empty=True, reset=None)
+    assert queue.stats()[QUEUED] == 1
+    assert queue.stats()[DONE] == 0
+
+
+def test_lost_lease_drops_result(tmp_path, capsys):
+    queue, path = enqueue(tmp_path)
+    completed = workers.run_worker(
+        path, process='test_workers:stolen_lease', visibility_timeout=0.3, exit_when_empty=True
+    )
+    assert completed == 0
+    assert queue.result('m0') is None
+    assert "Lost the lease on m0 while processing it" in capsys.readouterr().out
+
+
+def failing_text_extraction(messages, tool_names):
+    if "RoutingDecision" in tool_names:
+        return _tool_call("RoutingDecision", {"agent": "text_extractor_agent"})
+    return _tool_call(tool_names[0], {"email_summary": "Update", "extracted_data": "not an object"})
+
+
+def test_error_result_retry_runs_the_graph_again(tmp_path, monkeypatch):
+    model = FakeChatModel(script=failing_text_extraction)
+    monkeypatch.setattr(models, "_clients", {})
+    monkeypatch.setattr(models, "RESPONSE_CACHE_PATH", "")
+    models.set_chat_model(model)
+    models.set_chat_model(model, name=models.CHEAP_MODEL)
+    monkeypatch.setattr(definitions, "CHECKPOINT_DB", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(definitions, "_built", {})
+    monkeypatch.setattr(extraction, "_tool_cache", ResultCache(str(tmp_path / "tool_cache.sqlite")))
+    path = str(tmp_path / 'queue.sqlite')
+    queue = JobQueue(path)
+    # No pre-classifier rule fires, so the email goes through the checkpointed graph
+    queue.enqueue({'message_id': 'm0', 'subject': 'Hello', 'body': 'See below', 'has_attachments': False})
+
+    calls = []
+    for _ in range(2):
+        queue._conn.execute("UPDATE jobs SET available_at = 0")
+        workers.run_worker(path, max_attempts=3, max_jobs=1, exit_when_empty=True)
+        calls.append(model.call_count)
+    assert queue.stats()[QUEUED] == 1
+    assert calls[1] > calls[0] > 0
@@ -1,17 +1,23 @@
-import json
-import os
+import threading
 from dotenv import load_dotenv
 load_dotenv()
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from pydantic import BaseModel, Field, conlist
-from typing import List, Optional, Dict, Any
-import time
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any
 
 from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser,StrOutputParser
+from langchain_core.exceptions import OutputParserException
 
-# For API calls
+from cache import make_key, text_digest
+from cascade import structured_cascade
+from extraction import extract_documents, get_tool_cache
+from json_prune import remove_none_values
+from models import get_chat_model, node_model_names
+from prompts import DIRECT_TEXT_INSTRUCTIONS, TEXT_EXTRACTION_INSTRUCTIONS
+from schemas import StructuredText
+
+# For API calls: OCR goes through ocr_client when OCR_API_URL is set; request names
+# and output schemas per document type live in extraction.DOCUMENT_TYPES.
 # from api_calls import OCRAPICall, RequestName
 
 # model = ChatOpenAI(
@@ -22,16 +28,35 @@ from langchain_core.output_parsers import JsonOutputParser,StrOutputParser
 #     api_key=os.getenv("TOGETHER_API_KEY")
 # )
 # model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, verbose=True)
-model = ChatOpenAI(model="gpt-4", temperature=0)
+# The chat model is the client shared with definitions.py, see models.get_chat_model.
+
+# Bump whenever the prompt or output format changes, so stale cache entries stop matching.
+TEXT_TOOL_VERSION = 2
 
-def remove_none_values(obj):
-    if isinstance(obj, dict):
-        return {k: remove_none_values(v) for k, v in obj.items() if v is not None}
-    elif isinstance(obj, list):
-        # Remove None elements from the list, and recursively process other elements
-        return [remove_none_values(elem) for elem in obj if elem is not None]
-    else:
-        return obj
+_text_chains = {}
+_text_chains_lock = threading.Lock()
+
+
+def get_structured_text_chain():
+    """
+    The extraction prompt piped into the "text_extraction" cascade (see
+    cascade.py), built once per set of shared models (see models.set_chat_model).
+    """
+    models = tuple(get_chat_model(name) for name in node_model_names("text_extraction"))
+    key = tuple(map(id, models))
+    with _text_chains_lock:
+        chain = _text_chains.get(key)
+        if chain is None:
+            prompt = PromptTemplate(
+                input_variables=["raw_text"],
+                template=TEXT_EXTRACTION_INSTRUCTIONS + """
+    Logistics Text to Analyze:
+    {raw_text}
+    """,
+            )
+            # The chain holds the models, so their ids stay unique while it is cached
+            chain = _text_chains[key] = prompt | structured_cascade("text_extraction", list(models), StructuredText)
+        return chain
 
 
 # print(cleaned_data_deep)
@@ -52,119 +77,40 @@ class PlainTextInput(BaseModel):
 # def bol_api_tool(image_path: str) -> StructuredExtractionOutput:
 def bol_api_tool(image_paths: List[str]) -> Dict:
     # print(f"DEBUG: Calling bol_api_tool for image: {image_paths}")
-    all_results = {}
-    for i, image_path in enumerate(image_paths):
-        # Extract filename for key or use a simple index
-        file_name = os.path.basename(image_path) # You'll need to import os
-        # result = OCRAPICall(image_path, name=RequestName(11))
-        result = remove_none_values(json.loads(result))
-
-        # Mock data for demonstration
-        result = {
-            "bol_no": f"BOL-MOCK-{(i+1):03d}",
-            "amount_due": 1000.00 + (i * 100),
-            "currency": "USD",
-            "due_date": "2024-07-01",
-            "associated_shipment_id": "ABC-123"
-        }
-
-        all_results[file_name] = result
-    return all_results
+    return extract_documents(image_paths, "bol")
 
 @tool(
     args_schema=ImagePathsInput,
     description="Processes images of documents. Use this when the email indicates shipping label documents are attached."
 )
-def shipping_label_api_tool(image_paths: List[str]) -> Dict: 
-    # print(f"DEBUG: Calling shipping_api_tool for image: {image_paths}")
-    all_results = {}
-    for i, image_path in enumerate(image_paths):
-        # Extract filename for key or use a simple index
-        file_name = os.path.basename(image_path) # You'll need to import os
-        # result = OCRAPICall(image_path, name=RequestName(10))
-        # result = remove_none_values(json.loads(result))
-        # Mock data for demonstration
-        result = {
-            "bol_no": f"BOL-MOCK-{(i+1):03d}",
-            "amount_due": 1000.00 + (i * 100),
-            "currency": "USD",
-            "due_date": "2024-07-01",
-            "associated_shipment_id": "ABC-123"
-        }
-        
-        all_results[file_name] = result
-    return all_results
+def shipping_label_api_tool(image_paths: List[str]) -> Dict:
+    # print(f"DEBUG: Calling shipping_label_api_tool for image: {image_paths}")
+    return extract_documents(image_paths, "shipping_label")
 
 @tool(
     args_schema=ImagePathsInput,
     description="Processes images of documents. Use this when the email indicates item label documents are attached."
 )
 def item_label_api_tool(image_paths: List[str]) -> Dict:
-    # print(f"DEBUG: Calling item_label_api tool for image: {image_paths}")
-    all_results = {}
-    for i, image_path in enumerate(image_paths):
-        # Extract filename for key or use a simple index
-        file_name = os.path.basename(image_path)
-        # result = OCRAPICall(image_path, name=RequestName(12))
-        # result = remove_none_values(json.loads(result))
-        # Mock data for demonstration
-        result = {
-            "bol_no": f"BOL-MOCK-{(i+1):03d}",
-            "amount_due": 1000.00 + (i * 100),
-            "currency": "USD",
-            "due_date": "2024-07-01",
-            "associated_shipment_id": "ABC-123"
-        }
-        all_results[file_name] = result
-    return all_results
+    # print(f"DEBUG: Calling item_label_api_tool for image: {image_paths}")
+    return extract_documents(image_paths, "item_label")
 
 @tool(
     args_schema=ImagePathsInput,
     description="Processes images of documents. Use this when the email indicates invoice documents are attached."
 )
 def invoice_api_tool(image_paths: List[str]) -> Dict:
-    # print(f"DEBUG: Calling invoice_api tool for image: {image_paths}")
-    all_results = {}
-    for i, image_path in enumerate(image_paths):
-        # Extract filename for key or use a simple index
-        file_name = os.path.basename(image_path) # You'll need to import os
-        # result = OCRAPICall(image_path, name=RequestName(11))
-        # result = remove_none_values(json.loads(result))
-        # Mock data for demonstration
-        result = {
-            "inv_no": f"lalalalala-{(i+1):03d}",
-            "amount_due": 1000.00 + (i * 100),
-            "currency": "USD",
-            "due_date": "2024-07-01",
-            "associated_shipment_id": "ABC-123"
-        }
-        all_results[file_name] = result
-    return all_results
+    # print(f"DEBUG: Calling invoice_api_tool for image: {image_paths}")
+    return extract_documents(image_paths, "invoice")
 
 @tool(
     args_schema=ImagePathsInput,
     description="Processes images of documents. Use this when the email indicates receipt documents are attached."
 )
 def receipt_api_tool(image_paths: List[str]) -> Dict:
-    # print(f"DEBUG: Calling receipt_api_tool tool for image: {image_paths}")
-    all_results = {}
-    for i, image_path in enumerate(image_paths):
-        # Extract filename for key or use a simple index
-        file_name = os.path.basename(image_path)
-        # result = OCRAPICall(image_path, name=RequestName(11))
-        # result = remove_none_values(json.loads(result))
-        # Mock data for demonstration
-        result = {
-            "bol_no": f"BOL-MOCK-{(i+1):03d}",
-            "amount_due": 1000.00 + (i * 100),
-            "currency": "USD",
-            "due_date": "2024-07-01",
-            "associated_shipment_id": "ABC-123"
-        }
-        
-        all_results[file_name] = result
-    return all_results
-    
+    # print(f"DEBUG: Calling receipt_api_tool for image: {image_paths}")
+    return extract_documents(image_paths, "receipt")
+
 @tool(
     args_schema=PlainTextInput,
     description="""
@@ -185,54 +131,50 @@ def extract_structured_text_tool(raw_text: str) -> Dict[str, Any]:
         based on the input content.
     """
     # print(f"DEBUG: Calling enhanced extract_structured_text_tool")
-    
-    prompt_template = """
-    You are an advanced logistics document parser with the ability to intelligently structure
-    information. Your task is to analyze the provided logistics text and extract only the information relevant to logistics,
-    organizing it in the most logical structure possible.
-    
-    Key Principles:
-    1. **Content-Driven Structure**: Let the content determine the structure rather than
-       forcing it into a predefined schema.
-    2. **Hierarchical Organization**: Group related information together naturally.
-    3. **Preserve Relationships**: Maintain connections between data points (e.g., items
-       with their quantities and weights).
-    4. **Flexible Typing**: Use appropriate data types (lists for multiple items, dictionaries
-       for structured data, strings for text, etc.).
-    5. **Contextual Awareness**: Recognize and properly handle different document types
-       (bills of lading, invoices, shipping manifests, etc.).
-    6. **Completeness**: Extract all available information, including both obvious fields
-       and implied relationships.
-    
-    Special Handling:
-    - Dates: Normalize to ISO format (YYYY-MM-DD) when possible, but preserve original
-      text if format is ambiguous.
-    - Addresses: Structure when clear components exist, otherwise preserve as text.
-    - Numbers/IDs: Extract all reference numbers, codes, and identifiers you find.
-    - Tables/Lists: Structure tabular data appropriately based on column headers or patterns.
-    
-    Output Requirements:
-    - Return ONLY valid JSON
-    - Use proper nesting to reflect relationships in the data
-    - Include all extracted information
-    - Use null for missing/unknown values
-    - Maintain original text values when structure is unclear
-    
-    Logistics Text to Analyze:
-    {raw_text}
+
+    def compute():
+        try:
+            result = get_structured_text_chain().invoke({"raw_text": raw_text})
+        except (ValueError, OutputParserException) as e:
+            print(f"ERROR: Failed to parse structured text extraction: {e}")
+            return {"error": "Failed to parse structured data from input"}
+        if result is None:
+            print("ERROR: Model returned no structured text extraction")
+            return {"error": "Failed to parse structured data from input"}
+        return result.data
+
+    key = make_key("extract_structured_text_tool", TEXT_TOOL_VERSION, text_digest(raw_text))
+    return get_tool_cache().get_or_compute(key, compute, should_cache=lambda result: "error" not in result)
+
+# Single-call text extraction: the email summary and the structured data come back
+# from one function call, instead of agent turn -> tool chain -> agent re-emitting JSON.
+DIRECT_TEXT_VERSION = 1
+
+
+def extract_text_direct(email_text, extractor):
     """
-    
-    final_prompt = PromptTemplate(
-        input_variables=["raw_text"], 
-        template=prompt_template
-    )
-    
-    chain = final_prompt | model | StrOutputParser()
-    
-    try:
-        response = chain.invoke({"raw_text": raw_text})
-        # print(response)
-        return json.loads(response)
-    except json.JSONDecodeError:
-        print("ERROR: Failed to parse model output as JSON")
-        return {"error": "Failed to parse structured data from input"}
\ No newline at end of file
+    Runs one structured-output call (extractor = model.with_structured_output(TextExtraction))
+    on the rendered email. Returns the text_extractor_agent output format, or an
+    'error' dict when the model output does not fit the schema. Results are cached
+    by email content.
+    """
+    def compute():
+        try:
+            result = extractor.invoke([
+                {"role": "system", "content": DIRECT_TEXT_INSTRUCTIONS},
+                {"role": "user", "content": email_text},
+            ])
+        except (ValueError, OutputParserException) as e:
+            print(f"ERROR: Failed to parse structured text extraction: {e}")
+            return {"error": "Failed to parse structured data from input"}
+        if result is None:
+            print("ERROR: Model returned no structured text extraction")
+            return {"error": "Failed to parse structured data from input"}
+        return {
+            "email_summary": result.email_summary,
+            "processing_intent": "text_data_extraction",
+            "extracted_data": remove_none_values(result.extracted_data),
+        }
+
+    key = make_key("text_extractor_direct", DIRECT_TEXT_VERSION, text_digest(email_text))
+    return get_tool_cache().get_or_compute(key, compute, should_cache=lambda result: "error" not in result)
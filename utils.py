@@ -1,20 +1,41 @@
 import os.path
 import base64
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email import message_from_bytes
+from html import unescape
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from attachment_index import get_attachment_store
+from attachment_stream import decode_base64_to_temp, iter_string_chunks, stream_data_field
+
 # Add PDF-to-image conversion
-from pdf2image import convert_from_path
+from rasterize import DEFAULT_DPI, DEFAULT_FORMAT, iter_rasterized_pages
 
 # If modifying these scopes, delete the file token.json.
 # 'gmail.modify' scope allows reading, sending, deleting, and modifying emails,
 # which includes downloading attachments.
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
 
+# Statuses that Gmail returns when a quota or backend limit is hit. 403 is only
+# retried when the error reason says it is a rate limit (see _is_retryable).
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+# batchModify accepts at most 1000 message ids per call.
+BATCH_MODIFY_LIMIT = 1000
+
+# Polls a message that failed to ingest is retried on before it is given up.
+SYNC_RETRY_POLLS = 10
+
 def authenticate_gmail():
     """
     Authenticates with the Gmail API using OAuth 2.0.
@@ -42,51 +63,177 @@ def authenticate_gmail():
         return None
 
 
-def get_email_details(service, message_id):
+def _is_retryable(error):
+    status = getattr(error.resp, 'status', None)
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        content = error.content.decode('utf-8', 'ignore') if isinstance(error.content, bytes) else str(error.content)
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+def execute_with_backoff(request, max_retries=5, base_delay=1.0, max_delay=32.0):
+    """
+    Executes a Gmail API request, retrying rate-limit and transient server errors
+    with exponential backoff and jitter. Re-raises the HttpError once retries run out.
+    """
+    attempt = 0
+    while True:
+        try:
+            return request.execute()
+        except HttpError as error:
+            if attempt >= max_retries or not _is_retryable(error):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+def get_email_details(service, message_id, max_retries=5):
     """
     Fetches full details of an email message.
     """
     try:
-        message = service.users().messages().get(
-            userId='me', id=message_id, format='full'
-        ).execute()
+        message = execute_with_backoff(
+            service.users().messages().get(userId='me', id=message_id, format='full'),
+            max_retries=max_retries,
+        )
         return message
     except HttpError as error:
         print(f"Error fetching message {message_id}: {error}")
         return None
 
 
-def download_attachment(service, message_id, part_id, filename, save_path='.'):
+def authorized_session(service):
+    """
+    Returns a requests session authorized with the service's credentials, for
+    streaming attachment downloads, or None if the service has no credentials
+    (for example a fake).
+    """
+    credentials = getattr(getattr(service, '_http', None), 'credentials', None)
+    if credentials is None:
+        return None
+    return AuthorizedSession(credentials)
+
+
+def service_builder(service):
+    """
+    A factory building new Gmail services on the given service's credentials,
+    one per worker thread, since googleapiclient services (over httplib2) are
+    not thread-safe. None when the service has no credentials (for example a
+    fake), which is then shared.
+    """
+    credentials = getattr(getattr(service, '_http', None), 'credentials', None)
+    if credentials is None:
+        return None
+    return lambda: build("gmail", "v1", credentials=credentials, cache_discovery=False)
+
+
+def worker_clients(service, service_factory=None, session=None):
+    """
+    Returns (worker_service, worker_session) getters for a pool of worker threads.
+    Each thread gets its own service from service_factory, by default built on
+    the given service's credentials (see service_builder), and its own streaming
+    session from authorized_session, both created once on first use; a given
+    session is shared instead.
+    """
+    local = threading.local()
+    service_factory = service_factory or service_builder(service)
+
+    def worker_service():
+        if service_factory is None:
+            return service
+        if not hasattr(local, 'service'):
+            local.service = service_factory()
+        return local.service
+
+    def worker_session():
+        if session is not None:
+            return session
+        if not hasattr(local, 'session'):
+            local.session = authorized_session(worker_service())
+        return local.session
+
+    return worker_service, worker_session
+
+
+def _attachment_chunks(request, session, max_retries):
+    """
+    Yields the attachment's base64 text in bounded chunks. With a session the
+    response is streamed and never held in memory; otherwise (or when the
+    streamed request is not a 200) the regular client is used with retries and
+    only the decoded output is chunked.
+    """
+    if session is not None:
+        chunks = stream_data_field(session, request.uri)
+        if chunks is not None:
+            return chunks
+    attachment = execute_with_backoff(request, max_retries=max_retries)
+    return iter_string_chunks(attachment.pop('data'))
+
+
+def _attachment_outputs(full_save_path, filename, pdf_dpi, pdf_format):
+    """
+    The files an attachment on disk contributes to attachment_paths: the rendered
+    pages for a PDF, the file itself otherwise.
+    """
+    saved_files = []
+    # If it's a PDF, convert to PNG(s) without listing the PDF in saved_files.
+    # Pages are rendered straight to disk in parallel page ranges.
+    if filename.lower().endswith('.pdf'):
+        try:
+            pages = sorted(iter_rasterized_pages(full_save_path, dpi=pdf_dpi, fmt=pdf_format))
+            for i, page_path in pages:
+                saved_files.append(page_path)
+                print(f"Converted page {i} to '{page_path}'")
+        except Exception as e:
+            print(f"Error converting PDF '{filename}' to images: {e}")
+    else:
+        # For non-PDF attachments, include the original file path
+        saved_files.append(full_save_path)
+    return saved_files
+
+
+def _store_attachment(chunks, filename, save_path, pdf_dpi, pdf_format):
+    """
+    Decodes an attachment into the content-addressed store in save_path (see
+    attachment_index.py). Returns (saved_files, duplicate).
+    """
+    store = get_attachment_store(save_path)
+    tmp_path, digest, _ = decode_base64_to_temp(chunks, store.root)
+    return store.add(
+        tmp_path, digest, filename,
+        lambda full_save_path: _attachment_outputs(full_save_path, filename, pdf_dpi, pdf_format),
+    )
+
+
+def download_attachment(service, message_id, part_id, filename, save_path='.', max_retries=5,
+                        pdf_dpi=DEFAULT_DPI, pdf_format=DEFAULT_FORMAT, session=None):
     """
     Downloads a specific attachment and handles PDF conversion to PNG.
     Returns a list of saved file paths (only generated PNGs for PDFs, original for others).
+    pdf_dpi and pdf_format control the rendering of PDF pages (see rasterize.py).
+
+    The payload is decoded in chunks into the file, so memory stays bounded by the
+    chunk size when session (see authorized_session) is given; the ingestion
+    entry points pass one per worker thread. Files are stored
+    by content under save_path, so same-named attachments never overwrite each
+    other, and an attachment already stored returns the paths of the stored copy
+    without being written or converted again.
     """
     saved_files = []
     try:
-        attachment = service.users().messages().attachments().get(
+        request = service.users().messages().attachments().get(
             userId='me', messageId=message_id, id=part_id
-        ).execute()
-        file_data = base64.urlsafe_b64decode(attachment['data'])
-        full_save_path = os.path.join(save_path, filename)
-        with open(full_save_path, 'wb') as f:
-            f.write(file_data)
-        print(f"Downloaded attachment: '{filename}' to '{full_save_path}'")
-
-        # If it's a PDF, convert to PNG(s) without listing the PDF in saved_files
-        if filename.lower().endswith('.pdf'):
-            try:
-                images = convert_from_path(full_save_path)
-                base, _ = os.path.splitext(full_save_path)
-                for i, image in enumerate(images, start=1):
-                    png_name = f"{base}_page{i}.png"
-                    image.save(png_name, 'PNG')
-                    saved_files.append(png_name)
-                    print(f"Converted page {i} to '{png_name}'")
-            except Exception as e:
-                print(f"Error converting PDF '{filename}' to images: {e}")
+        )
+        saved_files, duplicate = _store_attachment(
+            _attachment_chunks(request, session, max_retries), filename, save_path, pdf_dpi, pdf_format
+        )
+        if duplicate:
+            print(f"Attachment '{filename}' already stored, reusing {saved_files}")
         else:
-            # For non-PDF attachments, include the original file path
-            saved_files.append(full_save_path)
+            print(f"Downloaded attachment: '{filename}' to {saved_files}")
 
     except HttpError as error:
         print(f"Error downloading '{filename}': {error}")
@@ -96,20 +243,101 @@ def download_attachment(service, message_id, part_id, filename, save_path='.'):
     return saved_files
 
 
-def parse_email_content(service, message, save_path='.'):
+_CHARSET = re.compile(r'charset="?([\w.:-]+)', re.I)
+_HTML_DROP = re.compile(r'(?is)<(script|style|head)\b.*?</\1\s*>')
+_HTML_BREAK = re.compile(r'(?i)<br\s*/?>|</(p|div|tr|li|h[1-6])\s*>')
+_HTML_TAG = re.compile(r'<[^>]+>')
+
+
+def iter_message_parts(payload):
+    """
+    Yields every leaf MIME part of a Gmail message payload in document order:
+    through nested multipart/* containers and forwarded message/rfc822 parts,
+    at any depth, with an explicit stack instead of recursion.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def _part_charset(part):
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-type':
+            match = _CHARSET.search(header['value'])
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+
+def _decode_text_part(part):
+    data = base64.urlsafe_b64decode(part['body']['data'])
+    try:
+        return data.decode(_part_charset(part), errors='replace')
+    except LookupError:
+        return data.decode('utf-8', errors='replace')
+
+
+def html_to_text(html):
+    """Plain-text rendering of an HTML body, good enough for classification and extraction."""
+    text = _HTML_DROP.sub('', html)
+    text = _HTML_BREAK.sub('\n', text)
+    text = unescape(_HTML_TAG.sub('', text))
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def _save_inline_attachment(data, filename, save_path, pdf_dpi=DEFAULT_DPI, pdf_format=DEFAULT_FORMAT):
+    """Stores an attachment whose bytes came inline in the message. Returns the saved paths."""
+    try:
+        saved_files, _ = _store_attachment(iter([data]), filename, save_path, pdf_dpi, pdf_format)
+    except Exception as e:
+        print(f"Error saving inline attachment '{filename}': {e}")
+        return []
+    return saved_files
+
+
+def _add_attachment_paths(email_data, paths):
+    """Appends paths to attachment_paths, skipping files the email already lists (duplicate attachments)."""
+    known = set(email_data['attachment_paths'])
+    for path in paths:
+        if path not in known:
+            known.add(path)
+            email_data['attachment_paths'].append(path)
+
+
+def parse_email_content(service, message, save_path='.', fetch_attachments=True, session=None):
     """
     Parses a Gmail message object to extract metadata and download attachments,
     including converting PDFs to PNGs when detected.
-    Returns a dict with subject, sender, date, body, has_attachments, and attachment_paths.
+    Returns a dict with subject, sender, date, body, html_body, has_attachments,
+    and attachment_paths.
+
+    All parts are visited in one pass (see iter_message_parts), so attachments in
+    nested multiparts and forwarded messages are found, and each text part is
+    decoded once. body joins every text/plain part; when there is none, it is the
+    text of the HTML parts.
+
+    With fetch_attachments=False nothing is downloaded; the attachments are listed
+    under 'pending_attachments' as (attachment_id, filename) pairs so a separate
+    stage can fetch them. Attachments sent inline in the message are saved either way.
+    session is passed to download_attachment for streaming downloads.
     """
     email_data = {
         'subject': 'N/A',
         'sender': 'N/A',
         'date': 'N/A',
         'body': '',
+        'html_body': '',
         'has_attachments': False,
         'attachment_paths': []
     }
+    if not fetch_attachments:
+        email_data['pending_attachments'] = []
     message_id = message['id']
     headers = message['payload']['headers']
     for header in headers:
@@ -120,54 +348,67 @@ def parse_email_content(service, message, save_path='.'):
         elif header['name'] == 'Date':
             email_data['date'] = header['value']
 
-    parts = message['payload'].get('parts', [])
-    if not parts:
-        body = message['payload'].get('body', {}).get('data')
-        if body:
-            try:
-                email_data['body'] = base64.urlsafe_b64decode(body).decode('utf-8')
-            except Exception as e:
-                print(f"Error decoding body for {message_id}: {e}")
-    else:
-        for part in parts:
-            mime_type = part.get('mimeType')
-            filename = part.get('filename', '')
-            body = part.get('body', {})
-
-            if mime_type == 'text/plain' and 'data' in body:
-                try:
-                    email_data['body'] = base64.urlsafe_b64decode(body['data']).decode('utf-8')
-                except Exception as e:
-                    print(f"Error decoding text part for {message_id}: {e}")
-
-            if filename and body.get('attachmentId'):
-                email_data['has_attachments'] = True
+    texts = []
+    htmls = []
+    for part in iter_message_parts(message['payload']):
+        mime_type = part.get('mimeType', '')
+        filename = part.get('filename', '')
+        body = part.get('body', {})
+
+        if filename and (body.get('attachmentId') or 'data' in body):
+            email_data['has_attachments'] = True
+            if not body.get('attachmentId'):
+                _add_attachment_paths(email_data, _save_inline_attachment(body['data'], filename, save_path))
+            elif fetch_attachments:
                 saved = download_attachment(
-                    service, message_id, body['attachmentId'], filename, save_path
+                    service, message_id, body['attachmentId'], filename, save_path, session=session
                 )
-                email_data['attachment_paths'].extend(saved)
-
-            elif mime_type == 'multipart/alternative':
-                for sub in part.get('parts', []):
-                    sub_mime = sub.get('mimeType')
-                    sub_body = sub.get('body', {})
-                    sub_fn = sub.get('filename', '')
-                    if sub_mime == 'text/plain' and 'data' in sub_body:
-                        try:
-                            email_data['body'] = base64.urlsafe_b64decode(
-                                sub_body['data']).decode('utf-8')
-                        except Exception as e:
-                            print(f"Error decoding sub-part for {message_id}: {e}")
-                    if sub_fn and sub_body.get('attachmentId'):
-                        email_data['has_attachments'] = True
-                        saved = download_attachment(
-                            service, message_id, sub_body['attachmentId'], sub_fn, save_path
-                        )
-                        email_data['attachment_paths'].extend(saved)
+                _add_attachment_paths(email_data, saved)
+            else:
+                email_data['pending_attachments'].append((body['attachmentId'], filename))
 
+        elif mime_type in ('text/plain', 'text/html') and 'data' in body:
+            try:
+                text = _decode_text_part(part)
+            except Exception as e:
+                print(f"Error decoding {mime_type} part for {message_id}: {e}")
+                continue
+            (texts if mime_type == 'text/plain' else htmls).append(text)
+
+    email_data['html_body'] = '\n'.join(htmls)
+    if texts:
+        email_data['body'] = '\n\n'.join(text.strip('\r\n') for text in texts)
+    elif htmls:
+        email_data['body'] = html_to_text(email_data['html_body'])
     return email_data
 
 
+def iter_message_ids(service, query, max_retries=5):
+    """
+    Yields the id of every message matching query, one listing page at a time,
+    so consumers can start on the first page before the listing is exhausted.
+    """
+    page_token = None
+    while True:
+        results = execute_with_backoff(
+            service.users().messages().list(userId='me', q=query, pageToken=page_token),
+            max_retries=max_retries,
+        )
+        for msg in results.get('messages', []):
+            yield msg['id']
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def list_message_ids(service, query, max_retries=5):
+    """
+    Returns the ids of every message matching query, following nextPageToken
+    until the listing is exhausted.
+    """
+    return list(iter_message_ids(service, query, max_retries=max_retries))
+
+
 def check_emails_from_sender(service, sender_email, mark_as_read=False, save_path='.'):
     """
     Checks for emails from a sender, parses and downloads attachments,
@@ -176,26 +417,288 @@ def check_emails_from_sender(service, sender_email, mark_as_read=False, save_pat
     emails_data = []
     try:
         query = f'from:{sender_email} in:inbox'
-        results = service.users().messages().list(
-            userId='me', q=query
-        ).execute()
-        messages = results.get('messages', [])
-        if not messages:
+        message_ids = list_message_ids(service, query)
+        if not message_ids:
             print(f"No emails found from {sender_email}.")
             return []
-        for msg in messages:
-            detail = get_email_details(service, msg['id'])
+        session = authorized_session(service)
+        for message_id in message_ids:
+            detail = get_email_details(service, message_id)
             if detail:
                 data = parse_email_content(
-                    service, detail, save_path
+                    service, detail, save_path, session=session
                 )
-                data['message_id'] = msg['id']
+                data['message_id'] = message_id
                 emails_data.append(data)
                 if mark_as_read:
                     service.users().messages().modify(
-                        userId='me', id=msg['id'], body={'removeLabelIds': ['UNREAD']}
+                        userId='me', id=message_id, body={'removeLabelIds': ['UNREAD']}
                     ).execute()
         return emails_data
     except HttpError as error:
         print(f"Error checking emails: {error}")
-        return []
\ No newline at end of file
+        return []
+
+
+def _mark_messages_read(service, message_ids, max_retries=5):
+    """
+    Removes the UNREAD label from the given messages with batchModify,
+    chunked to the API's per-call id limit.
+    """
+    for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+        chunk = message_ids[start:start + BATCH_MODIFY_LIMIT]
+        execute_with_backoff(
+            service.users().messages().batchModify(
+                userId='me', body={'ids': chunk, 'removeLabelIds': ['UNREAD']}
+            ),
+            max_retries=max_retries,
+        )
+
+
+def ingest_messages_concurrent(service, message_ids, save_path='.', max_workers=8, max_retries=5,
+                               service_factory=None, accept=None, session=None):
+    """
+    Fetches and parses the given messages on a bounded thread pool. Message details
+    are fetched first, then every attachment of every accepted message is downloaded
+    on the same pool.
+
+    accept is an optional predicate on the parsed email dict; rejected messages are
+    dropped before any of their attachments are downloaded.
+    googleapiclient service objects are not thread-safe, so each worker thread
+    gets its own service: from service_factory when given (for example
+    authenticate_gmail), otherwise built on the given service's credentials.
+    Attachments are streamed through session, or by default through one
+    authorized_session per worker thread (see worker_clients).
+
+    A message fails when its details cannot be fetched or one of its attachments
+    cannot be downloaded; failed messages are left out of the parsed emails.
+    Returns (emails_data, failed_ids), both in the order of message_ids.
+    """
+    worker_service, worker_session = worker_clients(service, service_factory, session)
+    failed = set()
+
+    def fetch_message(message_id):
+        detail = get_email_details(worker_service(), message_id, max_retries=max_retries)
+        if not detail:
+            failed.add(message_id)
+            return None
+        data = parse_email_content(worker_service(), detail, save_path, fetch_attachments=False)
+        data['message_id'] = message_id
+        if accept is not None and not accept(data):
+            return None
+        return data
+
+    def fetch_attachment(job):
+        message_id, attachment_id, filename = job
+        return download_attachment(
+            worker_service(), message_id, attachment_id, filename, save_path,
+            max_retries=max_retries, session=worker_session(),
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        emails_data = [data for data in pool.map(fetch_message, message_ids) if data]
+        jobs = [
+            (data['message_id'], attachment_id, filename)
+            for data in emails_data
+            for attachment_id, filename in data['pending_attachments']
+        ]
+        saved_lists = iter(pool.map(fetch_attachment, jobs))
+
+    for data in emails_data:
+        for _ in data.pop('pending_attachments'):
+            saved = next(saved_lists)
+            if not saved:
+                failed.add(data['message_id'])
+            _add_attachment_paths(data, saved)
+    emails_data = [data for data in emails_data if data['message_id'] not in failed]
+    return emails_data, [message_id for message_id in message_ids if message_id in failed]
+
+
+def check_emails_from_sender_concurrent(service, sender_email, mark_as_read=False, save_path='.',
+                                        max_workers=8, max_retries=5, service_factory=None):
+    """
+    Concurrent variant of check_emails_from_sender. Messages are ingested with
+    ingest_messages_concurrent and marked read with batchModify at the end;
+    messages that failed to ingest stay unread.
+    Returns the same list of dicts as check_emails_from_sender, in listing order.
+    """
+    try:
+        query = f'from:{sender_email} in:inbox'
+        message_ids = list_message_ids(service, query, max_retries=max_retries)
+        if not message_ids:
+            print(f"No emails found from {sender_email}.")
+            return []
+
+        emails_data, failed_ids = ingest_messages_concurrent(
+            service, message_ids, save_path, max_workers=max_workers,
+            max_retries=max_retries, service_factory=service_factory,
+        )
+        if failed_ids:
+            print(f"Error ingesting {len(failed_ids)} message(s): {failed_ids}")
+        if mark_as_read and emails_data:
+            _mark_messages_read(
+                service, [data['message_id'] for data in emails_data], max_retries=max_retries
+            )
+        return emails_data
+    except HttpError as error:
+        print(f"Error checking emails: {error}")
+        return []
+
+
+def load_sync_state(state_path):
+    """
+    Reads the incremental sync state (last seen historyId) from a JSON file.
+    Returns an empty dict when no state has been saved yet.
+    """
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_sync_state(state_path, state):
+    """
+    Atomically writes the sync state so a crash mid-write cannot corrupt it.
+    """
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def fetch_new_message_ids(service, start_history_id, label_id='INBOX', max_retries=5):
+    """
+    Pages through users().history().list from start_history_id and returns
+    (message_ids, latest_history_id) for messages added under label_id.
+    Raises HttpError with status 404 when start_history_id has expired.
+    """
+    message_ids = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
+    while True:
+        results = execute_with_backoff(
+            service.users().history().list(
+                userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+                labelId=label_id, pageToken=page_token,
+            ),
+            max_retries=max_retries,
+        )
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message_id = added['message']['id']
+                if message_id not in seen:
+                    seen.add(message_id)
+                    message_ids.append(message_id)
+        latest_history_id = results.get('historyId', latest_history_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return message_ids, latest_history_id
+
+
+def sync_message_ids(service, query, state, max_retries=5):
+    """
+    Returns (message_ids, history_id, full_rescan) for one poll.
+
+    With a stored history_id only messages added since then are returned. On the
+    first poll, or when Gmail reports the history_id as expired (404), falls back
+    to a full paginated listing of query. The mailbox historyId is read before
+    listing so nothing that arrives during the rescan is missed on the next poll.
+    """
+    history_id = state.get('history_id')
+    if history_id:
+        try:
+            message_ids, history_id = fetch_new_message_ids(
+                service, history_id, max_retries=max_retries
+            )
+            return message_ids, history_id, False
+        except HttpError as error:
+            if getattr(error.resp, 'status', None) != 404:
+                raise
+            print(f"History id {history_id} expired, falling back to a full rescan.")
+
+    profile = execute_with_backoff(service.users().getProfile(userId='me'), max_retries=max_retries)
+    message_ids = list_message_ids(service, query, max_retries=max_retries)
+    return message_ids, profile['historyId'], True
+
+
+def _sent_by(email_data, sender_email):
+    return sender_email.lower() in email_data['sender'].lower()
+
+
+def _failed_retries(previous, failed_ids, max_polls=SYNC_RETRY_POLLS):
+    """
+    The sync state's {message_id: failed polls} after a poll in which failed_ids
+    failed to ingest. Messages that failed max_polls times are given up.
+    """
+    retries = {}
+    for message_id in failed_ids:
+        polls = previous.get(message_id, 0) + 1
+        if polls >= max_polls:
+            print(f"ERROR: Giving up on message {message_id} after {polls} failed polls")
+        else:
+            retries[message_id] = polls
+    return retries
+
+
+def poll_new_emails(service, sender_email, state, save_path='.', max_workers=8, max_retries=5,
+                    service_factory=None):
+    """
+    One incremental poll from the sync state (see load_sync_state), without
+    saving anything. Only messages added to the inbox since the stored historyId
+    are fetched. History records are not filtered by sender, so messages from
+    other senders are dropped after their headers are fetched and before any
+    attachment is downloaded.
+
+    Messages that fail to ingest (see ingest_messages_concurrent) are kept in
+    the state under 'failed_ids' and fetched again on the next polls, up to
+    SYNC_RETRY_POLLS times, so the historyId can advance past them without
+    losing them.
+
+    Returns (emails_data, new_state). Save new_state only once the emails are
+    safely handed off; until then the next poll fetches them again. Raises
+    HttpError when the poll fails.
+    """
+    query = f'from:{sender_email} in:inbox'
+    message_ids, history_id, _ = sync_message_ids(
+        service, query, state, max_retries=max_retries
+    )
+    retries = state.get('failed_ids', {})
+    listed = set(message_ids)
+    message_ids = [message_id for message_id in retries if message_id not in listed] + message_ids
+    emails_data, failed_ids = [], []
+    if message_ids:
+        emails_data, failed_ids = ingest_messages_concurrent(
+            service, message_ids, save_path, max_workers=max_workers,
+            max_retries=max_retries, service_factory=service_factory,
+            accept=lambda data: _sent_by(data, sender_email),
+        )
+    if failed_ids:
+        print(f"Error ingesting {len(failed_ids)} message(s), retrying on the next poll: {failed_ids}")
+    if not emails_data:
+        print(f"No new emails found from {sender_email}.")
+    return emails_data, dict(state, history_id=history_id, failed_ids=_failed_retries(retries, failed_ids))
+
+
+def check_new_emails_from_sender(service, sender_email, state_path='sync_state.json',
+                                 mark_as_read=False, save_path='.', max_workers=8,
+                                 max_retries=5, service_factory=None):
+    """
+    Incremental variant of check_emails_from_sender: one poll_new_emails with the
+    state stored in state_path. The state is saved only after ingestion succeeds,
+    so a failed poll is retried in full on the next call.
+    """
+    try:
+        emails_data, state = poll_new_emails(
+            service, sender_email, load_sync_state(state_path), save_path, max_workers=max_workers,
+            max_retries=max_retries, service_factory=service_factory,
+        )
+        if mark_as_read and emails_data:
+            _mark_messages_read(
+                service, [data['message_id'] for data in emails_data], max_retries=max_retries
+            )
+        save_sync_state(state_path, state)
+        return emails_data
+    except HttpError as error:
+        print(f"Error checking emails: {error}")
+        return []
@@ -0,0 +1,241 @@
+"""
+Producer/consumer deployment: one ingestion process, N worker processes.
+
+The ingestion process polls Gmail (utils.poll_new_emails) and enqueues every
+parsed email in the durable job queue (job_queue.py); the sync state is saved
+only once the enqueue has committed. Worker processes claim jobs, run
+definitions.process_email and store the final agent JSON as the job result.
+Error results count as failed attempts, so they are retried and then
+dead-lettered. A lease keeper thread extends the job's lease while the graph
+runs, so only a crashed or hung worker lets its job become visible again, and a
+worker that loses its lease drops its result.
+
+    python workers.py ingest ops@carrier.com --interval 60
+    python workers.py work --processes 4
+    python workers.py stats
+    python workers.py requeue-dead
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+from job_queue import DEFAULT_MAX_ATTEMPTS, DEFAULT_VISIBILITY_TIMEOUT, QUEUE_DB, JobQueue
+
+DEFAULT_PROCESS = "definitions:process_email"
+# Called with the message_id before a job whose answer was an error is retried,
+# so the retry does not just return the checkpointed error.
+DEFAULT_RESET = "definitions:discard_checkpoint"
+# Called between jobs and polls; throttles itself (see definitions.maintain_checkpoints).
+DEFAULT_MAINTAIN = "definitions:maintain_checkpoints"
+
+
+def enqueue_emails(queue, emails):
+    """
+    Enqueues parsed emails in one transaction. Returns the number that were new
+    (see JobQueue.enqueue_many).
+    """
+    return queue.enqueue_many(email for email in emails if email.get('message_id'))
+
+
+def ingest(queue_path, sender_email, state_path='sync_state.json', save_path='.', interval=None,
+           mark_as_read=False, service_factory=None, maintain=DEFAULT_MAINTAIN):
+    """
+    Polls the inbox for new mail from sender_email and enqueues it, once or every
+    interval seconds. The sync state is saved, and messages are marked read, only
+    after the enqueue transaction has committed, so a crash in between makes the
+    next poll fetch the same messages again (enqueueing them twice is a no-op).
+    maintain ('module:function', None to skip) runs after every poll.
+    """
+    from googleapiclient.errors import HttpError
+
+    from utils import _mark_messages_read, authenticate_gmail, load_sync_state, poll_new_emails, save_sync_state
+
+    service_factory = service_factory or authenticate_gmail
+    maintain = load_process(maintain) if maintain else None
+    service = service_factory()
+    queue = JobQueue(queue_path)
+    while True:
+        added = 0
+        try:
+            emails, state = poll_new_emails(
+                service, sender_email, load_sync_state(state_path), save_path, service_factory=service_factory,
+            )
+            added = enqueue_emails(queue, emails)
+            save_sync_state(state_path, state)
+            if mark_as_read and emails:
+                _mark_messages_read(service, [email['message_id'] for email in emails])
+            print(f"Enqueued {added} new emails ({len(emails) - added} already queued). Queue: {queue.stats()}")
+        except HttpError as error:
+            print(f"Error checking emails: {error}")
+        if maintain is not None:
+            maintain()
+        if interval is None:
+            return added
+        time.sleep(interval)
+
+
+def load_process(spec):
+    """'module:function' -> the function. Worker processes import it by name."""
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class _LeaseKeeper:
+    """Extends a job's lease every third of the visibility timeout until stopped."""
+
+    def __init__(self, queue_path, job, worker_id, visibility_timeout):
+        self._stop = threading.Event()
+        self.lost = False
+        self._thread = threading.Thread(
+            target=self._run, args=(queue_path, job.message_id, worker_id, visibility_timeout), daemon=True
+        )
+
+    def _run(self, queue_path, message_id, worker_id, visibility_timeout):
+        # JobQueue connections are per thread
+        queue = JobQueue(queue_path)
+        try:
+            while not self._stop.wait(visibility_timeout / 3):
+                if not queue.extend_lease(message_id, worker_id, visibility_timeout):
+                    print(f"WARNING: Lost the lease on {message_id}; another worker may process it.")
+                    self.lost = True
+                    return
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue_path=QUEUE_DB, worker_id=None, process=DEFAULT_PROCESS,
+               visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS,
+               poll_interval=1.0, max_jobs=None, exit_when_empty=False, reset=DEFAULT_RESET,
+               maintain=DEFAULT_MAINTAIN):
+    """
+    Claims and processes jobs until stopped, after max_jobs jobs, or (with
+    exit_when_empty) once nothing is claimable. process is a 'module:function'
+    taking the parsed email and returning its message list. A final answer
+    carrying an error (an ErrorResult, or an agent's error dict) fails the
+    attempt like an exception does, and reset ('module:function', None to skip)
+    discards the email's checkpointed run so the retry runs it again. Runs
+    that raised keep their checkpoint and resume from it. maintain
+    ('module:function', None to skip) runs after every job and idle poll.
+    Returns the number of jobs completed.
+    """
+    from pipeline import final_output
+
+    worker_id = worker_id or f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    handler = load_process(process)
+    reset = load_process(reset) if reset else None
+    maintain = load_process(maintain) if maintain else None
+    queue = JobQueue(queue_path, max_attempts=max_attempts)
+    completed = 0
+    try:
+        while max_jobs is None or completed < max_jobs:
+            if maintain is not None:
+                maintain()
+            job = queue.claim(worker_id, visibility_timeout)
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+            try:
+                with _LeaseKeeper(queue_path, job, worker_id, visibility_timeout) as lease:
+                    result = final_output(handler(job.email))
+                if result.get("error") is not None:
+                    if reset is not None:
+                        reset(job.message_id)
+                    raise RuntimeError(result["error"])
+            except Exception as e:
+                status = queue.fail(job.message_id, worker_id, e)
+                print(f"ERROR: {job.message_id} failed on attempt {job.attempts} ({status}): {e}")
+                continue
+            if lease.lost:
+                print(f"WARNING: Lost the lease on {job.message_id} while processing it; result not recorded.")
+            elif queue.complete(job.message_id, worker_id, result):
+                completed += 1
+            else:
+                print(f"WARNING: Finished {job.message_id} after its lease expired; result not recorded.")
+    finally:
+        queue.close()
+    return completed
+
+
+def run_workers(processes=os.cpu_count(), **kwargs):
+    """
+    Starts processes run_worker processes (spawned, so each builds its own graph
+    and connections) and waits for them. Ctrl-C terminates them; their leased
+    jobs become claimable again once the visibility timeout passes.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, kwargs=kwargs, daemon=True) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable multi-process email processing.")
+    parser.add_argument("--queue", default=QUEUE_DB, help="job queue database (QUEUE_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="poll Gmail and enqueue new emails")
+    ingest_parser.add_argument("sender_email")
+    ingest_parser.add_argument("--interval", type=float, default=None, help="poll every N seconds (default: once)")
+    ingest_parser.add_argument("--state-path", default="sync_state.json")
+    ingest_parser.add_argument("--save-path", default=".")
+    ingest_parser.add_argument("--mark-as-read", action="store_true")
+    ingest_parser.add_argument("--maintain", default=DEFAULT_MAINTAIN,
+                               help="module:function run after every poll ('' to skip)")
+
+    work_parser = commands.add_parser("work", help="process queued emails in worker processes")
+    work_parser.add_argument("--processes", type=int, default=os.cpu_count())
+    work_parser.add_argument("--process", default=DEFAULT_PROCESS, help="module:function run on each email")
+    work_parser.add_argument("--reset", default=DEFAULT_RESET,
+                             help="module:function discarding an email's saved run before a retry ('' to skip)")
+    work_parser.add_argument("--maintain", default=DEFAULT_MAINTAIN,
+                             help="module:function run between jobs ('' to skip)")
+    work_parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    work_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work_parser.add_argument("--exit-when-empty", action="store_true")
+
+    commands.add_parser("stats", help="job counts by status and the dead letters")
+    commands.add_parser("requeue-dead", help="give dead-lettered jobs a fresh set of attempts")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest(args.queue, args.sender_email, state_path=args.state_path, save_path=args.save_path,
+               interval=args.interval, mark_as_read=args.mark_as_read, maintain=args.maintain)
+    elif args.command == "work":
+        run_workers(
+            args.processes, queue_path=args.queue, process=args.process, reset=args.reset, maintain=args.maintain,
+            visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts,
+            exit_when_empty=args.exit_when_empty,
+        )
+    elif args.command == "stats":
+        queue = JobQueue(args.queue)
+        print(queue.stats())
+        for message_id, attempts, error in queue.dead_letters():
+            print(f"  dead: {message_id} after {attempts} attempts: {error}")
+    else:
+        print(f"Requeued {JobQueue(args.queue).requeue_dead()} dead-lettered jobs.")
+
+
+if __name__ == "__main__":
+    main()